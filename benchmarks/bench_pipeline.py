@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end throughput benchmark for the two-phase pipeline (AgentOrchestrator.run).
+
+Drives a fixed subset of data/f2c_code_pair_test_dataset.jsonl through the real pipeline
+(real gfortran/g++ compiles) against the replay stub LLM, for every combination of
+concurrency x compile profile x build cache (off, or on and cold at the start of the config),
+and writes a JSON report:
+  samples/hour, turns/sample, success rate, LLM/compile/run time split,
+  p50/p95 per stage, CPU utilization and peak RSS (self and children).
+
+Every config gets an inline executor and a fresh repair policy, with retrieval, memo store,
+artifact logging and perf profiling off; their opt-in environment variables are cleared and the build-cache variable
+is set for the duration of the config only, so results do not depend on the caller's environment
+or on config order. Samples that fail on a prompt template (PromptFieldError / KeyError from
+format) are reported under 'prompt_errors', apart from other crashes under 'errors'.
+
+Example:
+  python benchmarks/bench_pipeline.py --limit 8 --concurrency 1 4 --profiles default O2 \\
+      --latency 0.5 --completion-tps 60 --build-cache off on --out bench_report.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+
+from agent import AgentOrchestrator, COMPILE_PROFILES  # noqa: E402
+from artifacts import ARTIFACT_DIR_ENV  # noqa: E402
+from executor import InlineExecutor  # noqa: E402
+from memo_store import MEMO_ENV  # noqa: E402
+from perf_profile import PERF_PROFILE_ENV  # noqa: E402
+from prompt_registry import PromptFieldError  # noqa: E402
+from repair_policy import RepairPolicy  # noqa: E402
+from retrieval import RETRIEVAL_ENV  # noqa: E402
+from toolchain import BUILD_CACHE_ENV, default_build_cache  # noqa: E402
+from stub_llm import FakeOpenAI, ReplayIndex  # noqa: E402
+from telemetry import Telemetry  # noqa: E402
+
+DEFAULT_DATASET = os.path.join(REPO_ROOT, "data", "f2c_code_pair_test_dataset.jsonl")
+DEFAULT_DIALOGUES = [os.path.join(REPO_ROOT, "data", "f2c_dialogue_test.json")]
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in [0, 100]); 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(q / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def stage_stats(values):
+    return {
+        "count": len(values),
+        "total": round(sum(values), 6),
+        "p50": round(percentile(values, 50), 6),
+        "p95": round(percentile(values, 95), 6),
+        "max": round(max(values), 6) if values else 0.0,
+    }
+
+
+def load_subset(dataset_path, limit, offset=0):
+    samples = []
+    with open(dataset_path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if i < offset or not line.strip():
+                continue
+            if len(samples) >= limit:
+                break
+            samples.append(json.loads(line))
+    return samples
+
+
+def _rusage():
+    return resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+
+
+@contextmanager
+def scoped_env(**values):
+    """Set (str) or unset (None) environment variables for the block, then restore them."""
+    saved = {name: os.environ.get(name) for name in values}
+    try:
+        for name, value in values.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ""
+
+
+def run_config(samples, base_client, concurrency, profile, max_completion_tokens, turns_limitation, build_cache="off"):
+    """Run every sample once with the given settings; returns the report entry for this config."""
+    telemetry = Telemetry(run_id=f"c{concurrency}-{profile}-cache_{build_cache}")
+    sandbox = tempfile.mkdtemp(prefix="f2c_bench_")
+    executor = InlineExecutor()
+    repair_policy = RepairPolicy()  # in-memory, learns within this config only
+    sample_wall = {}
+    errors = {}
+    prompt_errors = {}
+
+    def one(i_sample):
+        i, sample = i_sample
+        orchestrator = AgentOrchestrator(
+            max_completion_tokens=max_completion_tokens,
+            turns_limitation=turns_limitation,
+            idx=i,
+            telemetry=telemetry,
+            client=base_client.session_client(seed=i),
+            sandbox_root=os.path.join(sandbox, "sandbox"),
+            output_dir=os.path.join(sandbox, "out"),
+            compile_profile=profile,
+            repair_policy=repair_policy,
+            executor=executor,
+            perf_profiler=None,
+            retrieval=None,
+            memo_store=None,
+        )
+        start = time.perf_counter()
+        try:
+            _, ok = orchestrator.run(sample["fortran_code"])
+        except (PromptFieldError, KeyError) as e:
+            # A prompt template formatted with the wrong fields: a known bug class, not a pipeline failure
+            logging.error("[bench] sample %s: prompt formatting failed: %s", sample.get("id", i), e)
+            prompt_errors[sample.get("id", i)] = f"{type(e).__name__}: {e}"
+            ok = False
+        except Exception as e:
+            # A crashing sample is reported, not fatal: the benchmark measures the pipeline as it is
+            logging.error("[bench] sample %s raised %s: %s", sample.get("id", i), type(e).__name__, e)
+            errors[sample.get("id", i)] = type(e).__name__
+            ok = False
+        sample_wall[i] = time.perf_counter() - start
+        return ok
+
+    # Every config starts from an empty cache so the numbers do not depend on config order
+    env = {BUILD_CACHE_ENV: os.path.join(sandbox, "build_cache") if build_cache == "on" else "off",
+           MEMO_ENV: None, RETRIEVAL_ENV: None, PERF_PROFILE_ENV: None, ARTIFACT_DIR_ENV: None}
+    with scoped_env(**env):
+        self_before, children_before = _rusage()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, enumerate(samples)))
+        wall = time.perf_counter() - start
+        self_after, children_after = _rusage()
+        cache = default_build_cache()
+
+    cpu_seconds = ((self_after.ru_utime - self_before.ru_utime) + (self_after.ru_stime - self_before.ru_stime) +
+                   (children_after.ru_utime - children_before.ru_utime) +
+                   (children_after.ru_stime - children_before.ru_stime))
+    by_kind = {"llm": [], "compile": [], "run": []}
+    for e in telemetry.events:
+        by_kind.setdefault(e["kind"], []).append(e["wall_time"])
+    summary = telemetry.run_summary()
+    turns = [sum(s["turns"].values()) for s in summary["per_sample"]]
+    busy = sum(sum(v) for v in by_kind.values()) or 1.0
+
+    return {
+        "concurrency": concurrency,
+        "compile_profile": profile,
+        "build_cache": build_cache,
+        "build_cache_stats": dict(cache.stats) if cache is not None else {},
+        "samples": len(samples),
+        "succeeded": sum(bool(r) for r in results),
+        "errors": errors,
+        "prompt_errors": prompt_errors,
+        "wall_seconds": round(wall, 3),
+        "samples_per_hour": round(len(samples) / wall * 3600.0, 2) if wall else 0.0,
+        "turns_per_sample": round(sum(turns) / len(turns), 3) if turns else 0.0,
+        "llm_calls_per_sample": round(summary["llm_calls"] / max(len(samples), 1), 3),
+        "prompt_tokens": summary["prompt_tokens"],
+        "completion_tokens": summary["completion_tokens"],
+        "time_split": {k: round(sum(v) / busy, 4) for k, v in by_kind.items()},
+        "stages": {**{k: stage_stats(v) for k, v in by_kind.items()},
+                   "sample": stage_stats(list(sample_wall.values()))},
+        "cpu_seconds": round(cpu_seconds, 3),
+        "cpu_utilization": round(cpu_seconds / (wall * (os.cpu_count() or 1)), 4) if wall else 0.0,
+        "peak_rss_kb": {"self": self_after.ru_maxrss, "children": children_after.ru_maxrss},
+        "replay_stats": dict(base_client.index.stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline throughput benchmark (offline).")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    parser.add_argument("--dialogues", nargs="*", default=DEFAULT_DIALOGUES,
+                        help="recorded dialogues for the replay stub")
+    parser.add_argument("--limit", type=int, default=8, help="number of samples in the fixed subset")
+    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--profiles", nargs="+", default=["default"], choices=sorted(COMPILE_PROFILES))
+    parser.add_argument("--build-cache", nargs="+", default=["off"], choices=["off", "on"],
+                        help="compile binary/PCH cache (toolchain.BuildCache), cold per config")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub: fixed seconds per LLM call")
+    parser.add_argument("--prompt-tps", type=float, default=None, help="stub: prompt tokens/second")
+    parser.add_argument("--completion-tps", type=float, default=None, help="stub: completion tokens/second")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--turns", type=int, default=3, help="turns_limitation per phase")
+    parser.add_argument("--max-completion-tokens", type=int, default=4096)
+    parser.add_argument("--out", default="bench_report.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    samples = load_subset(args.dataset, args.limit, args.offset)
+    index = ReplayIndex.from_files(dialogues=args.dialogues, code_pairs=[args.dataset])
+    base_client = FakeOpenAI(index, latency=args.latency, prompt_tps=args.prompt_tps,
+                             completion_tps=args.completion_tps, seed=args.seed)
+
+    configs = []
+    for build_cache in args.build_cache:
+        for profile in args.profiles:
+            for concurrency in args.concurrency:
+                index.stats.clear()
+                entry = run_config(samples, base_client, concurrency, profile, args.max_completion_tokens, args.turns,
+                                   build_cache)
+                configs.append(entry)
+                print(f"concurrency={concurrency} profile={profile} build_cache={build_cache}: "
+                      f"{entry['samples_per_hour']} samples/h, {entry['succeeded']}/{entry['samples']} ok, "
+                      f"{len(entry['errors'])} errors, {len(entry['prompt_errors'])} prompt errors, "
+                      f"split={entry['time_split']}, cache={entry['build_cache_stats']}")
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "sample_ids": [s.get("id") for s in samples],
+        "configs": configs,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks for the per-turn text-processing hot paths, over real messages mined from
+data/f2c_dialogue_train.json:
+  - parse_repair_tags        (assistant replies)
+  - extract_codes_from_text  (assistant replies)
+  - update_code_from_history (assistant replies; includes the escape handling)
+  - programmatic_output_compare (program outputs quoted in repair prompts)
+
+Each benchmark reports microseconds per call (best of --repeat rounds) and fails (exit 1) when it
+exceeds its threshold in THRESHOLDS_US, or when --baseline is given and it is slower than the
+saved run by more than --tolerance. The legacy regex + unicode_escape extraction is timed
+alongside for reference.
+
+Example:
+  python benchmarks/bench_text.py --save bench_text_baseline.json
+  python benchmarks/bench_text.py --baseline bench_text_baseline.json --tolerance 1.25
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+
+from output_compare import programmatic_output_compare  # noqa: E402
+from text_utils import extract_codes_from_text, parse_repair_tags, unescape_reply  # noqa: E402
+
+DEFAULT_DIALOGUES = os.path.join(REPO_ROOT, "data", "f2c_dialogue_train.json")
+
+# Absolute budgets in microseconds per call; generous so only real regressions trip them
+THRESHOLDS_US = {
+    "parse_repair_tags": 20.0,
+    "extract_codes_from_text": 60.0,
+    "update_code_from_history": 80.0,
+    "programmatic_output_compare": 400.0,
+}
+
+_LEGACY_FENCE = re.compile(r"```(\w+)?\s*(.*?)```", re.DOTALL)
+_STDOUT_RE = re.compile(r"(?:Fortran|C\+\+) Stdout:\s*(.*?)(?:\n(?:Fortran|C\+\+) Stderr:|\Z)", re.DOTALL)
+
+
+def legacy_update(text):
+    """The previous implementation: unicode_escape round trip + regex scan."""
+    text = text.encode().decode("unicode_escape")
+    fortran_code, cpp_code = None, None
+    for lang, body in _LEGACY_FENCE.findall(text):
+        lang_l = (lang or "").lower()
+        if lang_l in ("fortran", "f90", "f95", "f03", "f08"):
+            fortran_code = body.strip()
+        elif lang_l in ("cpp", "c++", "cc", "cxx"):
+            cpp_code = body.strip()
+    return fortran_code, cpp_code
+
+
+def update_code(text):
+    """Same work as agent.update_code_from_history for one reply."""
+    return extract_codes_from_text(unescape_reply(text))
+
+
+def mine_corpus(path):
+    with open(path, "r", encoding="utf-8") as f:
+        dialogues = json.load(f)
+    replies, outputs = [], []
+    for d in dialogues:
+        for m in d["messages"]:
+            if m["role"] == "assistant":
+                replies.append(m["content"])
+            elif m["role"] == "user":
+                outputs.extend(o for o in _STDOUT_RE.findall(m["content"]) if o.strip())
+    # Output pairs: original vs. re-spaced copy, exercising the whitespace/numeric paths
+    output_pairs = [(o, "  ".join(o.split())) for o in outputs]
+    return replies, output_pairs
+
+
+def bench(fn, items, repeat):
+    """Best-of-`repeat` microseconds per call over all items."""
+    if not items:
+        return 0.0
+    timer = timeit.Timer(lambda: [fn(x) for x in items])
+    best = min(timer.repeat(repeat=repeat, number=1))
+    return best / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for text-processing hot paths.")
+    parser.add_argument("--dialogues", default=DEFAULT_DIALOGUES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=None, help="previous --save output to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown factor vs baseline")
+    parser.add_argument("--save", default=None, help="write results to this JSON file")
+    args = parser.parse_args()
+
+    replies, output_pairs = mine_corpus(args.dialogues)
+    results = {
+        "parse_repair_tags": bench(parse_repair_tags, replies, args.repeat),
+        "extract_codes_from_text": bench(extract_codes_from_text, replies, args.repeat),
+        "update_code_from_history": bench(update_code, replies, args.repeat),
+        "programmatic_output_compare": bench(lambda p: programmatic_output_compare(*p), output_pairs, args.repeat),
+        "legacy_update_code_from_history": bench(legacy_update, replies, args.repeat),
+    }
+    print(f"corpus: {len(replies)} assistant replies, {len(output_pairs)} output pairs")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    failures = []
+    for name, us in results.items():
+        line = f"{name:34s} {us:10.2f} us/call"
+        limit = THRESHOLDS_US.get(name)
+        if limit is not None:
+            line += f"   (threshold {limit:.0f})"
+            if us > limit:
+                failures.append(f"{name}: {us:.2f} us > threshold {limit:.2f} us")
+        if name in baseline and name in THRESHOLDS_US:
+            ratio = us / baseline[name] if baseline[name] else 0.0
+            line += f"   x{ratio:.2f} vs baseline"
+            if ratio > args.tolerance:
+                failures.append(f"{name}: x{ratio:.2f} slower than baseline (tolerance x{args.tolerance})")
+        print(line)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"corpus": {"replies": len(replies), "output_pairs": len(output_pairs)},
+                       "results": results}, f, indent=2)
+
+    if failures:
+        print("REGRESSIONS:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
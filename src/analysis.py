@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental statistics over generated dialogues; regenerates analysis/*_analysis_results.json.
+
+Every dialogue is visited once and folded into mergeable aggregates:
+  Counter        repair tags (canonical tag ids, see repair_tags.py), error types
+  IntHistogram   exact integer distributions (messages per phase, repair attempts)
+  QuantileSketch log-bucketed sketch (~1% relative error) for conversation sizes in characters
+
+The aggregates and the digests of the dialogues already seen are kept in a JSON state file, so
+`update` only folds in dialogues appended since the last run, and `merge` combines the states of
+shards or nodes. Reports keep the layout of F2C_success_analysis_results.json and
+F2C_detailed_analysis_results.json.
+
+Phase B starts at the user message carrying q_translate_to_cpp_same_test; system messages are not
+counted. A repair attempt is a feedback prompt (compiler / runtime / mismatch) answered by the model.
+
+CLI:
+  python analysis.py update --state ../analysis/F2C_state.json ../data/f2c_dialogue_train.json
+  python analysis.py merge --state ../analysis/F2C_state.json node0.json node1.json
+  python analysis.py report --state ../analysis/F2C_state.json --out-dir ../analysis --prefix F2C
+"""
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from dialogue_store import iter_records, sample_digest
+    from prompt_f2c_output_comparison import q_translate_to_cpp_same_test
+    from sft_variants import is_feedback_prompt
+    from repair_policy import diagnose
+    from repair_tags import TAGS
+    from text_utils import CPP_LANGS, FORTRAN_LANGS, parse_repair_tag_ids, scan_fences
+except ImportError:
+    from utils.dialogue_store import iter_records, sample_digest
+    from utils.prompt_f2c_output_comparison import q_translate_to_cpp_same_test
+    from utils.sft_variants import is_feedback_prompt
+    from utils.repair_policy import diagnose
+    from utils.repair_tags import TAGS
+    from utils.text_utils import CPP_LANGS, FORTRAN_LANGS, parse_repair_tag_ids, scan_fences
+
+STATE_VERSION = 3  # 3: error types classified from the quoted diagnostics
+TOP_TAGS_DETAILED = 50
+TOP_TAGS_MODEL = 30
+
+_PHASE_B_START = q_translate_to_cpp_same_test.strip()[:60]
+# The repair prompts share boilerplate ("FAILED at runtime" is also sent for compile failures), so the
+# error type comes from the quoted Stdout/Stderr payload, classified like repair_policy.diagnose
+_PAYLOAD_RE = re.compile(r"^(?:Fortran|C\+\+)(?: Compile)? (?P<stream>Stdout|Stderr):[ \t]*(?P<body>.*?)"
+                         r"(?=^(?:Fortran|C\+\+)(?: Compile)? (?:Stdout|Stderr):|\Z)", re.MULTILINE | re.DOTALL)
+ERROR_TYPES = {
+    "unterminated_string": "syntax_error",
+    "missing_symbol": "compile_error",
+    "compile_error": "compile_error",
+    "openmp": "openmp_error",
+    "runtime_error": "runtime_error",
+    "no_output": "no_output",
+}
+# Prompts without a payload: phrase -> error type (first match wins; anything else is a compile error)
+PROMPT_ERROR_TYPES = (
+    ("does not match", "output_mismatch"),
+    ("must produce the SAME output", "output_mismatch"),
+    ("output matches the Fortran result", "output_mismatch"),
+    ("unterminated string", "syntax_error"),
+)
+_MODEL_RE = re.compile(r"^(?:f2c|cpp2cuda)_(?:vertexai_)?(?P<model>.+?)_Dialogue", re.IGNORECASE)
+
+
+def ranked(counter: Counter, top=None) -> Dict[str, int]:
+    """Counts by descending frequency, ties by key, so merged and single-pass reports are identical."""
+    items = sorted(counter.items(), key=lambda kv: (-kv[1], kv[0]))
+    return dict(items[:top] if top else items)
+
+
+def tag_counter(named: Optional[Dict[str, int]]) -> Counter:
+    """Tag-id counter from a {canonical tag: count} mapping (ids are process-local)."""
+    return Counter({TAGS.intern(name): count for name, count in (named or {}).items()})
+
+
+def tag_names(counter: Counter) -> Counter:
+    return Counter({TAGS.name(tid): count for tid, count in counter.items()})
+
+
+class IntHistogram:
+    """Exact histogram of small non-negative integers; merge is element-wise addition."""
+
+    def __init__(self, counts=None):
+        self.counts = Counter({int(k): v for k, v in (counts or {}).items()})
+
+    def add(self, value, n=1):
+        self.counts[int(value)] += n
+
+    def merge(self, other: "IntHistogram"):
+        self.counts.update(other.counts)
+        return self
+
+    def _value_at(self, index) -> int:
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if seen > index:
+                return value
+        return max(self.counts)
+
+    def quantile(self, q) -> float:
+        """Linear interpolation between ranks (statistics.median for q=0.5)."""
+        total = sum(self.counts.values())
+        if not total:
+            return 0
+        rank = q * (total - 1)
+        lo, hi = self._value_at(math.floor(rank)), self._value_at(math.ceil(rank))
+        return lo + (hi - lo) * (rank - math.floor(rank))
+
+    def summary(self, distribution=True) -> Dict:
+        total = sum(self.counts.values())
+        if not total:
+            out = {"min": 0, "max": 0, "avg": 0, "median": 0}
+        else:
+            out = {
+                "min": min(self.counts),
+                "max": max(self.counts),
+                "avg": sum(k * v for k, v in self.counts.items()) / total,
+                "median": float(self.quantile(0.5)),
+            }
+        if distribution:
+            out["distribution"] = {str(k): v for k, v in sorted(self.counts.items())}
+        return out
+
+    def to_dict(self):
+        return {str(k): v for k, v in sorted(self.counts.items())}
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative accuracy `alpha` (log-spaced buckets, as in DDSketch).
+    Values must be >= 0; zeros are counted separately.
+    """
+
+    def __init__(self, alpha=0.01, buckets=None, zeros=0, count=0, total=0.0, min_=None, max_=None):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = Counter({int(k): v for k, v in (buckets or {}).items()})
+        self.zeros, self.count, self.total = zeros, count, total
+        self.min, self.max = min_, max_
+
+    def add(self, value):
+        if value <= 0:
+            self.zeros += 1
+        else:
+            self.buckets[math.ceil(math.log(value) / self._log_gamma)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "QuantileSketch"):
+        if other.alpha != self.alpha:
+            raise ValueError("cannot merge sketches with different accuracy")
+        self.buckets.update(other.buckets)
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        for v in (other.min, other.max):
+            if v is not None:
+                self.min = v if self.min is None else min(self.min, v)
+                self.max = v if self.max is None else max(self.max, v)
+        return self
+
+    def quantile(self, q) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                estimate = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return float(self.max)
+
+    def summary(self) -> Dict:
+        return {
+            "min": self.min or 0,
+            "max": self.max or 0,
+            "avg": self.total / self.count if self.count else 0,
+            "p50": round(self.quantile(0.5), 1),
+            "p95": round(self.quantile(0.95), 1),
+        }
+
+    def to_dict(self):
+        return {"alpha": self.alpha, "buckets": {str(k): v for k, v in sorted(self.buckets.items())},
+                "zeros": self.zeros, "count": self.count, "total": self.total, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["alpha"], d["buckets"], d["zeros"], d["count"], d["total"], d["min"], d["max"])
+
+
+class PhaseStats:
+    def __init__(self, d=None):
+        d = d or {}
+        self.conversations = d.get("conversations", 0)
+        self.successful = d.get("successful", 0)
+        self.attempts = IntHistogram(d.get("attempts"))
+        self.error_types = Counter(d.get("error_types", {}))
+        self.tags = tag_counter(d.get("tags"))
+
+    def merge(self, other: "PhaseStats"):
+        self.conversations += other.conversations
+        self.successful += other.successful
+        self.attempts.merge(other.attempts)
+        self.error_types.update(other.error_types)
+        self.tags.update(other.tags)
+        return self
+
+    def to_dict(self):
+        return {"conversations": self.conversations, "successful": self.successful,
+                "attempts": self.attempts.to_dict(), "error_types": dict(self.error_types), "tags": tag_names(self.tags)}
+
+    def detailed(self, top=TOP_TAGS_DETAILED) -> Dict:
+        return {
+            "total_conversations": self.conversations,
+            "successful": self.successful,
+            "failed": self.conversations - self.successful,
+            "attempts_statistics": self.attempts.summary(),
+            "error_type_distribution": ranked(self.error_types),
+            "top_repair_tags": ranked(tag_names(self.tags), top),
+        }
+
+
+class ModelStats:
+    """All aggregates for one model; the run-wide view is the merge over models."""
+
+    def __init__(self, d=None):
+        d = d or {}
+        self.conversations = d.get("conversations", 0)
+        self.successful = d.get("successful", 0)
+        self.total_messages = IntHistogram(d.get("total_messages"))
+        self.phase_a_messages = IntHistogram(d.get("phase_a_messages"))
+        self.phase_b_messages = IntHistogram(d.get("phase_b_messages"))
+        self.tags = tag_counter(d.get("tags"))
+        self.chars = QuantileSketch.from_dict(d["chars"]) if "chars" in d else QuantileSketch()
+        self.phase_a = PhaseStats(d.get("phase_a"))
+        self.phase_b = PhaseStats(d.get("phase_b"))
+
+    def merge(self, other: "ModelStats"):
+        self.conversations += other.conversations
+        self.successful += other.successful
+        self.total_messages.merge(other.total_messages)
+        self.phase_a_messages.merge(other.phase_a_messages)
+        self.phase_b_messages.merge(other.phase_b_messages)
+        self.tags.update(other.tags)
+        self.chars.merge(other.chars)
+        self.phase_a.merge(other.phase_a)
+        self.phase_b.merge(other.phase_b)
+        return self
+
+    def to_dict(self):
+        return {
+            "conversations": self.conversations, "successful": self.successful,
+            "total_messages": self.total_messages.to_dict(),
+            "phase_a_messages": self.phase_a_messages.to_dict(),
+            "phase_b_messages": self.phase_b_messages.to_dict(),
+            "tags": tag_names(self.tags), "chars": self.chars.to_dict(),
+            "phase_a": self.phase_a.to_dict(), "phase_b": self.phase_b.to_dict(),
+        }
+
+
+def classify_error(prompt) -> str:
+    """
+    Error type of a feedback prompt: quoted compiler/runtime diagnostics decide; a prompt quoting no
+    diagnostics is an output mismatch (or the failure its wording names).
+    """
+    streams = {"Stdout": [], "Stderr": []}
+    for m in _PAYLOAD_RE.finditer(prompt):
+        streams[m.group("stream")].append(m.group("body"))
+    stderr = "\n".join(streams["Stderr"])
+    if stderr.strip():
+        return ERROR_TYPES[diagnose(False, "\n".join(streams["Stdout"]), stderr)]
+    for phrase, error_type in PROMPT_ERROR_TYPES:
+        if phrase in prompt:
+            return error_type
+    if streams["Stdout"]:
+        # Ran without diagnostics: wrong output, or none at all
+        return "runtime_error" if "".join(streams["Stdout"]).strip() else "no_output"
+    return "compile_error"
+
+
+def model_of(record, default="unknown") -> str:
+    if record.get("model"):
+        return str(record["model"])
+    m = _MODEL_RE.match(os.path.basename(record.get("source_file") or ""))
+    return m.group("model") if m else default
+
+
+def dialogue_succeeded(messages) -> bool:
+    """Orchestrator [SUCCESS]/[FAIL] markers when present, else a final reply with both programs."""
+    for m in reversed(messages):
+        if m["role"] == "system":
+            content = m["content"] or ""
+            if content.startswith("[SUCCESS]"):
+                return True
+            if content.startswith("[FAIL]"):
+                return False
+    if not messages or messages[-1]["role"] != "assistant":
+        return False
+    langs = {lang.lower() for lang, _ in scan_fences(messages[-1]["content"] or "")}
+    return bool(langs & set(FORTRAN_LANGS)) and bool(langs & set(CPP_LANGS))
+
+
+def fold_dialogue(stats: ModelStats, messages):
+    """Add one dialogue to `stats`."""
+    convo = [m for m in messages if m["role"] != "system"]
+    split = next((i for i, m in enumerate(convo)
+                  if m["role"] == "user" and (m["content"] or "").strip().startswith(_PHASE_B_START)), len(convo))
+    success = dialogue_succeeded(messages)
+    reached_b = split < len(convo)
+
+    stats.conversations += 1
+    stats.successful += success
+    stats.total_messages.add(len(convo))
+    stats.phase_a_messages.add(split)
+    if reached_b:
+        stats.phase_b_messages.add(len(convo) - split)
+    stats.chars.add(sum(len(m["content"] or "") for m in convo))
+
+    for phase, lo, hi, ok in ((stats.phase_a, 0, split, reached_b), (stats.phase_b, split, len(convo), success)):
+        if phase is stats.phase_b and not reached_b:
+            continue
+        phase.conversations += 1
+        phase.successful += ok
+        attempts = 0
+        for i in range(max(lo, 1), hi):
+            m = convo[i]
+            if m["role"] != "user" or convo[i - 1]["role"] != "assistant" or not is_feedback_prompt(m["content"]):
+                continue
+            attempts += 1
+            phase.error_types[classify_error(m["content"] or "")] += 1
+            if i + 1 < hi and convo[i + 1]["role"] == "assistant":
+                phase.tags.update(parse_repair_tag_ids(convo[i + 1]["content"] or ""))
+        phase.attempts.add(attempts)
+
+    for m in convo:
+        if m["role"] == "assistant":
+            stats.tags.update(parse_repair_tag_ids(m["content"] or ""))
+
+
+class AnalysisState:
+    def __init__(self, d=None):
+        d = d or {"version": STATE_VERSION}
+        if d.get("version") != STATE_VERSION:
+            raise ValueError(f"unsupported analysis state version {d.get('version')}")
+        self.files = set(d.get("files", []))
+        self.digests = set(d.get("digests", []))
+        self.models: Dict[str, ModelStats] = {name: ModelStats(m) for name, m in d.get("models", {}).items()}
+
+    @classmethod
+    def load(cls, path) -> "AnalysisState":
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    def to_dict(self):
+        return {"version": STATE_VERSION, "files": sorted(self.files), "digests": sorted(self.digests),
+                "models": {name: m.to_dict() for name, m in sorted(self.models.items())}}
+
+    def update(self, records: Iterable[Dict], source=None, default_model="unknown") -> int:
+        """Fold in records not seen before; returns how many were added."""
+        added = 0
+        for record in records:
+            messages = record.get("messages") or []
+            digest = sample_digest(messages)
+            if digest in self.digests:
+                continue
+            self.digests.add(digest)
+            self.files.add(os.path.basename(record.get("source_file") or source or ""))
+            model = model_of(record, default_model)
+            fold_dialogue(self.models.setdefault(model, ModelStats()), messages)
+            added += 1
+        return added
+
+    def merge(self, other: "AnalysisState"):
+        overlap = self.digests & other.digests
+        if overlap:
+            raise ValueError(f"states overlap on {len(overlap)} dialogues; merge disjoint shards only")
+        self.files |= other.files
+        self.digests |= other.digests
+        for name, m in other.models.items():
+            self.models.setdefault(name, ModelStats()).merge(m)
+        return self
+
+    def overall(self) -> ModelStats:
+        total = ModelStats()
+        for m in self.models.values():
+            total.merge(m)
+        return total
+
+    def success_report(self) -> Dict:
+        total = self.overall()
+        return {
+            "basic_info": {"total_files": len(self.files - {""}), "total_conversations": total.conversations,
+                           "models": sorted(self.models)},
+            "phase_success": {"successful_conversations": total.successful,
+                              "failed_conversations": total.conversations - total.successful},
+            "conversation_stats": {
+                "total_messages": total.total_messages.summary(),
+                "phase_a_messages": total.phase_a_messages.summary(),
+                "phase_b_messages": total.phase_b_messages.summary(),
+                "total_chars": total.chars.summary(),
+            },
+            "repair_tags": ranked(tag_names(total.tags)),
+            "model_comparison": {
+                name: {"conversation_count": m.conversations, "successful_conversations": m.successful,
+                       "common_tags": ranked(tag_names(m.tags))}
+                for name, m in sorted(self.models.items())
+            },
+        }
+
+    def detailed_report(self) -> Dict:
+        total = self.overall()
+
+        def compact(phase: PhaseStats):
+            d = phase.detailed(TOP_TAGS_MODEL)
+            d["attempts_statistics"] = phase.attempts.summary(distribution=False)
+            return {k: d[k] for k in ("attempts_statistics", "error_type_distribution", "top_repair_tags")}
+
+        return {
+            "basic_info": {"total_conversations": total.conversations, "successful_conversations": total.successful,
+                           "failed_conversations": total.conversations - total.successful,
+                           "models": sorted(self.models)},
+            "phase_a_detailed": total.phase_a.detailed(),
+            "phase_b_detailed": total.phase_b.detailed(),
+            "model_comparison": {
+                name: {"conversation_count": m.conversations, "successful_conversations": m.successful,
+                       "phase_a": compact(m.phase_a), "phase_b": compact(m.phase_b)}
+                for name, m in sorted(self.models.items())
+            },
+        }
+
+    def write_reports(self, out_dir, prefix="F2C") -> List[str]:
+        os.makedirs(out_dir, exist_ok=True)
+        paths = []
+        for name, report in (("success", self.success_report()), ("detailed", self.detailed_report())):
+            path = os.path.join(out_dir, f"{prefix}_{name}_analysis_results.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            paths.append(path)
+        return paths
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Incremental dialogue analysis (analysis/*_analysis_results.json).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_update = sub.add_parser("update", help="fold new dialogues into the state and write reports")
+    p_update.add_argument("inputs", nargs="+", help="dialogue files (.json arrays or .jsonl)")
+    p_update.add_argument("--model", default="unknown", help="model name for records without one")
+    p_merge = sub.add_parser("merge", help="merge disjoint shard/node states into --state")
+    p_merge.add_argument("states", nargs="+")
+    p_report = sub.add_parser("report", help="write reports from the state only")
+    for p in (p_update, p_merge, p_report):
+        p.add_argument("--state", required=True, help="state file (created if missing)")
+        p.add_argument("--out-dir", default=None, help="write reports here")
+        p.add_argument("--prefix", default="F2C")
+    args = parser.parse_args(argv)
+
+    state = AnalysisState.load(args.state)
+    if args.command == "update":
+        for path in args.inputs:
+            added = state.update(iter_records(path), source=path, default_model=args.model)
+            print(f"{path}: +{added} dialogues")
+    elif args.command == "merge":
+        for path in args.states:
+            state.merge(AnalysisState.load(path))
+    if args.command != "report":
+        state.save(args.state)
+    if args.out_dir:
+        for path in state.write_reports(args.out_dir, args.prefix):
+            print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed artifact store and level-gated logging of large text blobs.
+
+Sources, stdout and stderr are written ONCE into the store (keyed by sha256) and the
+log line only carries `name=sha256[:12]:size`. Full dumps are emitted only when DEBUG is
+enabled or when a per-sample trace flag is set.
+"""
+import hashlib
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+ARTIFACT_DIR_ENV = "F2C_ARTIFACT_DIR"
+DIGEST_PREFIX_LEN = 12
+
+
+class ArtifactStore:
+    """
+    Write-once text store laid out as <root>/<sha[:2]>/<sha>.txt.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, digest) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.txt")
+
+    def put(self, text) -> Tuple[str, int]:
+        """Store `text` if not already present. Returns (sha256 hex digest, size in bytes)."""
+        data = (text or "").encode("utf-8", "replace")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest, len(data)
+
+    def get(self, digest) -> Optional[str]:
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+
+def default_artifact_store() -> Optional[ArtifactStore]:
+    """Store rooted at $F2C_ARTIFACT_DIR, or None when the variable is unset."""
+    root = os.getenv(ARTIFACT_DIR_ENV)
+    return ArtifactStore(root) if root else None
+
+
+def _reference(text, store) -> str:
+    if store is not None:
+        digest, size = store.put(text)
+    else:
+        data = (text or "").encode("utf-8", "replace")
+        digest, size = hashlib.sha256(data).hexdigest(), len(data)
+    return f"{digest[:DIGEST_PREFIX_LEN]}:{size}"
+
+
+def log_blobs(header, blobs: Dict[str, str], store=None, trace=False, logger=None):
+    """
+    Log a group of large text blobs under one header line.
+
+    INFO: `header name=sha:size ...` (blobs go to `store` when given)
+    DEBUG or trace=True: full contents as well
+    Nothing is hashed or formatted when the logger is not enabled for INFO.
+    """
+    logger = logger or logging.getLogger()
+    if trace or logger.isEnabledFor(logging.DEBUG):
+        level = logging.INFO if trace else logging.DEBUG
+        body = "\n".join(f"{name}:\n{text}" for name, text in blobs.items())
+        logger.log(level, "%s\n%s\n", header, body)
+        return
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    refs = " ".join(f"{name}={_reference(text, store)}" for name, text in blobs.items())
+    logger.info("%s %s", header, refs)
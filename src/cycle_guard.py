@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Fail-fast loop detection for the repair turns of one phase.
+
+Every failed turn is fingerprinted as (normalized source, normalized diagnostics), the source
+normalized for the phase's language (text_utils.normalize_source). The guard
+flags a turn as
+  repeat  the exact (source, diagnostics) state was already seen in this phase (A -> B -> A too)
+  stuck   the diagnostics are unchanged for `stuck_after` consecutive turns although the source changed
+and the orchestrator then escalates to a different prompt strategy (each one at most once) or
+aborts the phase, recording how many turns that saved.
+
+A reply that re-submits an already failed program does not need a new compile either:
+`cached_result` returns the stored outcome of a byte-identical source (a result is never reused for
+code that merely normalizes the same).
+"""
+import hashlib
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    from text_utils import normalize_diagnostics, normalize_source
+except ImportError:
+    from utils.text_utils import normalize_diagnostics, normalize_source
+
+REPEAT = "repeat"
+STUCK = "stuck"
+OPENMP_MARKERS = ("openmp", "omp_", "!$omp", "#pragma omp", "-fopenmp")
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8", "replace"), digest_size=8).hexdigest()
+
+
+def mentions_openmp(*texts) -> bool:
+    return any(marker in (t or "").lower() for t in texts for marker in OPENMP_MARKERS)
+
+
+class RepairGuard:
+    """Fingerprint history of one phase of one conversation."""
+
+    def __init__(self, lang="fortran", stuck_after=2):
+        self.lang = lang
+        self.stuck_after = stuck_after
+        self.states: Set[Tuple[str, str]] = set()
+        self.diag_run: List[str] = []
+        self.results: Dict[str, tuple] = {}
+        self.used_strategies: Set[str] = set()
+
+    def cached_result(self, source) -> Optional[tuple]:
+        """Stored run result of a program that already failed in this phase, if any."""
+        return self.results.get(fingerprint(source or ""))
+
+    def observe(self, source, diagnostics, result=None) -> Optional[str]:
+        """Record one failed turn; returns REPEAT, STUCK or None."""
+        src_fp = fingerprint(normalize_source(source, self.lang))
+        diag_fp = fingerprint(normalize_diagnostics(diagnostics))
+        if result is not None:
+            self.results[fingerprint(source or "")] = result
+        state = (src_fp, diag_fp)
+        verdict = REPEAT if state in self.states else None
+        self.states.add(state)
+        if self.diag_run and self.diag_run[-1] != diag_fp:
+            self.diag_run = []
+        self.diag_run.append(diag_fp)
+        if verdict is None and len(self.diag_run) >= self.stuck_after:
+            verdict = STUCK
+        return verdict
+
+    def next_strategy(self, candidates) -> Optional[str]:
+        """First applicable strategy not tried yet (marks it used), or None to abort."""
+        for name in candidates:
+            if name not in self.used_strategies:
+                self.used_strategies.add(name)
+                # A new strategy deserves a fresh streak
+                self.diag_run = []
+                return name
+        return None
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Constant-memory access to dialogue / code-pair datasets.
+
+- iter_records(path): stream records from a JSON array file (data/f2c_dialogue_*.json) or a JSONL
+  file (data/f2c_code_pair_*.jsonl) without loading the whole file. Uses ijson when installed,
+  otherwise an incremental json.JSONDecoder.raw_decode over fixed-size chunks.
+- convert_to_jsonl(src): one-time conversion of a JSON array into JSONL plus an `<out>.idx`
+  offset index (id -> [byte offset, byte length]).
+- DialogueReader(path): memory-mapped reader over the JSONL with O(1) lookup by id.
+
+CLI:
+  python dialogue_store.py convert ../data/f2c_dialogue_train.json
+  python dialogue_store.py get ../data/f2c_dialogue_train.jsonl 42
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import sys
+from typing import Dict, Iterator, List, Optional
+
+CHUNK_SIZE = 1 << 20
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+
+_decoder = json.JSONDecoder()
+
+
+def _iter_json_array_fallback(f, chunk_size=CHUNK_SIZE) -> Iterator[Dict]:
+    """Incrementally decode the elements of a top-level JSON array from a text file object."""
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+    while True:
+        # Skip separators between elements
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if not started and pos < len(buf):
+                if buf[pos] != "[":
+                    raise ValueError("expected a top-level JSON array")
+                started = True
+                pos += 1
+                continue
+            break
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        if pos >= len(buf) and eof:
+            if started:
+                raise ValueError("unterminated JSON array")
+            return
+        try:
+            if pos >= len(buf):
+                raise json.JSONDecodeError("need more data", buf, pos)
+            obj, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield obj
+        pos = end
+        if pos > chunk_size:
+            buf = buf[pos:]
+            pos = 0
+
+
+def iter_json_array(path, chunk_size=CHUNK_SIZE) -> Iterator[Dict]:
+    """Stream the elements of a JSON array file."""
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+    if ijson is not None:
+        with open(path, "rb") as f:
+            yield from ijson.items(f, "item", use_float=True)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        yield from _iter_json_array_fallback(f, chunk_size)
+
+
+def iter_jsonl(path) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_records(path) -> Iterator[Dict]:
+    """Stream records from a .jsonl file or a JSON array file."""
+    if path.endswith(".jsonl"):
+        return iter_jsonl(path)
+    return iter_json_array(path)
+
+
+def message_digests(messages) -> List[str]:
+    """sha256 of each message content."""
+    return [hashlib.sha256((m.get("content") or "").encode("utf-8")).hexdigest() for m in messages]
+
+
+def sample_digest(messages, digests=None) -> str:
+    """Content hash of a whole sample (roles + message hashes); stable cache key across tools."""
+    digests = digests or message_digests(messages)
+    return hashlib.sha256("".join(f"{m['role']}:{h}" for m, h in zip(messages, digests))
+                          .encode("utf-8")).hexdigest()
+
+
+def _record_key(record, position, key):
+    value = record.get(key)
+    return str(position if value is None else value)
+
+
+def build_index(jsonl_path, key="id") -> Dict:
+    """Scan a JSONL file once and write `<jsonl_path>.idx`; returns the index dict."""
+    ids: Dict[str, List[int]] = {}
+    offset = 0
+    position = 0
+    with open(jsonl_path, "rb") as f:
+        for line in f:
+            length = len(line)
+            if line.strip():
+                ids[_record_key(json.loads(line), position, key)] = [offset, length]
+                position += 1
+            offset += length
+    index = {"version": INDEX_VERSION, "key": key, "count": len(ids),
+             "data_size": offset, "ids": ids}
+    _write_index(jsonl_path, index)
+    return index
+
+
+def _write_index(jsonl_path, index):
+    tmp_path = f"{jsonl_path}{INDEX_SUFFIX}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, jsonl_path + INDEX_SUFFIX)
+
+
+def convert_to_jsonl(src_path, dst_path=None, key="id") -> str:
+    """Convert a JSON array (or re-index a JSONL) file; returns the JSONL path."""
+    if dst_path is None:
+        dst_path = os.path.splitext(src_path)[0] + ".jsonl"
+    if os.path.abspath(src_path) == os.path.abspath(dst_path):
+        build_index(dst_path, key)
+        return dst_path
+
+    ids: Dict[str, List[int]] = {}
+    offset = 0
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as out:
+        for position, record in enumerate(iter_records(src_path)):
+            line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+            ids[_record_key(record, position, key)] = [offset, len(line)]
+            out.write(line)
+            offset += len(line)
+    os.replace(tmp_path, dst_path)
+    _write_index(dst_path, {"version": INDEX_VERSION, "key": key, "count": len(ids),
+                            "data_size": offset, "ids": ids})
+    return dst_path
+
+
+class DialogueReader:
+    """
+    Memory-mapped random access over a JSONL dataset by record id.
+
+    Passing a JSON array file converts it once to a sibling .jsonl (re-converted when the
+    source is newer). The index is rebuilt when missing or out of date with the data file.
+    """
+
+    def __init__(self, path, key="id"):
+        if not path.endswith(".jsonl"):
+            jsonl_path = os.path.splitext(path)[0] + ".jsonl"
+            if not os.path.exists(jsonl_path) or os.path.getmtime(jsonl_path) < os.path.getmtime(path):
+                convert_to_jsonl(path, jsonl_path, key)
+            path = jsonl_path
+        self.path = path
+        self.index = self._load_index(key)
+        self._ids: Dict[str, List[int]] = self.index["ids"]
+        self._file = open(path, "rb")
+        size = os.path.getsize(path)
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def _load_index(self, key) -> Dict:
+        idx_path = self.path + INDEX_SUFFIX
+        if os.path.exists(idx_path):
+            with open(idx_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if (index.get("version") == INDEX_VERSION and index.get("key") == key
+                    and index.get("data_size") == os.path.getsize(self.path)):
+                return index
+        return build_index(self.path, key)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, record_id):
+        return str(record_id) in self._ids
+
+    def ids(self) -> List[str]:
+        return list(self._ids)
+
+    def raw(self, record_id) -> Optional[bytes]:
+        """Undecoded JSON bytes of one record, or None."""
+        entry = self._ids.get(str(record_id))
+        if entry is None or self._mm is None:
+            return None
+        offset, length = entry
+        return self._mm[offset:offset + length]
+
+    def get(self, record_id, default=None):
+        data = self.raw(record_id)
+        return default if data is None else json.loads(data)
+
+    def __getitem__(self, record_id):
+        data = self.raw(record_id)
+        if data is None:
+            raise KeyError(record_id)
+        return json.loads(data)
+
+    def __iter__(self) -> Iterator[Dict]:
+        """Stream records in file order straight from the mapping."""
+        if self._mm is None:
+            return
+        pos, size = 0, len(self._mm)
+        while pos < size:
+            end = self._mm.find(b"\n", pos)
+            end = size if end < 0 else end + 1
+            line = self._mm[pos:end]
+            if line.strip():
+                yield json.loads(line)
+            pos = end
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming / indexed access to dialogue datasets.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_convert = sub.add_parser("convert", help="JSON array -> JSONL + offset index")
+    p_convert.add_argument("src")
+    p_convert.add_argument("--out", default=None)
+    p_convert.add_argument("--key", default="id")
+    p_get = sub.add_parser("get", help="print one record by id")
+    p_get.add_argument("path")
+    p_get.add_argument("id")
+    p_get.add_argument("--key", default="id")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        out = convert_to_jsonl(args.src, args.out, args.key)
+        print(out)
+    else:
+        with DialogueReader(args.path, args.key) as reader:
+            record = reader.get(args.id)
+            if record is None:
+                sys.exit(f"id {args.id} not found")
+            print(json.dumps(record, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Batched evaluation of Fortran -> C++ translator models (e.g. the adapters trained from sft/configs).
+
+For every record of a code-pair test set (data/f2c_code_pair_test_dataset.jsonl) the record's
+user prompt is sent to an OpenAI-compatible server (vLLM, llama.cpp, `stub_llm.py` offline) for
+n samples in one request (topped up with more requests when the server returns fewer choices).
+The ```cpp block of every candidate is compiled and run through an executor, all candidates
+concurrently, and its output compared with the output of the record's Fortran program
+(output_compare, with run-dependent fields masked as in Phase B).
+
+Reported, per k in --k (unbiased estimator 1 - C(n-c, k) / C(n, k), averaged over problems):
+  compile@k       one of k candidates compiles
+  pass@k          one of k candidates reproduces the Fortran output
+and runtime_ratio: C++ run time / Fortran run time of the passing candidates (median of the
+per-problem medians; single runs, so indicative only; perf_profile.py measures properly).
+
+Candidates and Fortran baselines go through a ResultCache keyed by (language, compile profile,
+source without trailing whitespace): repeated candidates, within a problem or across models
+evaluated with the same --cache file, are compiled and run once. A key in flight is awaited
+rather than run twice.
+
+Example:
+  python stub_llm.py --code-pairs ../data/f2c_code_pair_test_dataset.jsonl --port 8000 &
+  python evaluate.py --data ../data/f2c_code_pair_test_dataset.jsonl --base-url http://127.0.0.1:8000/v1 \
+      --model qwen2_5-coder-7b-f2cpp -n 10 --k 1 5 10 --out eval_qwen.json --cache eval_cache.jsonl
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+try:
+    from dialogue_store import iter_jsonl, iter_records
+    from executor import make_executor
+    from output_compare import VolatileMask, programmatic_output_compare
+    from text_utils import extract_codes_from_text
+    from toolchain import COMPILE_PROFILES, TIMEOUT_LIMIT
+except ImportError:
+    from utils.dialogue_store import iter_jsonl, iter_records
+    from utils.executor import make_executor
+    from utils.output_compare import VolatileMask, programmatic_output_compare
+    from utils.text_utils import extract_codes_from_text
+    from utils.toolchain import COMPILE_PROFILES, TIMEOUT_LIMIT
+
+DEFAULT_N = 10
+DEFAULT_K = (1, 5, 10)
+
+
+def pass_at_k(n, c, k) -> Optional[float]:
+    """Probability that one of k samples drawn from n (c of them correct) is correct; None when k > n."""
+    if k > n:
+        return None
+    if n - c < k:
+        return 1.0
+    return 1.0 - math.comb(n - c, k) / math.comb(n, k)
+
+
+class ResultCache:
+    """Compile/run results keyed by source; in memory, optionally persisted to a JSONL file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.stats = Counter()
+        self._results: Dict[str, Dict] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            for row in iter_jsonl(path):
+                self._results[row["key"]] = row["result"]
+
+    @staticmethod
+    def key(lang, profile, code) -> str:
+        source = "\n".join(line.rstrip() for line in (code or "").strip().splitlines())
+        return hashlib.sha256(f"{lang}\0{profile}\0{source}".encode("utf-8", "replace")).hexdigest()
+
+    def get_or_run(self, key, run: Callable[[], Dict]) -> Dict:
+        with self._lock:
+            if key in self._results:
+                self.stats["hit"] += 1
+                return self._results[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.stats["miss"] += 1
+            else:
+                self.stats["inflight_hit"] += 1
+        if not owner:
+            return future.result()
+        try:
+            result = run()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._results[key] = result
+            self._inflight.pop(key)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "result": result}) + "\n")
+        future.set_result(result)
+        return result
+
+
+def generate(client, model, messages, n, max_tokens, temperature) -> List[str]:
+    """n completions for one prompt; servers that ignore `n` are asked again for the rest."""
+    replies: List[str] = []
+    while len(replies) < n:
+        response = client.chat.completions.create(model=model, messages=messages, n=n - len(replies),
+                                                  max_tokens=max_tokens, temperature=temperature)
+        batch = [choice.message.content or "" for choice in response.choices]
+        if not batch:
+            break
+        replies.extend(batch)
+    return replies[:n]
+
+
+class Evaluator:
+    """Generates, runs and scores candidates; one instance per model under test."""
+
+    def __init__(self, client, model, executor, cache: ResultCache, n=DEFAULT_N, k=DEFAULT_K, max_tokens=4096,
+                 temperature=0.8, profile="default", timeout_seconds=TIMEOUT_LIMIT, workers=None, concurrency=8,
+                 sandbox_root=None):
+        self.client = client
+        self.model = model
+        self.executor = executor
+        self.cache = cache
+        self.n = n
+        self.k = tuple(k)
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.profile = profile
+        self.timeout_seconds = timeout_seconds
+        self.concurrency = concurrency
+        self.sandbox_root = sandbox_root
+        self._run_pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+
+    def _run(self, lang, code) -> Dict:
+        """Cached compile+run of one program: ok, compiled, stdout, stderr, run_time."""
+        def run():
+            # Inline executors work in these folders; pool/remote executors use their own scratch
+            folder = tempfile.mkdtemp(prefix=f"{lang}_eval_", dir=self.sandbox_root)
+            timings: Dict[str, float] = {}
+            try:
+                if lang == "fortran":
+                    stdout, stderr, ok = self.executor.run_fortran(folder, code, timeout_seconds=self.timeout_seconds,
+                                                                   timings=timings, profile=self.profile)
+                else:
+                    stdout, stderr, ok = self.executor.run_cpp(folder, code, timeout_seconds=self.timeout_seconds,
+                                                               timings=timings, profile=self.profile)
+            finally:
+                shutil.rmtree(folder, ignore_errors=True)
+            # The toolchain records a run time only for programs that compiled
+            run_time = timings.get(f"{lang}_run")
+            return {"ok": ok, "compiled": run_time is not None, "stdout": stdout, "stderr": stderr[-2000:],
+                    "run_time": run_time}
+        return self.cache.get_or_run(ResultCache.key(lang, self.profile, code), run)
+
+    def _mask(self, fortran_code, baseline, state) -> VolatileMask:
+        """Run-dependent fields of the Fortran output; probed once per problem, on the first mismatch."""
+        with state["lock"]:
+            if state["mask"] is None:
+                folder = tempfile.mkdtemp(prefix="fortran_eval_", dir=self.sandbox_root)
+                try:
+                    outputs = self.executor.probe_fortran(folder, fortran_code, profile=self.profile)
+                finally:
+                    shutil.rmtree(folder, ignore_errors=True)
+                state["mask"] = VolatileMask.detect([baseline["stdout"]] + outputs)
+            return state["mask"]
+
+    def _check(self, record, baseline, cpp_code, state) -> Dict:
+        if not cpp_code:
+            return {"compiled": False, "passed": False, "error": "no cpp block"}
+        result = self._run("cpp", cpp_code)
+        if not result["ok"]:
+            return {"compiled": result["compiled"], "passed": False}
+        passed, method = programmatic_output_compare(baseline["stdout"], result["stdout"])
+        if not passed:
+            mask = self._mask(record["fortran_code"], baseline, state)
+            if mask:
+                passed, method = programmatic_output_compare(mask.apply(baseline["stdout"]), mask.apply(result["stdout"]))
+        ratio = None
+        if passed and baseline["run_time"] and result["run_time"] is not None:
+            ratio = result["run_time"] / baseline["run_time"]
+        return {"compiled": True, "passed": passed, "method": method, "runtime_ratio": ratio}
+
+    def evaluate_problem(self, position, record) -> Dict:
+        messages = [m for m in record["messages"] if m["role"] != "assistant"]
+        start = time.perf_counter()
+        replies = generate(self.client, self.model, messages, self.n, self.max_tokens, self.temperature)
+        generation_time = time.perf_counter() - start
+        baseline = self._run("fortran", record["fortran_code"])
+        entry = {"index": record.get("index", position), "id": record.get("id", position), "n": len(replies),
+                 "generation_time": round(generation_time, 3)}
+        if not baseline["ok"]:
+            entry["error"] = "fortran baseline failed"
+            return entry
+        state = {"lock": threading.Lock(), "mask": None}
+        candidates = [extract_codes_from_text(reply)[1] for reply in replies]
+        checks = list(self._run_pool.map(lambda code: self._check(record, baseline, code, state), candidates))
+        ratios = [c["runtime_ratio"] for c in checks if c.get("runtime_ratio") is not None]
+        entry.update({
+            "compiled": sum(c["compiled"] for c in checks),
+            "passed": sum(c["passed"] for c in checks),
+            "runtime_ratio": round(statistics.median(ratios), 4) if ratios else None,
+        })
+        return entry
+
+    def evaluate(self, records) -> Dict:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            problems = list(pool.map(lambda item: self.evaluate_problem(*item), enumerate(records)))
+        return self.report(problems, time.perf_counter() - start)
+
+    def report(self, problems, wall_time) -> Dict:
+        scored = [p for p in problems if "compiled" in p and p["n"]]
+        metrics = {}
+        for k in self.k:
+            for name, field in (("compile", "compiled"), ("pass", "passed")):
+                values = [pass_at_k(p["n"], p[field], k) for p in scored]
+                values = [v for v in values if v is not None]
+                metrics[f"{name}@{k}"] = round(sum(values) / len(values), 4) if values else None
+        ratios = [p["runtime_ratio"] for p in scored if p["runtime_ratio"] is not None]
+        return {
+            "model": self.model,
+            "problems": len(problems),
+            "scored": len(scored),
+            "n": self.n,
+            "temperature": self.temperature,
+            "compile_profile": self.profile,
+            "metrics": metrics,
+            "runtime_ratio": {"median": round(statistics.median(ratios), 4) if ratios else None,
+                              "problems": len(ratios)},
+            "cache": dict(self.cache.stats),
+            "wall_time": round(wall_time, 3),
+            "per_problem": problems,
+        }
+
+    def close(self):
+        self._run_pool.shutdown(wait=True)
+
+
+def make_client(base_url, replay=None):
+    """OpenAI client for `base_url`, or the in-process replay stub over recorded data files."""
+    if replay:
+        try:
+            from stub_llm import FakeOpenAI, ReplayIndex
+        except ImportError:
+            from utils.stub_llm import FakeOpenAI, ReplayIndex
+        return FakeOpenAI(ReplayIndex.from_files(dialogues=[p for p in replay if not p.endswith(".jsonl")],
+                                                 code_pairs=[p for p in replay if p.endswith(".jsonl")]))
+    from openai import OpenAI
+    return OpenAI(base_url=base_url, api_key=os.getenv("OPENAI_API_KEY", "EMPTY"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compile@k / pass@k evaluation of a translator model.")
+    parser.add_argument("--data", required=True, help="code-pair JSON/JSONL (messages + fortran_code)")
+    parser.add_argument("--model", required=True, help="model name served by the endpoint")
+    parser.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL", "http://127.0.0.1:8000/v1"))
+    parser.add_argument("-n", type=int, default=DEFAULT_N, help="samples per problem")
+    parser.add_argument("--k", type=int, nargs="+", default=list(DEFAULT_K))
+    parser.add_argument("--temperature", type=float, default=0.8)
+    parser.add_argument("--max-tokens", type=int, default=4096)
+    parser.add_argument("--limit", type=int, default=None, help="first N problems only")
+    parser.add_argument("--concurrency", type=int, default=8, help="generation requests in flight")
+    parser.add_argument("--workers", type=int, default=None, help="compile/run jobs in flight (default: CPU count)")
+    parser.add_argument("--compile-profile", default="default", choices=sorted(COMPILE_PROFILES))
+    parser.add_argument("--executor", default=None, help="inline | local[:N] | http://node:8600[,...]")
+    parser.add_argument("--cache", default=None, help="JSONL result cache shared between evaluations")
+    parser.add_argument("--replay", nargs="*", default=None, help="offline: answer via stub_llm from these files")
+    parser.add_argument("--out", required=True, help="report JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    records = list(iter_records(args.data))[:args.limit]
+    executor = make_executor(args.executor)
+    evaluator = Evaluator(make_client(args.base_url, args.replay), args.model, executor, ResultCache(args.cache),
+                          n=args.n, k=args.k, max_tokens=args.max_tokens, temperature=args.temperature,
+                          profile=args.compile_profile, workers=args.workers, concurrency=args.concurrency)
+    try:
+        report = evaluator.evaluate(records)
+    finally:
+        evaluator.close()
+        executor.close()
+    tmp_path = f"{args.out}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, args.out)
+    print(json.dumps({"model": report["model"], **report["metrics"], "runtime_ratio": report["runtime_ratio"]["median"],
+                      "cache": report["cache"]}))
+
+
+if __name__ == "__main__":
+    main()
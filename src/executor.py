@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Where compile+run jobs execute: in the calling thread, on a local process pool, or on build nodes.
+
+LLM turns are I/O-bound, gfortran/g++ and the test binaries are CPU-bound. An executor exposes the
+toolchain signatures (run_fortran / run_cpp / run_codes / probe_fortran, same arguments as toolchain.py) so the orchestrator
+does not care where a job runs:
+  InlineExecutor       toolchain functions in the caller's thread and sandbox folders (default)
+  LocalPoolExecutor    jobs on a pool of worker processes, each in a private scratch folder
+  RemoteExecutor       jobs POSTed as JSON to one or more `executor.py serve` build nodes
+                       (round-robin, failing over to the next node when one is unreachable)
+
+Specs for make_executor / $F2C_EXECUTOR / --executor:
+  inline | local | local:8 | http://build1:8600,http://build2:8600
+
+Build node (runs arbitrary submitted code: bind it to a trusted network only):
+  python executor.py serve --host 0.0.0.0 --port 8600 --workers 16
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+try:
+    from toolchain import PROBE_THREADS, TIMEOUT_LIMIT, probe_fortran, run_codes, run_cpp_only, run_fortran_only
+except ImportError:
+    from utils.toolchain import PROBE_THREADS, TIMEOUT_LIMIT, probe_fortran, run_codes, run_cpp_only, run_fortran_only
+
+EXECUTOR_ENV = "F2C_EXECUTOR"
+DEFAULT_PORT = 8600
+# Head room over the job's own compile+run timeouts before a remote call is abandoned
+REMOTE_SLACK_SECONDS = 30
+
+
+class ExecutorError(RuntimeError):
+    """A job could not be executed (worker crashed, no build node reachable)."""
+
+
+class InlineExecutor:
+    """Toolchain functions called directly, in the orchestrator's sandbox folders."""
+
+    def run_fortran(self, fortran_folder, fortran_code, timeout_seconds=TIMEOUT_LIMIT, timings=None, profile="default"):
+        return run_fortran_only(fortran_folder, fortran_code, timeout_seconds=timeout_seconds, timings=timings,
+                                profile=profile)
+
+    def run_cpp(self, cpp_folder, cpp_code, timeout_seconds=TIMEOUT_LIMIT, timings=None, profile="default"):
+        return run_cpp_only(cpp_folder, cpp_code, timeout_seconds=timeout_seconds, timings=timings, profile=profile)
+
+    def run_codes(self, fortran_folder, fortran_code, cpp_folder, cpp_code, timeout_seconds=TIMEOUT_LIMIT,
+                  timings=None, profile="default"):
+        return run_codes(fortran_folder, fortran_code, cpp_folder, cpp_code, timeout_seconds=timeout_seconds,
+                         timings=timings, profile=profile)
+
+    def probe_fortran(self, fortran_folder, fortran_code, thread_counts=PROBE_THREADS, timeout_seconds=TIMEOUT_LIMIT,
+                      timings=None, profile="default"):
+        return probe_fortran(fortran_folder, fortran_code, thread_counts=thread_counts,
+                             timeout_seconds=timeout_seconds, timings=timings, profile=profile)
+
+    def close(self):
+        pass
+
+
+def execute_job(job: Dict, scratch_root=None) -> Dict:
+    """
+    Run one job in a private scratch folder (removed afterwards).
+    job: kind ('fortran' | 'cpp' | 'pair' | 'probe'), fortran_code, cpp_code, thread_counts, timeout, profile,
+         submitted (epoch seconds)
+    """
+    started = time.time()
+    scratch = tempfile.mkdtemp(prefix="f2c_job_", dir=scratch_root)
+    timings: Dict[str, float] = {}
+    try:
+        fortran_folder = os.path.join(scratch, "fortran_job")
+        os.makedirs(fortran_folder)
+        if job["kind"] == "fortran":
+            result = run_fortran_only(fortran_folder, job["fortran_code"], timeout_seconds=job["timeout"],
+                                      timings=timings, profile=job["profile"])
+        elif job["kind"] == "cpp":
+            cpp_folder = os.path.join(scratch, "cpp_job")
+            os.makedirs(cpp_folder)
+            result = run_cpp_only(cpp_folder, job["cpp_code"], timeout_seconds=job["timeout"], timings=timings,
+                                  profile=job["profile"])
+        elif job["kind"] == "probe":
+            result = probe_fortran(fortran_folder, job["fortran_code"],
+                                   thread_counts=job.get("thread_counts", PROBE_THREADS),
+                                   timeout_seconds=job["timeout"], timings=timings, profile=job["profile"])
+        else:
+            # 'cpp_' in the folder name keeps the hung-process cleanup in run_codes working
+            cpp_folder = os.path.join(scratch, "cpp_job")
+            os.makedirs(cpp_folder)
+            result = run_codes(fortran_folder, job["fortran_code"], cpp_folder, job["cpp_code"],
+                               timeout_seconds=job["timeout"], timings=timings, profile=job["profile"])
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}", "host": socket.gethostname()}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return {"result": list(result), "timings": timings, "host": socket.gethostname(),
+            "queue_wait": max(started - job.get("submitted", started), 0.0)}
+
+
+class _JobExecutor(ABC):
+    """Turns toolchain calls into job dicts; subclasses deliver them via `_submit`."""
+
+    def run_fortran(self, fortran_folder, fortran_code, timeout_seconds=TIMEOUT_LIMIT, timings=None, profile="default"):
+        return self._run({"kind": "fortran", "fortran_code": fortran_code, "timeout": timeout_seconds,
+                          "profile": profile}, timings)
+
+    def run_cpp(self, cpp_folder, cpp_code, timeout_seconds=TIMEOUT_LIMIT, timings=None, profile="default"):
+        return self._run({"kind": "cpp", "cpp_code": cpp_code, "timeout": timeout_seconds, "profile": profile},
+                         timings)
+
+    def run_codes(self, fortran_folder, fortran_code, cpp_folder, cpp_code, timeout_seconds=TIMEOUT_LIMIT,
+                  timings=None, profile="default"):
+        return self._run({"kind": "pair", "fortran_code": fortran_code, "cpp_code": cpp_code,
+                          "timeout": timeout_seconds, "profile": profile}, timings)
+
+    def probe_fortran(self, fortran_folder, fortran_code, thread_counts=PROBE_THREADS, timeout_seconds=TIMEOUT_LIMIT,
+                      timings=None, profile="default"):
+        return list(self._run({"kind": "probe", "fortran_code": fortran_code, "thread_counts": list(thread_counts),
+                               "timeout": timeout_seconds, "profile": profile}, timings))
+
+    def _run(self, job, timings):
+        reply = self._submit(job)
+        if "error" in reply:
+            raise ExecutorError(f"job failed on {reply.get('host')}: {reply['error']}")
+        if timings is not None:
+            timings.update(reply["timings"])
+            timings["queue_wait"] = reply.get("queue_wait", 0.0)
+        return tuple(reply["result"])
+
+    @abstractmethod
+    def _submit(self, job) -> Dict:
+        """Execute one job dict (see execute_job) and return its reply."""
+
+
+class LocalPoolExecutor(_JobExecutor):
+    """Jobs on `workers` local processes; callers block only on their own job."""
+
+    def __init__(self, workers=None, scratch_root=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.scratch_root = scratch_root
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    def _submit(self, job) -> Dict:
+        job = dict(job, submitted=time.time())
+        with self._lock:
+            self._inflight += 1
+        try:
+            for attempt in range(2):
+                pool = self._pool
+                try:
+                    return pool.submit(execute_job, job, self.scratch_root).result()
+                except BrokenProcessPool as e:
+                    # A worker process died (e.g. OOM-killed) and took the pool with it: replace the pool
+                    # (once, whichever caller gets here first) and resubmit this job once
+                    self._replace_pool(pool)
+                    if attempt:
+                        raise ExecutorError(f"local worker failed twice: {type(e).__name__}: {e}")
+                    logging.warning("[executor] local process pool broke (%s); restarted it, resubmitting", e)
+        except ExecutorError:
+            raise
+        except Exception as e:
+            raise ExecutorError(f"local worker failed: {type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    def _replace_pool(self, broken):
+        with self._lock:
+            if self._pool is not broken:
+                return  # another caller already replaced it
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        broken.shutdown(wait=False)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+class RemoteExecutor(_JobExecutor):
+    """Jobs POSTed to build nodes running `executor.py serve`, round-robin with failover."""
+
+    def __init__(self, urls: List[str]):
+        if not urls:
+            raise ValueError("RemoteExecutor needs at least one build node URL")
+        self.urls = [u.rstrip("/") for u in urls]
+        self._next = itertools.cycle(range(len(self.urls)))
+        self._lock = threading.Lock()
+
+    def _submit(self, job) -> Dict:
+        with self._lock:
+            first = next(self._next)
+        body = json.dumps(job).encode("utf-8")
+        # run_codes compiles and runs twice, a probe runs once per thread count; each step bounded by the timeout
+        timeout = max(4, 1 + len(job.get("thread_counts", ()))) * job["timeout"] + REMOTE_SLACK_SECONDS
+        errors = []
+        for k in range(len(self.urls)):
+            url = self.urls[(first + k) % len(self.urls)]
+            request = urllib.request.Request(f"{url}/run", data=body, headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    return json.loads(response.read())
+            except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+                logging.warning("[executor] %s unreachable (%s); trying next node", url, e)
+                errors.append(f"{url}: {e}")
+        raise ExecutorError("no build node reachable: " + "; ".join(errors))
+
+    def close(self):
+        pass
+
+
+def make_executor(spec: Optional[str]):
+    """Executor for a spec string (see module docstring); empty / 'inline' -> InlineExecutor."""
+    spec = (spec or "inline").strip()
+    if spec == "inline":
+        return InlineExecutor()
+    if spec == "local" or spec.startswith("local:"):
+        workers = int(spec.split(":", 1)[1]) if ":" in spec else None
+        return LocalPoolExecutor(workers)
+    if spec.startswith(("http://", "https://")):
+        return RemoteExecutor([u for u in spec.split(",") if u.strip()])
+    raise ValueError(f"unknown executor spec {spec!r} (inline | local[:N] | http://host:port[,...])")
+
+
+_default_executor = None
+_default_lock = threading.Lock()
+
+
+def default_executor():
+    """Process-wide executor built from $F2C_EXECUTOR (inline when unset)."""
+    global _default_executor
+    with _default_lock:
+        if _default_executor is None:
+            _default_executor = make_executor(os.getenv(EXECUTOR_ENV))
+        return _default_executor
+
+
+def make_server(pool: LocalPoolExecutor, host="127.0.0.1", port=DEFAULT_PORT) -> ThreadingHTTPServer:
+    """HTTP build node: POST /run executes one job on `pool`, GET /health reports load."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/health":
+                self._send(200, {"ok": True, "host": socket.gethostname(), "workers": pool.workers,
+                                 "inflight": pool.inflight})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/run":
+                self._send(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length) or b"{}")
+            if job.get("kind") not in ("fortran", "cpp", "pair", "probe"):
+                self._send(400, {"error": f"bad job kind {job.get('kind')!r}"})
+                return
+            job.setdefault("timeout", TIMEOUT_LIMIT)
+            job.setdefault("profile", "default")
+            try:
+                self._send(200, pool._submit(job))
+            except ExecutorError as e:
+                self._send(200, {"error": str(e), "host": socket.gethostname()})
+
+        def log_message(self, fmt, *args):
+            logging.debug("[executor] " + fmt, *args)
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile/run build node for the F2C pipeline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="execute jobs POSTed by RemoteExecutor")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    serve.add_argument("--scratch", default=None, help="parent folder of the per-job scratch folders")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pool = LocalPoolExecutor(args.workers, args.scratch)
+    server = make_server(pool, args.host, args.port)
+    logging.info("[executor] serving on http://%s:%d with %d workers", args.host, args.port, pool.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Export generated corpora (data/f2c_code_pair_*.jsonl, data/f2c_dialogue_*.json) to Parquet or
+Arrow IPC shards for fast SFT ingestion.
+
+Each row carries the sharegpt-style `messages` plus precomputed columns:
+  id, source, messages, roles, n_messages, char_lengths, total_chars, message_sha256, sample_sha256
+and, per requested tokenizer, `input_ids__<alias>` / `n_tokens__<alias>` (chat template applied).
+
+The output directory gets `manifest.json` (shards, row counts, columns) and a `dataset_info.json`
+entry so LLaMA-Factory can load the shards directly instead of re-tokenizing JSON every run.
+
+Requires pyarrow; pre-tokenized columns additionally require transformers.
+
+Example:
+  python export_arrow.py ../data/f2c_dialogue_train.json --out ../data/arrow/f2cpp_dialogue_train \\
+      --tokenizer Qwen/Qwen2.5-Coder-7B-Instruct
+"""
+import argparse
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+try:
+    from dialogue_store import iter_records, message_digests, sample_digest
+except ImportError:
+    from utils.dialogue_store import iter_records, message_digests, sample_digest
+
+DEFAULT_ROWS_PER_SHARD = 2000
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise SystemExit("pyarrow is required for Arrow/Parquet export: pip install pyarrow")
+    return pyarrow
+
+
+def tokenizer_alias(name_or_path) -> str:
+    """Column-safe alias, e.g. 'Qwen/Qwen2.5-Coder-7B-Instruct' -> 'qwen2_5_coder_7b_instruct'."""
+    base = name_or_path.rstrip("/").split("/")[-1].lower()
+    return re.sub(r"[^a-z0-9]+", "_", base).strip("_")
+
+
+def load_tokenizers(names) -> Dict[str, object]:
+    if not names:
+        return {}
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        raise SystemExit("transformers is required for pre-tokenized columns: pip install transformers")
+    return {tokenizer_alias(n): AutoTokenizer.from_pretrained(n, trust_remote_code=True) for n in names}
+
+
+def tokenize_messages(tokenizer, messages) -> List[int]:
+    """Token ids of the whole conversation with the model's chat template (plain join as fallback)."""
+    if getattr(tokenizer, "chat_template", None):
+        return list(tokenizer.apply_chat_template(messages, tokenize=True))
+    text = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    return tokenizer(text)["input_ids"]
+
+
+def record_row(record, position, source, tokenizers=None) -> Dict:
+    messages = [{"role": m["role"], "content": m["content"] or ""} for m in record["messages"]]
+    message_sha = message_digests(messages)
+    sample_sha = sample_digest(messages, message_sha)
+    char_lengths = [len(m["content"]) for m in messages]
+    row = {
+        "id": str(record.get("id", position)),
+        "source": source,
+        "messages": messages,
+        "roles": [m["role"] for m in messages],
+        "n_messages": len(messages),
+        "char_lengths": char_lengths,
+        "total_chars": sum(char_lengths),
+        "message_sha256": message_sha,
+        "sample_sha256": sample_sha,
+    }
+    for alias, tokenizer in (tokenizers or {}).items():
+        ids = tokenize_messages(tokenizer, messages)
+        row[f"input_ids__{alias}"] = ids
+        row[f"n_tokens__{alias}"] = len(ids)
+    return row
+
+
+def _schema(pa, token_aliases):
+    fields = [
+        ("id", pa.string()),
+        ("source", pa.string()),
+        ("messages", pa.list_(pa.struct([("role", pa.string()), ("content", pa.large_string())]))),
+        ("roles", pa.list_(pa.string())),
+        ("n_messages", pa.int32()),
+        ("char_lengths", pa.list_(pa.int32())),
+        ("total_chars", pa.int64()),
+        ("message_sha256", pa.list_(pa.string())),
+        ("sample_sha256", pa.string()),
+    ]
+    for alias in token_aliases:
+        fields.append((f"input_ids__{alias}", pa.list_(pa.int32())))
+        fields.append((f"n_tokens__{alias}", pa.int32()))
+    return pa.schema(fields)
+
+
+def _write_shard(pa, schema, rows, path, fmt):
+    table = pa.Table.from_pylist(rows, schema=schema)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, compression="zstd")
+    else:
+        import pyarrow.ipc as ipc
+        with pa.OSFile(path, "wb") as sink, ipc.new_file(sink, schema) as writer:
+            writer.write_table(table)
+
+
+def export_corpus(src_path, out_dir, fmt="parquet", rows_per_shard=DEFAULT_ROWS_PER_SHARD,
+                  tokenizer_names=(), dataset_name=None) -> Dict:
+    """Stream `src_path` into shards under `out_dir`; returns the manifest."""
+    pa = _require_pyarrow()
+    tokenizers = load_tokenizers(tokenizer_names)
+    schema = _schema(pa, list(tokenizers))
+    dataset_name = dataset_name or os.path.basename(os.path.normpath(out_dir))
+    ext = "parquet" if fmt == "parquet" else "arrow"
+    source = os.path.basename(src_path)
+    os.makedirs(out_dir, exist_ok=True)
+
+    shards, rows = [], []
+
+    def flush():
+        path = os.path.join(out_dir, f"{dataset_name}-{len(shards):05d}.{ext}")
+        _write_shard(pa, schema, rows, path, fmt)
+        shards.append({"file": os.path.basename(path), "rows": len(rows)})
+        rows.clear()
+
+    for position, record in enumerate(iter_records(src_path)):
+        rows.append(record_row(record, position, source, tokenizers))
+        if len(rows) >= rows_per_shard:
+            flush()
+    if rows or not shards:
+        flush()
+
+    manifest = {
+        "dataset": dataset_name,
+        "source": source,
+        "format": fmt,
+        "rows": sum(s["rows"] for s in shards),
+        "shards": shards,
+        "columns": schema.names,
+        "tokenizers": {tokenizer_alias(n): n for n in tokenizer_names},
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    with open(os.path.join(out_dir, "dataset_info.json"), "w", encoding="utf-8") as f:
+        json.dump(llamafactory_dataset_info(dataset_name, out_dir), f, indent=2)
+    return manifest
+
+
+def llamafactory_dataset_info(dataset_name, out_dir) -> Dict:
+    """dataset_info.json entry pointing LLaMA-Factory at the shard directory (sharegpt format)."""
+    return {
+        dataset_name: {
+            "file_name": os.path.abspath(out_dir),
+            "formatting": "sharegpt",
+            "columns": {"messages": "messages"},
+            "tags": {"role_tag": "role", "content_tag": "content", "user_tag": "user",
+                     "assistant_tag": "assistant", "system_tag": "system"},
+        }
+    }
+
+
+def load_shards(out_dir, columns: Optional[List[str]] = None):
+    """Load an exported directory as one pyarrow Table (Arrow IPC shards are memory-mapped)."""
+    pa = _require_pyarrow()
+    with open(os.path.join(out_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    tables = []
+    for shard in manifest["shards"]:
+        path = os.path.join(out_dir, shard["file"])
+        if manifest["format"] == "parquet":
+            import pyarrow.parquet as pq
+            tables.append(pq.read_table(path, columns=columns, memory_map=True))
+        else:
+            import pyarrow.ipc as ipc
+            table = ipc.open_file(pa.memory_map(path, "r")).read_all()
+            tables.append(table.select(columns) if columns else table)
+    return pa.concat_tables(tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export code-pair / dialogue corpora to Parquet or Arrow shards.")
+    parser.add_argument("src", nargs="+", help="data/f2c_code_pair_*.jsonl or data/f2c_dialogue_*.json")
+    parser.add_argument("--out", required=True,
+                        help="output directory (one sub-directory per source when several are given)")
+    parser.add_argument("--format", choices=("parquet", "arrow"), default="parquet")
+    parser.add_argument("--rows-per-shard", type=int, default=DEFAULT_ROWS_PER_SHARD)
+    parser.add_argument("--tokenizer", action="append", default=[],
+                        help="HF tokenizer name/path for pre-tokenized columns (repeatable)")
+    args = parser.parse_args()
+
+    for src in args.src:
+        out_dir = args.out
+        if len(args.src) > 1:
+            out_dir = os.path.join(args.out, os.path.splitext(os.path.basename(src))[0])
+        manifest = export_corpus(src, out_dir, args.format, args.rows_per_shard, args.tokenizer)
+        print(f"{src}: {manifest['rows']} rows in {len(manifest['shards'])} shard(s) -> {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent memo of verified translations, keyed by the normalized Fortran input.
+
+Corpora contain the same program many times over, differing only in comments and whitespace.
+After a successful run the orchestrator stores, under sha256(normalize_source(input, 'fortran')):
+  source             that normalized input (comments and blank runs dropped, string literals and
+                     code kept exactly); a hit requires it to equal the new input's, so a digest
+                     match alone never hands one program's pair to another
+  fortran_baseline   the validated Phase A testbench
+  cpp_code           the verified C++ translation
+  fortran_stdout / cpp_stdout   the outputs of the verifying run
+  history            the conversation that produced them
+  perf               the runtime profile, when one was taken
+On a later hit AgentOrchestrator.run compiles and runs the stored pair once (usually two build-cache
+hits), checks the outputs against each other and against the stored baseline output (volatile
+fields masked as in Phase B), and returns the stored conversation without any LLM call. A pair
+that no longer verifies (e.g. after a compiler upgrade) is dropped and the sample runs normally.
+
+The store is one SQLite file (WAL mode), safe to share between runner workers and shards on one
+machine. Enable with AgentOrchestrator(memo_store=MemoStore(path)), $F2C_MEMO_STORE or
+`runner.py run --memo path`.
+
+Example:
+  python memo_store.py stats --db ../runs/memo.sqlite
+  python memo_store.py import --db ../runs/memo.sqlite --pairs ../data/f2c_code_pair_train_dataset.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    from dialogue_store import iter_records
+    from text_utils import normalize_source
+except ImportError:
+    from utils.dialogue_store import iter_records
+    from utils.text_utils import normalize_source
+
+MEMO_ENV = "F2C_MEMO_STORE"
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memo (
+    key TEXT PRIMARY KEY,
+    source TEXT,
+    fortran_baseline TEXT NOT NULL,
+    cpp_code TEXT NOT NULL,
+    fortran_stdout TEXT,
+    cpp_stdout TEXT,
+    history TEXT,
+    perf TEXT,
+    model TEXT,
+    created REAL,
+    hits INTEGER DEFAULT 0
+)
+"""
+_FIELDS = ("fortran_baseline", "cpp_code", "fortran_stdout", "cpp_stdout", "history", "perf", "model")
+
+
+def memo_source(fortran_code) -> str:
+    """The input program as memoized: Fortran comments, blank lines and blank runs outside literals dropped."""
+    return normalize_source(fortran_code, "fortran")
+
+
+def _digest(source) -> str:
+    return hashlib.sha256(source.encode("utf-8", "replace")).hexdigest()
+
+
+def memo_key(fortran_code) -> str:
+    """Hash of memo_source(fortran_code)."""
+    return _digest(memo_source(fortran_code))
+
+
+class MemoStore:
+    """Verified pairs in one SQLite file; a short-lived connection per operation."""
+
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(_SCHEMA)
+            if "source" not in {row[1] for row in db.execute("PRAGMA table_info(memo)")}:
+                # Stores created before the column: their rows have no source and never hit
+                db.execute("ALTER TABLE memo ADD COLUMN source TEXT")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:  # commit on success, roll back on error
+                yield db
+        finally:
+            db.close()
+
+    def get(self, fortran_code) -> Optional[Dict]:
+        """
+        Stored entry for a program (history / perf decoded), or None. An entry whose stored source
+        differs from the program's normalized source is a miss, not a hit.
+        """
+        source = memo_source(fortran_code)
+        with self._connect() as db:
+            row = db.execute(f"SELECT key, source, {', '.join(_FIELDS)}, hits FROM memo WHERE key = ?",
+                             (_digest(source),)).fetchone()
+        if row is None or row[1] != source:
+            return None
+        entry = dict(zip(("key", "source") + _FIELDS + ("hits",), row))
+        entry["history"] = json.loads(entry["history"]) if entry["history"] else []
+        entry["perf"] = json.loads(entry["perf"]) if entry["perf"] else None
+        return entry
+
+    def put(self, fortran_code, fortran_baseline, cpp_code, fortran_stdout="", cpp_stdout="", history=None,
+            perf=None, model=None):
+        """Store (or replace) the verified pair of a program."""
+        source = memo_source(fortran_code)
+        values = (_digest(source), source, fortran_baseline, cpp_code, fortran_stdout, cpp_stdout,
+                  json.dumps(history or [], ensure_ascii=False), json.dumps(perf) if perf is not None else None,
+                  model, time.time())
+        with self._connect() as db:
+            db.execute(f"INSERT OR REPLACE INTO memo (key, source, {', '.join(_FIELDS)}, created) "
+                       f"VALUES ({', '.join('?' * len(values))})", values)
+
+    def hit(self, key):
+        with self._connect() as db:
+            db.execute("UPDATE memo SET hits = hits + 1 WHERE key = ?", (key,))
+
+    def drop(self, key):
+        with self._connect() as db:
+            db.execute("DELETE FROM memo WHERE key = ?", (key,))
+
+    def stats(self) -> Dict:
+        with self._connect() as db:
+            entries, hits = db.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM memo").fetchone()
+        return {"entries": entries, "hits": hits}
+
+
+_stores: Dict[str, MemoStore] = {}
+_stores_lock = threading.Lock()
+
+
+def default_memo_store() -> Optional[MemoStore]:
+    """Store at $F2C_MEMO_STORE; None when the variable is unset (memoization is opt-in)."""
+    path = os.getenv(MEMO_ENV)
+    if not path:
+        return None
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = MemoStore(path)
+        return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memo store of verified Fortran/C++ translations.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    stats = sub.add_parser("stats", help="number of entries and hits")
+    stats.add_argument("--db", required=True)
+    imp = sub.add_parser("import", help="seed the store from a code-pair JSON/JSONL (verified on first hit)")
+    imp.add_argument("--db", required=True)
+    imp.add_argument("--pairs", required=True)
+    args = parser.parse_args()
+
+    store = MemoStore(args.db)
+    if args.command == "import":
+        count = 0
+        for record in iter_records(args.pairs):
+            if record.get("fortran_code") and record.get("cpp_code"):
+                # The pair's Fortran program is its own validated testbench
+                store.put(record["fortran_code"], record["fortran_code"], record["cpp_code"],
+                          history=record.get("messages"))
+                count += 1
+        print(f"{count} pairs imported into {args.db}")
+    print(json.dumps(store.stats()))
+
+
+if __name__ == "__main__":
+    main()
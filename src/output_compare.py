@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Programmatic comparison of Fortran and C++ program outputs.
+
+Tried in order, cheapest first; the first that succeeds names the comparison method:
+  - exact:      identical after stripping leading/trailing whitespace
+  - whitespace: identical token sequences (spacing / line breaks ignored)
+  - numeric:    same token count, numeric tokens equal within tolerance
+                (Fortran exponent letters such as 1.0D+00 are accepted)
+
+Timings, thread counts and other run-dependent numbers never match between two programs.
+VolatileMask.detect compares several runs of the same (Fortran) program and records
+  fields  numbers that differ beyond tolerance, by line skeleton (the line with numbers as '#')
+          and token position ("Parallel time: 0.013" -> "Parallel time : <volatile>")
+  lines   skeletons whose number of occurrences differs (e.g. one "Hello from thread #" per thread)
+and mask.apply() rewrites any output, Fortran or C++, before the usual comparison.
+"""
+import math
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+NUMBER_RE = re.compile(r"^[+-]?(?:\d+\.?\d*|\.\d+)(?:[eEdD][+-]?\d+)?$")
+TOKEN_RE = re.compile(r"[,;:=()\[\]]|[^\s,;:=()\[\]]+")
+REL_TOL = 1e-6
+ABS_TOL = 1e-9
+VOLATILE = "<volatile>"
+
+
+def _to_float(token) -> Optional[float]:
+    if not NUMBER_RE.match(token):
+        return None
+    try:
+        return float(token.replace("D", "E").replace("d", "e"))
+    except ValueError:
+        return None
+
+
+def tokenize_output(text) -> List[str]:
+    """Whitespace tokens with trailing punctuation separated (e.g. 'sum:' -> 'sum', ':')."""
+    return TOKEN_RE.findall(text or "")
+
+
+def numeric_tokens_match(a_tokens, b_tokens, rel_tol=REL_TOL, abs_tol=ABS_TOL) -> bool:
+    if len(a_tokens) != len(b_tokens):
+        return False
+    for a, b in zip(a_tokens, b_tokens):
+        if a == b:
+            continue
+        fa, fb = _to_float(a), _to_float(b)
+        if fa is None or fb is None:
+            if a.lower() != b.lower():
+                return False
+            continue
+        if not math.isclose(fa, fb, rel_tol=rel_tol, abs_tol=abs_tol):
+            return False
+    return True
+
+
+def programmatic_output_compare(fortran_stdout, cpp_stdout, rel_tol=REL_TOL, abs_tol=ABS_TOL) -> Tuple[bool, str]:
+    """
+    Returns: (equivalent, method) where method is one of 'exact', 'whitespace', 'numeric' or '' on mismatch.
+    """
+    f_out, c_out = (fortran_stdout or "").strip(), (cpp_stdout or "").strip()
+    if f_out == c_out:
+        return True, "exact"
+    if f_out.split() == c_out.split():
+        return True, "whitespace"
+    f_tokens, c_tokens = tokenize_output(f_out), tokenize_output(c_out)
+    if f_tokens == c_tokens:
+        return True, "whitespace"
+    if numeric_tokens_match(f_tokens, c_tokens, rel_tol, abs_tol):
+        return True, "numeric"
+    return False, ""
+
+
+def _skeleton(tokens) -> str:
+    return " ".join("#" if _to_float(t) is not None else t for t in tokens)
+
+
+def _lines(text) -> List[List[str]]:
+    return [tokenize_output(line) for line in (text or "").strip().splitlines() if line.strip()]
+
+
+class VolatileMask:
+    """Output fields that change between runs of one program; masked before comparing outputs."""
+
+    def __init__(self, fields: Optional[Dict[str, Iterable[int]]] = None, lines: Iterable[str] = ()):
+        self.fields = {skeleton: frozenset(positions) for skeleton, positions in (fields or {}).items()}
+        self.lines = frozenset(lines)
+
+    def __bool__(self):
+        return bool(self.fields or self.lines)
+
+    def __repr__(self):
+        return f"VolatileMask(fields={sorted(self.fields)}, lines={sorted(self.lines)})"
+
+    @classmethod
+    def detect(cls, outputs, rel_tol=REL_TOL, abs_tol=ABS_TOL) -> "VolatileMask":
+        """Mask of the fields that differ between `outputs` (stdout of repeated runs)."""
+        runs = []
+        for text in outputs:
+            by_skeleton: Dict[str, List[List[str]]] = {}
+            for tokens in _lines(text):
+                by_skeleton.setdefault(_skeleton(tokens), []).append(tokens)
+            runs.append(by_skeleton)
+        if len(runs) < 2:
+            return cls()
+        skeletons = set().union(*runs)
+        lines = {sk for sk in skeletons if len({len(run.get(sk, ())) for run in runs}) > 1}
+        fields: Dict[str, set] = {}
+        for sk in skeletons - lines:
+            # Same number of occurrences in every run: compare the k-th occurrences position by position
+            for variants in zip(*(run[sk] for run in runs)):
+                for pos, token in enumerate(variants[0]):
+                    first = _to_float(token)
+                    if first is None:
+                        continue
+                    if any(not math.isclose(first, _to_float(v[pos]), rel_tol=rel_tol, abs_tol=abs_tol)
+                           for v in variants[1:]):
+                        fields.setdefault(sk, set()).add(pos)
+        return cls(fields, lines)
+
+    def apply(self, text) -> str:
+        """`text` with volatile lines dropped and volatile numbers replaced by VOLATILE."""
+        if not self:
+            return text
+        out = []
+        for line in (text or "").splitlines():
+            tokens = tokenize_output(line)
+            skeleton = _skeleton(tokens)
+            if skeleton in self.lines:
+                continue
+            positions = self.fields.get(skeleton)
+            if positions:
+                line = " ".join(VOLATILE if i in positions else t for i, t in enumerate(tokens))
+            out.append(line)
+        return "\n".join(out)
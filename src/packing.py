@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Packing plan and length-bucketed shards for code-pair / dialogue SFT data.
+
+The configs in sft/configs train with `packing: true` and `neat_packing: true`: LLaMA-Factory packs
+the tokenized samples into cutoff_len sequences itself and keeps per-sample attention boundaries
+(no cross-sample attention, positions restarting per sample). This tool does not write packed
+sequences of its own; for one dataset and cutoff it
+  - estimates what that packing buys: best-fit-decreasing bins (deterministic, ties broken by id)
+    give the number of packed sequences, samples per sequence and fill ratio, i.e. how many fewer
+    sequences (optimizer micro-steps at per_device_train_batch_size 1) an epoch takes
+  - writes the samples that fit the cutoff as length-bucketed sharegpt shards,
+    buckets/le<B>/shard-NNNNN.jsonl, plus a dataset_info.json with one `<name>_le<B>` entry per
+    bucket, for unpacked runs that should batch similar lengths together
+
+Input records need `messages`; an `n_tokens` field (as written by token_lengths.py) is used when
+present, otherwise lengths are measured with `--tokenizer` (chat template applied), or estimated
+at ~4 chars/token with `--approx`.
+
+Example:
+  python packing.py ../data/f2c_dialogue_train.json --cutoff 8192 \\
+      --tokenizer Qwen/Qwen2.5-Coder-7B-Instruct --out ../data/packed/f2cpp_dialogue_train
+"""
+import argparse
+import bisect
+import json
+import os
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    from dialogue_store import iter_records, sample_digest
+    from export_arrow import llamafactory_dataset_info
+    from token_lengths import APPROX_TOKENIZER, BUCKET_BOUNDS, bucket_of, measure
+except ImportError:
+    from utils.dialogue_store import iter_records, sample_digest
+    from utils.export_arrow import llamafactory_dataset_info
+    from utils.token_lengths import APPROX_TOKENIZER, BUCKET_BOUNDS, bucket_of, measure
+
+DEFAULT_SHARD_ROWS = 1000
+
+
+def pack_lengths(items: Sequence[Tuple[str, int]], capacity: int) -> Tuple[List[List[Tuple[str, int]]], List[str]]:
+    """
+    Best-fit-decreasing bin packing of (id, length) items into bins of `capacity`.
+    Returns (bins, oversized_ids); each bin lists its items in placement order.
+    """
+    order = sorted(items, key=lambda x: (-x[1], str(x[0])))
+    bins: List[List[Tuple[str, int]]] = []
+    # Sorted (remaining capacity, bin index) for O(log n) best-fit lookups
+    free: List[Tuple[int, int]] = []
+    oversized = []
+    for item_id, n in order:
+        if n > capacity:
+            oversized.append(item_id)
+            continue
+        pos = bisect.bisect_left(free, (n, -1))
+        if pos < len(free):
+            remaining, b = free.pop(pos)
+            bins[b].append((item_id, n))
+            bisect.insort(free, (remaining - n, b))
+        else:
+            bins.append([(item_id, n)])
+            bisect.insort(free, (capacity - n, len(bins) - 1))
+    return bins, oversized
+
+
+class ShardWriter:
+    """JSONL writer that rolls over to a new `<prefix>-NNNNN.jsonl` every `rows` rows."""
+
+    def __init__(self, out_dir, prefix, rows=DEFAULT_SHARD_ROWS):
+        self.out_dir, self.prefix, self.rows = out_dir, prefix, rows
+        self.files: List[Dict] = []
+        self._f = None
+        self._count = 0
+
+    def write(self, record):
+        if self._f is None or self._count >= self.rows:
+            self.close()
+            path = os.path.join(self.out_dir, f"{self.prefix}-{len(self.files):05d}.jsonl")
+            self._f = open(path, "w", encoding="utf-8")
+            self.files.append({"file": os.path.relpath(path, self.out_dir), "rows": 0})
+            self._count = 0
+        self._f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._count += 1
+        self.files[-1]["rows"] += 1
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def build(src_path, out_dir, cutoff, tokenizer_name=None, shard_rows=DEFAULT_SHARD_ROWS, workers=1,
+          dataset_name=None) -> Dict:
+    records: Dict[str, Dict] = {}
+    for position, r in enumerate(iter_records(src_path)):
+        records[str(r.get("id", position))] = r
+
+    tokenizer_name = tokenizer_name or APPROX_TOKENIZER
+    lengths = {sid: r["n_tokens"] for sid, r in records.items() if "n_tokens" in r}
+    missing = {sid: r for sid, r in records.items() if sid not in lengths}
+    if missing:
+        digests = {sid: sample_digest(r["messages"]) for sid, r in missing.items()}
+        stats = measure(tokenizer_name, {digests[sid]: r["messages"] for sid, r in missing.items()}, [cutoff],
+                        {}, workers)
+        lengths.update({sid: stats[digests[sid]]["total"] for sid in missing})
+
+    bins, oversized = pack_lengths(sorted(lengths.items()), cutoff)
+
+    dataset_name = dataset_name or os.path.basename(os.path.normpath(out_dir))
+    bucket_writers: Dict[int, ShardWriter] = {}
+    for sid in sorted(lengths, key=lambda s: (lengths[s], s)):
+        if lengths[sid] > cutoff:
+            continue
+        b = bucket_of(lengths[sid])
+        if b not in bucket_writers:
+            folder = os.path.join(out_dir, "buckets", f"le{b}")
+            os.makedirs(folder, exist_ok=True)
+            bucket_writers[b] = ShardWriter(folder, "shard", shard_rows)
+        bucket_writers[b].write({**records[sid], "n_tokens": lengths[sid]})
+    dataset_info = {}
+    for b, w in sorted(bucket_writers.items()):
+        w.close()
+        dataset_info.update(llamafactory_dataset_info(f"{dataset_name}_le{b}", w.out_dir))
+
+    fitting = len(records) - len(oversized)
+    total_tokens = sum(n for members in bins for _, n in members)
+    manifest = {
+        "source": os.path.basename(src_path),
+        "cutoff": cutoff,
+        "tokenizer": tokenizer_name,
+        "samples": len(records),
+        "oversized_skipped": oversized,
+        "packs": len(bins),
+        "samples_per_pack": round(fitting / max(len(bins), 1), 3),
+        "sequence_reduction": round(1 - len(bins) / max(fitting, 1), 4),
+        "fill_ratio": round(total_tokens / max(len(bins) * cutoff, 1), 4),
+        "bucket_bounds": list(BUCKET_BOUNDS),
+        "bucket_shards": {str(b): [{**f, "file": os.path.join("buckets", f"le{b}", f["file"])} for f in w.files]
+                          for b, w in sorted(bucket_writers.items())},
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    with open(os.path.join(out_dir, "dataset_info.json"), "w", encoding="utf-8") as f:
+        json.dump(dataset_info, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Packing plan and length-bucketed LLaMA-Factory shards.")
+    parser.add_argument("src", help="JSONL / JSON array of records with `messages` (optionally `n_tokens`)")
+    parser.add_argument("--cutoff", type=int, required=True, help="cutoff_len of the target config")
+    parser.add_argument("--tokenizer", default=None, help="HF tokenizer used to measure missing lengths")
+    parser.add_argument("--approx", action="store_true", help="estimate missing lengths (~4 chars/token)")
+    parser.add_argument("--name", default=None, help="dataset_info name prefix (default: --out basename)")
+    parser.add_argument("--shard-rows", type=int, default=DEFAULT_SHARD_ROWS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    manifest = build(args.src, args.out, args.cutoff, None if args.approx else args.tokenizer,
+                     args.shard_rows, args.workers, args.name)
+    print(f"{manifest['samples']} samples -> {manifest['packs']} packed sequences at cutoff {manifest['cutoff']} "
+          f"({manifest['samples_per_pack']} samples/sequence, {manifest['sequence_reduction']:.1%} fewer, "
+          f"fill {manifest['fill_ratio']:.1%}), {len(manifest['oversized_skipped'])} over cutoff skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Patch-mode repair replies: apply a model's edit to the program the orchestrator holds.
+
+Two reply formats are understood (PATCH_MODE_RULE in the prompt module asks for either):
+  unified diff      a ```diff (or ```patch) block with @@ hunks against the current program
+  search/replace    one or more blocks
+                        <<<<<<< SEARCH
+                        lines copied from the current program
+                        =======
+                        their replacement
+                        >>>>>>> REPLACE
+                    (bare or inside any fence)
+
+Hunks and SEARCH texts are located by their content, not by line numbers: exact match first,
+then ignoring trailing whitespace, then ignoring indentation. A hunk whose context is missing or
+ambiguous raises PatchError and the orchestrator falls back to asking for the full program.
+
+Example:
+  new_code = apply_patch_reply(old_code, reply)   # None when the reply carries no patch
+"""
+import re
+from typing import List, Optional, Tuple
+
+try:
+    from text_utils import scan_fences
+except ImportError:
+    from utils.text_utils import scan_fences
+
+DIFF_LANGS = ("diff", "patch", "udiff")
+SEARCH_MARK = "<<<<<<< SEARCH"
+DIVIDER = "======="
+REPLACE_MARK = ">>>>>>> REPLACE"
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+
+class PatchError(ValueError):
+    """The reply is a patch, but it does not apply to the current program."""
+
+
+def _normalizers():
+    return (lambda line: line, lambda line: line.rstrip(), lambda line: line.strip())
+
+
+def _find_block(lines: List[str], block: List[str], hint=0) -> int:
+    """Start index of `block` in `lines` (closest to `hint` when it occurs more than once)."""
+    if not block:
+        raise PatchError("empty search block")
+    for norm in _normalizers():
+        target = [norm(line) for line in block]
+        first = target[0]
+        starts = [i for i in range(len(lines) - len(block) + 1)
+                  if norm(lines[i]) == first and [norm(line) for line in lines[i:i + len(block)]] == target]
+        if len(starts) == 1:
+            return starts[0]
+        if len(starts) > 1:
+            if hint is None:
+                raise PatchError(f"search block matches {len(starts)} places: {block[0].strip()!r}")
+            return min(starts, key=lambda i: abs(i - hint))
+    raise PatchError(f"context not found: {block[0].strip()!r}")
+
+
+def parse_search_replace(text: str) -> List[Tuple[str, str]]:
+    """(search, replace) texts of every SEARCH/REPLACE block in `text`, newline-terminated."""
+    blocks, search, replace, state = [], [], [], None
+    for line in text.splitlines():
+        marker = line.strip()
+        if marker == SEARCH_MARK:
+            state, search, replace = "search", [], []
+        elif marker == DIVIDER and state == "search":
+            state = "replace"
+        elif marker == REPLACE_MARK and state == "replace":
+            blocks.append(("".join(f"{s}\n" for s in search), "".join(f"{r}\n" for r in replace)))
+            state = None
+        elif state == "search":
+            search.append(line)
+        elif state == "replace":
+            replace.append(line)
+    if state is not None:
+        raise PatchError("unterminated SEARCH/REPLACE block")
+    return blocks
+
+
+def apply_search_replace(source: str, blocks: List[Tuple[str, str]]) -> str:
+    """Apply blocks in order; each SEARCH text must occur exactly once."""
+    for search, replace in blocks:
+        # Fast path: the SEARCH text occurs once, starting at a line boundary
+        if search and ("\n" + source).count("\n" + search) == 1:
+            at = ("\n" + source).find("\n" + search)
+            source = source[:at] + replace + source[at + len(search):]
+            continue
+        lines = source.splitlines(keepends=True)
+        block = search.splitlines()
+        start = _find_block([line.rstrip("\n") for line in lines], block, hint=None)
+        source = "".join(lines[:start]) + replace + "".join(lines[start + len(block):])
+    return source
+
+
+def parse_unified_diff(text: str) -> List[Tuple[int, List[str], List[str]]]:
+    """Hunks as (old start line, old lines, new lines); file headers are ignored."""
+    hunks, current = [], None
+    for line in text.splitlines():
+        m = _HUNK_RE.match(line)
+        if m:
+            current = (int(m.group(1)), [], [])
+            hunks.append(current)
+            continue
+        if current is None or line.startswith(("--- ", "+++ ", "\\")):
+            continue
+        tag, body = (line[0], line[1:]) if line else (" ", "")
+        if tag == " ":
+            current[1].append(body)
+            current[2].append(body)
+        elif tag == "-":
+            current[1].append(body)
+        elif tag == "+":
+            current[2].append(body)
+        else:
+            # Models drop the leading space of context lines now and then
+            current[1].append(line)
+            current[2].append(line)
+    if not hunks:
+        raise PatchError("diff has no @@ hunks")
+    return hunks
+
+
+def apply_unified_diff(source: str, diff: str) -> str:
+    """Apply hunks top to bottom, each located by its old lines near the stated line number."""
+    lines = source.splitlines()
+    offset = 0
+    for old_start, old, new in parse_unified_diff(diff):
+        if old:
+            start = _find_block(lines, old, hint=max(old_start - 1 + offset, 0))
+        else:
+            start = min(max(old_start + offset, 0), len(lines))
+        lines[start:start + len(old)] = new
+        offset += len(new) - len(old)
+    return "\n".join(lines) + ("\n" if source.endswith("\n") else "")
+
+
+def find_patch(reply: str) -> Optional[Tuple[str, str]]:
+    """('diff', text) or ('search_replace', text) when the reply carries a patch, else None."""
+    if not reply:
+        return None
+    if SEARCH_MARK in reply:
+        return "search_replace", reply
+    for lang, body in scan_fences(reply):
+        head = body.lstrip()
+        if lang.lower() in DIFF_LANGS or _HUNK_RE.match(head) or head.startswith("--- "):
+            return "diff", body
+    return None
+
+
+def apply_patch_reply(source: str, reply: str) -> Optional[str]:
+    """
+    Patched program, or None when `reply` is not a patch (a full-program reply).
+    Raises PatchError when it is a patch that does not apply.
+    """
+    patch = find_patch(reply)
+    if patch is None:
+        return None
+    kind, text = patch
+    if kind == "search_replace":
+        return apply_search_replace(source, parse_search_replace(text))
+    return apply_unified_diff(source, text)
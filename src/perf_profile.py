@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Runtime profile of a verified Fortran/C++ pair: is the translation fast, not just correct?
+
+Both programs are built at every level of `levels` (COMPILE_PROFILES entries, default O2 and O3,
+through the toolchain build cache) and each binary is run `warmup` times unmeasured, then
+`repeats` times measured. Per binary and level:
+  wall_median / wall_min / wall_stdev   seconds, CLOCK_MONOTONIC around fork..wait
+  cpu_median                            user+system seconds of the child (wait4 rusage)
+  max_rss_kb                            peak resident set size of the child
+  counters                              cycles, instructions, cache-misses, branch-misses from one
+                                        extra `perf stat` run, when perf is installed and allowed
+and per level speedup = Fortran wall_median / C++ wall_median (> 1: the C++ program is faster).
+A binary whose wall_median is below MIN_MEASURABLE_SECONDS mostly times process start-up, so its
+level gets speedup None and "unmeasurable": true instead of a ratio of noise.
+The top-level "speedup" is the one of the last level that profiled cleanly (the most optimized);
+"unmeasurable" is set at the top level when no level had a usable ratio because the runs were too short.
+
+Scaling mode (scaling=True, $F2C_PERF_PROFILE=scaling) also runs both binaries of the top level
+at OMP_NUM_THREADS = 1, 2, 4, ..., N (N = max_threads, default: CPU count) and records under
+"scaling" the wall times and speedup curves (T(1) / T(n), None where either time is too short to
+measure) of both programs. When the Fortran
+baseline scales (speedup >= MIN_BASELINE_SCALING at N) and the C++ speedup at N is below
+SCALING_PARITY times the Fortran one, the pair is flagged poor_scaling: typically a lost
+reduction clause, a missing `#pragma omp parallel for` or a loop serialized by a critical section.
+Programs without OpenMP directives are skipped.
+
+Runs go through a small C++ launcher (LAUNCHER_SOURCE, built once through the build cache) that
+forks the binary and reports its wait4 rusage. Linux carries ru_maxrss across fork+exec, so a
+binary forked straight from Python would report the Python process's peak RSS as its own.
+
+Measured runs of one process never overlap (a module lock), but other compile jobs on the same
+machine still add noise: profile on an otherwise idle node when the ratios matter.
+
+The orchestrator profiles each successful pair when given a PerfProfiler (or $F2C_PERF_PROFILE=on);
+runner.py stores the result under metadata.perf of the saved pair. Existing datasets:
+  python perf_profile.py annotate --pairs ../data/f2c_code_pair_test_dataset.jsonl --out perf.jsonl
+  python perf_profile.py filter --pairs perf.jsonl --out fast.jsonl --min-speedup 1.0
+  python perf_profile.py annotate --scaling --max-threads 16 --pairs ... --out scaling.jsonl
+  python perf_profile.py filter --pairs scaling.jsonl --out ok.jsonl --drop-poor-scaling
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+try:
+    from dialogue_store import iter_jsonl
+    from toolchain import TIMEOUT_LIMIT, build_program
+except ImportError:
+    from utils.dialogue_store import iter_jsonl
+    from utils.toolchain import TIMEOUT_LIMIT, build_program
+
+PERF_PROFILE_ENV = "F2C_PERF_PROFILE"
+PROFILE_LEVELS = ("O2", "O3")
+WARMUP = 1
+REPEATS = 5
+PERF_EVENTS = ("cycles", "instructions", "cache-misses", "branch-misses")
+MIN_BASELINE_SCALING = 1.5
+# Median wall time below which a run is start-up cost and timer noise, not the program's speed
+MIN_MEASURABLE_SECONDS = 0.01
+SCALING_PARITY = 0.7
+_OMP_RE = re.compile(r"^\s*!\$omp\b", re.IGNORECASE | re.MULTILINE)
+_MEASURE_LOCK = threading.Lock()
+
+# launcher <timeout seconds> <binary>: runs the binary (output discarded, SIGALRM after the timeout)
+# and prints "<exit code or -signal> <wall s> <user s> <system s> <max rss kB>"
+LAUNCHER_SOURCE = r"""#include <cstdio>
+#include <cstdlib>
+#include <ctime>
+#include <fcntl.h>
+#include <sys/resource.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+int main(int argc, char** argv) {
+    if (argc < 3) return 2;
+    timespec start, end;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    pid_t pid = fork();
+    if (pid < 0) return 3;
+    if (pid == 0) {
+        int devnull = open("/dev/null", O_WRONLY);
+        dup2(devnull, 1);
+        dup2(devnull, 2);
+        alarm(atoi(argv[1]));
+        execv(argv[2], argv + 2);
+        _exit(127);
+    }
+    int status = 0;
+    rusage usage{};
+    wait4(pid, &status, 0, &usage);
+    clock_gettime(CLOCK_MONOTONIC, &end);
+    int code = WIFEXITED(status) ? WEXITSTATUS(status) : -WTERMSIG(status);
+    std::printf("%d %.9f %.6f %.6f %ld\n", code, (end.tv_sec - start.tv_sec) + (end.tv_nsec - start.tv_nsec) * 1e-9,
+                usage.ru_utime.tv_sec + usage.ru_utime.tv_usec * 1e-6,
+                usage.ru_stime.tv_sec + usage.ru_stime.tv_usec * 1e-6, usage.ru_maxrss);
+    return 0;
+}
+"""
+
+
+def _child_env(threads):
+    return dict(os.environ, OMP_NUM_THREADS=str(threads)) if threads else None
+
+
+def build_launcher(folder) -> str:
+    """Path of the measuring launcher, built into `folder` (a build-cache hit after the first time)."""
+    _, stderr, ok, binary = build_program("cpp", LAUNCHER_SOURCE, folder, profile="O2")
+    if not ok:
+        raise RuntimeError(f"cannot build the perf launcher: {stderr.strip()[-300:]}")
+    return binary
+
+
+def run_once(launcher, binary, timeout_seconds=TIMEOUT_LIMIT, threads=None) -> Dict:
+    """One run of `binary` (output discarded): wall, cpu, max_rss_kb, returncode, timed_out."""
+    try:
+        process = subprocess.run([os.path.abspath(launcher), str(int(timeout_seconds)), os.path.abspath(binary)],
+                                 capture_output=True, text=True, timeout=timeout_seconds + 10, env=_child_env(threads),
+                                 cwd=os.path.dirname(os.path.abspath(binary)))
+        code, wall, user, system, rss = process.stdout.split()
+    except (subprocess.TimeoutExpired, ValueError):
+        return {"returncode": -1, "timed_out": True}
+    returncode = int(code)
+    return {"wall": float(wall), "cpu": float(user) + float(system), "max_rss_kb": int(rss),
+            "returncode": returncode, "timed_out": returncode == -signal.SIGALRM}
+
+
+def perf_counters(binary, timeout_seconds=TIMEOUT_LIMIT, threads=None) -> Optional[Dict[str, int]]:
+    """Hardware counters of one `perf stat` run, or None when perf is missing or not permitted."""
+    perf = shutil.which("perf")
+    if perf is None:
+        return None
+    fd, out_path = tempfile.mkstemp(prefix="f2c_perf_", suffix=".csv")
+    os.close(fd)
+    try:
+        process = subprocess.run([perf, "stat", "-x", ",", "-e", ",".join(PERF_EVENTS), "-o", out_path, "--",
+                                  os.path.abspath(binary)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                 timeout=timeout_seconds, env=_child_env(threads),
+                                 cwd=os.path.dirname(os.path.abspath(binary)))
+        if process.returncode != 0:
+            return None
+        counters = {}
+        with open(out_path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                fields = line.strip().split(",")
+                if len(fields) < 3 or not fields[0].strip().isdigit():
+                    continue  # comments, "<not supported>", "<not counted>"
+                counters[fields[2].split(":")[0]] = int(fields[0])
+        return counters or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+    finally:
+        os.remove(out_path)
+
+
+def measure(launcher, binary, warmup=WARMUP, repeats=REPEATS, timeout_seconds=TIMEOUT_LIMIT, threads=None,
+            perf=True) -> Dict:
+    """Warm up, then time `repeats` runs of `binary`; a failing or hanging run stops the measurement."""
+    runs = []
+    with _MEASURE_LOCK:
+        for k in range(warmup + repeats):
+            run = run_once(launcher, binary, timeout_seconds, threads)
+            if run["returncode"] != 0:
+                return {"ok": False, "error": "timeout" if run["timed_out"] else f"exit code {run['returncode']}"}
+            if k >= warmup:
+                runs.append(run)
+        counters = perf_counters(binary, timeout_seconds, threads) if perf else None
+    walls = [r["wall"] for r in runs]
+    return {
+        "ok": True,
+        "runs": len(runs),
+        "wall_median": round(statistics.median(walls), 6),
+        "wall_min": round(min(walls), 6),
+        "wall_stdev": round(statistics.stdev(walls), 6) if len(walls) > 1 else 0.0,
+        "cpu_median": round(statistics.median(r["cpu"] for r in runs), 6),
+        "max_rss_kb": max(r["max_rss_kb"] for r in runs),
+        "counters": counters,
+    }
+
+
+def measurable(*results: Dict, min_wall=MIN_MEASURABLE_SECONDS) -> bool:
+    """Whether every measured result ran long enough (wall_median >= min_wall) for its time to mean something."""
+    return all(r.get("ok") and r["wall_median"] >= min_wall for r in results)
+
+
+def speed_ratio(fortran: Dict, cpp: Dict, min_wall=MIN_MEASURABLE_SECONDS) -> Optional[float]:
+    """
+    Fortran median wall time / C++ median wall time; > 1 means the C++ program is faster.
+    None when either program failed or ran for less than min_wall.
+    """
+    if not measurable(fortran, cpp, min_wall=min_wall):
+        return None
+    return round(fortran["wall_median"] / cpp["wall_median"], 4)
+
+
+def thread_counts(max_threads=None) -> List[int]:
+    """1, 2, 4, ... up to max_threads (default: CPU count), max_threads itself included."""
+    max_threads = max(max_threads or os.cpu_count() or 1, 1)
+    counts = [1]
+    while counts[-1] * 2 < max_threads:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_threads:
+        counts.append(max_threads)
+    return counts
+
+
+def uses_openmp(fortran_code) -> bool:
+    return bool(_OMP_RE.search(fortran_code or ""))
+
+
+def scaling_curve(walls: List[float], min_wall=MIN_MEASURABLE_SECONDS) -> List[Optional[float]]:
+    """Speedup T(1) / T(n) for each entry of `walls` (None where a run failed or was shorter than min_wall)."""
+    if not walls or walls[0] is None or walls[0] < min_wall:
+        return [None] * len(walls)
+    return [round(walls[0] / w, 4) if w is not None and w >= min_wall else None for w in walls]
+
+
+def scaling_verdict(fortran_curve, cpp_curve) -> Dict:
+    """
+    Parity of the C++ speedup at the highest thread count against the Fortran one; no verdict
+    (parity None, not flagged) when either speedup is unknown, e.g. runs too short to measure.
+    """
+    fortran_top, cpp_top = fortran_curve[-1], cpp_curve[-1]
+    if fortran_top is None or cpp_top is None:
+        return {"parity": None, "poor_scaling": False}
+    parity = round(cpp_top / fortran_top, 4)
+    return {"parity": parity, "poor_scaling": fortran_top >= MIN_BASELINE_SCALING and parity < SCALING_PARITY}
+
+
+class PerfProfiler:
+    """Builds a pair at each optimization level and measures both binaries."""
+
+    def __init__(self, levels=PROFILE_LEVELS, warmup=WARMUP, repeats=REPEATS, timeout_seconds=TIMEOUT_LIMIT,
+                 perf=None, work_root=None, scaling=False, max_threads=None):
+        self.levels = tuple(levels)
+        self.warmup = warmup
+        self.repeats = repeats
+        self.timeout_seconds = timeout_seconds
+        # perf=None: use hardware counters when the perf tool is installed
+        self.perf = shutil.which("perf") is not None if perf is None else perf
+        self.work_root = work_root
+        self.scaling = scaling
+        self.max_threads = max_threads
+
+    def profile_level(self, work, launcher, level, fortran_code, cpp_code, threads=None) -> Dict:
+        """Build and measure both programs at one optimization level."""
+        entry = {}
+        for lang, source in (("fortran", fortran_code), ("cpp", cpp_code)):
+            _, stderr, ok, binary = build_program(lang, source, os.path.join(work, lang), profile=level,
+                                                  timeout_seconds=self.timeout_seconds)
+            if not ok:
+                entry[lang] = {"ok": False, "error": "build failed: " + stderr.strip()[-300:]}
+                continue
+            entry[lang] = measure(launcher, binary, self.warmup, self.repeats, self.timeout_seconds, threads, self.perf)
+        entry["speedup"] = speed_ratio(entry["fortran"], entry["cpp"])
+        if entry["speedup"] is None and entry["fortran"].get("ok") and entry["cpp"].get("ok"):
+            entry["unmeasurable"] = True
+        return entry
+
+    def profile_scaling(self, work, launcher, level, fortran_code, cpp_code) -> Dict:
+        """Wall times and speedup curves of both programs over thread_counts(self.max_threads)."""
+        if not uses_openmp(fortran_code):
+            return {"skipped": "no OpenMP directives"}
+        threads = thread_counts(self.max_threads)
+        entry = {"level": level, "threads": threads}
+        for lang, source in (("fortran", fortran_code), ("cpp", cpp_code)):
+            _, _, ok, binary = build_program(lang, source, os.path.join(work, lang), profile=level,
+                                             timeout_seconds=self.timeout_seconds)
+            walls = []
+            for n in threads:
+                result = measure(launcher, binary, self.warmup, self.repeats, self.timeout_seconds, n, perf=False) \
+                    if ok else {"ok": False}
+                walls.append(result["wall_median"] if result["ok"] else None)
+            entry[lang] = {"wall": walls, "speedup": scaling_curve(walls)}
+        entry.update(scaling_verdict(entry["fortran"]["speedup"], entry["cpp"]["speedup"]))
+        return entry
+
+    def profile(self, fortran_code, cpp_code) -> Dict:
+        """Metadata record for one pair (see the module docstring)."""
+        work = tempfile.mkdtemp(prefix="f2c_perf_", dir=self.work_root)
+        start = time.perf_counter()
+        scaling = None
+        try:
+            launcher = build_launcher(os.path.join(work, "launcher"))
+            levels = {level: self.profile_level(work, launcher, level, fortran_code, cpp_code)
+                      for level in self.levels}
+            if self.scaling:
+                scaling = self.profile_scaling(work, launcher, self.levels[-1], fortran_code, cpp_code)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+        profiled = [level for level in self.levels if levels[level]["speedup"] is not None]
+        record = {
+            "speedup": levels[profiled[-1]]["speedup"] if profiled else None,
+            "level": profiled[-1] if profiled else None,
+            "levels": levels,
+            "warmup": self.warmup,
+            "repeats": self.repeats,
+            "omp_num_threads": os.getenv("OMP_NUM_THREADS"),
+            "host": socket.gethostname(),
+            "profile_time": round(time.perf_counter() - start, 3),
+        }
+        if not profiled and any(levels[level].get("unmeasurable") for level in self.levels):
+            record["unmeasurable"] = True
+        if scaling is not None:
+            record["scaling"] = scaling
+        return record
+
+
+_default_profiler = None
+
+
+def default_perf_profiler() -> Optional[PerfProfiler]:
+    """
+    PerfProfiler when $F2C_PERF_PROFILE is 'on' / '1' / 'true' ('scaling' adds the thread-scaling
+    test), else None (profiling is opt-in).
+    """
+    global _default_profiler
+    mode = (os.getenv(PERF_PROFILE_ENV) or "").lower()
+    if mode not in ("on", "1", "true", "yes", "scaling"):
+        return None
+    if _default_profiler is None:
+        _default_profiler = PerfProfiler(scaling=mode == "scaling")
+    return _default_profiler
+
+
+def _write_jsonl(path, rows):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
+def annotate(pairs_path, out_path, profiler: PerfProfiler) -> int:
+    """Copy a code-pair JSONL, adding metadata.perf to every record; returns the number profiled."""
+    rows = []
+    for row in iter_jsonl(pairs_path):
+        metadata = row.setdefault("metadata", {})
+        metadata["perf"] = profiler.profile(row["fortran_code"], row["cpp_code"])
+        logging.info("[perf] %s speedup=%s poor_scaling=%s", row.get("id", len(rows)), metadata["perf"]["speedup"],
+                     (metadata["perf"].get("scaling") or {}).get("poor_scaling"))
+        rows.append(row)
+    _write_jsonl(out_path, rows)
+    return len(rows)
+
+
+def filter_pairs(pairs_path, out_path, min_speedup=1.0, level=None, drop_poor_scaling=False) -> Dict:
+    """
+    Keep the records whose speedup (at `level`, default: the top-level one) is >= min_speedup and,
+    with drop_poor_scaling, that are not flagged poor_scaling. Records whose runs were too short to
+    measure have no speedup to compare and are left out (counted under "unmeasurable"); the wall
+    times are re-checked, so records annotated before MIN_MEASURABLE_SECONDS existed are handled too.
+    """
+    kept, total, unmeasurable = [], 0, 0
+    for row in iter_jsonl(pairs_path):
+        total += 1
+        perf = (row.get("metadata") or {}).get("perf") or {}
+        entry = perf.get("levels", {}).get(level or perf.get("level"), {})
+        speedup = entry.get("speedup") if level else perf.get("speedup")
+        if entry.get("unmeasurable") or perf.get("unmeasurable") or (
+                speedup is not None and not measurable(entry.get("fortran", {}), entry.get("cpp", {}))):
+            unmeasurable += 1
+            continue
+        if drop_poor_scaling and (perf.get("scaling") or {}).get("poor_scaling"):
+            continue
+        if speedup is not None and speedup >= min_speedup:
+            kept.append(row)
+    _write_jsonl(out_path, kept)
+    return {"total": total, "kept": len(kept), "unmeasurable": unmeasurable}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runtime profiles of verified Fortran/C++ pairs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ann = sub.add_parser("annotate", help="profile every pair of a code-pair JSONL")
+    ann.add_argument("--pairs", required=True)
+    ann.add_argument("--out", required=True)
+    ann.add_argument("--levels", nargs="+", default=list(PROFILE_LEVELS), help="COMPILE_PROFILES entries")
+    ann.add_argument("--warmup", type=int, default=WARMUP)
+    ann.add_argument("--repeats", type=int, default=REPEATS)
+    ann.add_argument("--timeout", type=int, default=TIMEOUT_LIMIT, help="seconds per run")
+    ann.add_argument("--no-perf", action="store_true", help="skip hardware counters")
+    ann.add_argument("--scaling", action="store_true", help="also run the OpenMP thread-scaling test")
+    ann.add_argument("--max-threads", type=int, default=None, help="highest thread count (default: CPU count)")
+
+    flt = sub.add_parser("filter", help="keep pairs whose C++ program is fast enough")
+    flt.add_argument("--pairs", required=True, help="JSONL annotated with metadata.perf")
+    flt.add_argument("--out", required=True)
+    flt.add_argument("--min-speedup", type=float, default=1.0, help="Fortran time / C++ time")
+    flt.add_argument("--level", default=None, help="compare at this level instead of the top-level speedup")
+    flt.add_argument("--drop-poor-scaling", action="store_true", help="drop pairs flagged poor_scaling")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "annotate":
+        profiler = PerfProfiler(args.levels, args.warmup, args.repeats, args.timeout, perf=False if args.no_perf else None,
+                                scaling=args.scaling, max_threads=args.max_threads)
+        count = annotate(args.pairs, args.out, profiler)
+        print(f"{count} pairs profiled -> {args.out}")
+    else:
+        result = filter_pairs(args.pairs, args.out, args.min_speedup, args.level, args.drop_poor_scaling)
+        print(f"{result['kept']}/{result['total']} pairs kept ({result['unmeasurable']} too short to measure) "
+              f"-> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -201,6 +201,47 @@ Return only a ```cpp block after the tags line.
 """
 
 
+# ===== Patch mode (optional): the model returns edits instead of the full program =====
+PATCH_MODE_RULE = """
+PATCH MODE overrides the code-block rule above: after the tags line you may return ONLY your edits, either
+- ONE ```diff block: a unified diff (@@ hunks, 2 lines of unchanged context) against the current program below, or
+- one or more SEARCH/REPLACE blocks:
+<<<<<<< SEARCH
+exact lines copied from the current program
+=======
+their replacement
+>>>>>>> REPLACE
+Return the full program in a ```{lang} block instead only when most of it changes.
+Current program:
+```{lang}
+{code}
+```
+"""
+
+patch_rejected = f"""
+Your edits could not be applied to the current program ({{error}}).
+{REPAIR_TAGS_RULE}
+Return the complete corrected program in a ```{{lang}} block after the tags line.
+"""
+
+
+# ===== Retrieval (optional): verified pairs of similar programs as few-shot examples =====
+few_shot_header = """
+Verified translations of similar Fortran programs, for reference only. Translate the validated program at the end, not these:
+"""
+
+few_shot_example = """
+Example {n}, Fortran:
+```fortran
+{fortran_code}
+```
+Example {n}, verified C++ translation:
+```cpp
+{cpp_code}
+```
+"""
+
+
 # ===== Output comparison prompts =====
 output_comparison_analysis = """
 Compare the outputs of these two programs and determine if they produce the same results.
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of the prompt templates the pipeline formats: declared fields, pre-compiled segments, versions.
+
+Each template of prompt_f2c_output_comparison.py that the orchestrator sends is registered in
+TEMPLATES with the fields it requires. At import time:
+  - the placeholders of every template must be exactly its declared fields (plain {name} only)
+  - every `<template>.format(...)` call in CALL_SITE_MODULES must pass exactly those fields
+    (a call with **kwargs is only checked for unknown names), and a template with fields must not
+    be sent unformatted
+Any problem raises PromptFieldError, so a renamed placeholder fails at startup instead of after the
+compile and LLM spend of a conversation.
+
+The registered names are exported as PromptTemplate objects (str subclasses, so they concatenate
+and serialize like the plain strings). Their format() fills the slots of a literal list split once
+at import, and rejects missing or unknown fields. A template's version is a short hash of its text;
+prompt_versions() maps name -> version and PROMPTS_VERSION digests all of them, so cached responses
+and run outputs can be keyed by the prompts that produced them.
+
+Example:
+  from prompt_registry import *        # after `from prompt_f2c_output_comparison import *`
+  python prompt_registry.py check      # templates, fields, versions and call-site problems
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import string
+import sys
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    import prompt_f2c_output_comparison as prompt_module
+except ImportError:
+    from utils import prompt_f2c_output_comparison as prompt_module
+
+TEMPLATES: Dict[str, Tuple[str, ...]] = {
+    # Phase A: Fortran testbench
+    "Instruction_qer": (),
+    "q_generate_fortran_bench_first": (),
+    "missing_terminating": (),
+    "combine_header_files_fortran": ("compile_result",),
+    "openmp_downgrade_fortran": ("compile_result",),
+    "ff_ct_further_modification": ("fortran_compile_result",),
+    # Phase B: C++ translation
+    "q_translate_to_cpp_same_test": (),
+    "few_shot_header": (),
+    "few_shot_example": ("n", "fortran_code", "cpp_code"),
+    "Init_solver_prompt": ("fortran_code", "cpp_code"),
+    "combine_header_files_cpp": ("compile_result",),
+    "openmp_downgrade_cpp": ("compile_result",),
+    "ft_cf_further_modification": ("cpp_compile_result",),
+    "check_and_align_test_cpp": ("fortran_code", "cpp_code"),
+    "fix_implementation_only_cpp": ("fortran_code", "cpp_code"),
+    "output_mismatch_fix": ("fortran_code", "cpp_code", "fortran_output", "cpp_output"),
+    "output_comparison_analysis": ("fortran_code", "cpp_code", "fortran_output", "cpp_output"),
+    "end_prompt_": (),
+    # Patch mode
+    "PATCH_MODE_RULE": ("lang", "code"),
+    "patch_rejected": ("error", "lang"),
+}
+CALL_SITE_MODULES = ("agent.py", "repair_policy.py", "retrieval.py")
+
+
+class PromptFieldError(ValueError):
+    pass
+
+
+class PromptTemplate(str):
+    """A prompt string with declared fields; format() fills the field slots of its pre-split literals."""
+
+    def __new__(cls, name, text, fields: Iterable[str] = ()):
+        template = super().__new__(cls, text)
+        template.name = name
+        template.fields = frozenset(fields)
+        template.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        template.parts = []  # literals, with a slot (None) for each field
+        template.slots = []  # (index in parts, field)
+        template.problems = []
+        try:
+            parsed = list(string.Formatter().parse(text))
+        except ValueError as e:
+            template.problems.append(f"{name}: unparsable template ({e})")
+            parsed = []
+        for literal, field, spec, conversion in parsed:
+            if field is not None and (spec or conversion or not field.isidentifier()):
+                template.problems.append(f"{name}: only plain {{name}} placeholders are supported, got {{{field}}}")
+            template.parts.append(literal)
+            if field is not None:
+                template.slots.append((len(template.parts), field))
+                template.parts.append(None)
+        placeholders = {field for _, field in template.slots}
+        if placeholders != template.fields:
+            template.problems.append(f"{name}: placeholders {sorted(placeholders)} != declared {sorted(template.fields)}")
+        return template
+
+    def format(self, *args, **fields) -> str:
+        if args:
+            raise PromptFieldError(f"{self.name}: positional arguments are not supported")
+        if fields.keys() != self.fields:
+            missing, unknown = self.fields - fields.keys(), fields.keys() - self.fields
+            raise PromptFieldError(f"{self.name}: missing {sorted(missing)}, unknown {sorted(unknown)}")
+        parts = self.parts.copy()
+        for index, field in self.slots:
+            parts[index] = format(fields[field])
+        return "".join(parts)
+
+    def __reduce__(self):
+        return str, (str(self),)
+
+
+PROMPTS: Dict[str, PromptTemplate] = {name: PromptTemplate(name, getattr(prompt_module, name), fields)
+                                      for name, fields in TEMPLATES.items()}
+PROMPTS_VERSION = hashlib.sha256("\n".join(f"{name}:{t.version}" for name, t in sorted(PROMPTS.items()))
+                                 .encode("utf-8")).hexdigest()[:12]
+
+
+def prompt_versions() -> Dict[str, str]:
+    return {name: template.version for name, template in PROMPTS.items()}
+
+
+def check_call_sites(paths: Iterable[str]) -> List[str]:
+    """Problems of the `<template>.format(...)` calls (and unformatted uses) in the given source files."""
+    problems = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=path)
+        formatted = set()
+        for node in ast.walk(tree):
+            if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and node.func.attr == "format" and isinstance(node.func.value, ast.Name)
+                    and node.func.value.id in PROMPTS):
+                continue
+            template = PROMPTS[node.func.value.id]
+            formatted.add(id(node.func.value))
+            where = f"{os.path.basename(path)}:{node.lineno} {template.name}.format"
+            passed = {k.arg for k in node.keywords if k.arg is not None}
+            splat = any(k.arg is None for k in node.keywords)
+            if node.args:
+                problems.append(f"{where}: positional arguments are not supported")
+            if passed - template.fields:
+                problems.append(f"{where}: unknown field(s) {sorted(passed - template.fields)}")
+            if not splat and template.fields - passed:
+                problems.append(f"{where}: missing field(s) {sorted(template.fields - passed)}")
+        for node in ast.walk(tree):
+            if (isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id in PROMPTS
+                    and PROMPTS[node.id].fields and id(node) not in formatted):
+                problems.append(f"{os.path.basename(path)}:{node.lineno} {node.id} is used without format()")
+    return problems
+
+
+def _call_site_paths() -> List[str]:
+    folder = os.path.dirname(os.path.abspath(__file__))
+    return [path for path in (os.path.join(folder, name) for name in CALL_SITE_MODULES) if os.path.exists(path)]
+
+
+def validate() -> List[str]:
+    """All template and call-site problems (empty when the prompts and their callers agree)."""
+    problems = [problem for template in PROMPTS.values() for problem in template.problems]
+    return problems + check_call_sites(_call_site_paths())
+
+
+_problems = validate()
+if _problems:
+    raise PromptFieldError("prompt templates and call sites disagree:\n  " + "\n  ".join(_problems))
+
+globals().update(PROMPTS)
+__all__ = list(TEMPLATES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt template registry.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("check", help="list templates and validate call sites")
+    check.add_argument("--json", action="store_true", help="print name -> version as JSON")
+    check.add_argument("paths", nargs="*", help="extra source files to check")
+    args = parser.parse_args()
+
+    problems = check_call_sites(args.paths)
+    if args.json:
+        print(json.dumps({"version": PROMPTS_VERSION, "templates": prompt_versions()}, indent=2))
+    else:
+        for name, template in PROMPTS.items():
+            print(f"{template.version}  {name:32s} {', '.join(sorted(template.fields)) or '-'}")
+        print(f"{PROMPTS_VERSION}  (all)")
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Staged repair-policy engine for the Phase A / Phase B debug loops.
+
+A failed turn is reduced to a diagnosis kind (compiler / runtime output, comparator verdict):
+  unterminated_string, missing_symbol, openmp, compile_error, runtime_error, no_output, output_mismatch
+Every strategy declares the phase and kinds it handles and builds its prompt from the prompt module.
+Among the applicable strategies the policy picks the one with the best learned success rate
+(Beta prior that favours earlier stages, so an untrained policy follows the stage order). An attempt
+succeeds when the next turn gets further: KIND_RANK of the next diagnosis is higher, or it passes.
+When the cycle guard flags a loop, the orchestrator escalates to the best strategy not tried yet.
+
+Mismatch handling is staged: check_and_align_test_cpp first aligns the C++ test with the Fortran
+test, then fix_implementation_only_cpp touches only the computation, then output_mismatch_fix.
+The OpenMP downgrades are a last stage, used once, and only for programs that use OpenMP.
+ft_ct_further_check is deliberately not a strategy: it is a Yes/No equivalence question, not a
+repair prompt, and the orchestrator already asks that question (output_comparison_analysis, with
+both programs and outputs) before any mismatch strategy is chosen.
+
+Success counts persist as JSON ($F2C_REPAIR_POLICY, or the path given to RepairPolicy). Saving adds
+this process's deltas to the file under an exclusive lock, so parallel workers can share one file.
+New strategies plug in through `register()`.
+"""
+import json
+import os
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional
+
+try:
+    from cycle_guard import mentions_openmp
+    from prompt_registry import (check_and_align_test_cpp, combine_header_files_cpp,
+                                 combine_header_files_fortran, ff_ct_further_modification,
+                                 fix_implementation_only_cpp, ft_cf_further_modification,
+                                 missing_terminating, openmp_downgrade_cpp, openmp_downgrade_fortran,
+                                 output_mismatch_fix)
+except ImportError:
+    from utils.cycle_guard import mentions_openmp
+    from utils.prompt_registry import (check_and_align_test_cpp, combine_header_files_cpp,
+                                       combine_header_files_fortran, ff_ct_further_modification,
+                                       fix_implementation_only_cpp, ft_cf_further_modification,
+                                       missing_terminating, openmp_downgrade_cpp, openmp_downgrade_fortran,
+                                       output_mismatch_fix)
+
+POLICY_ENV = "F2C_REPAIR_POLICY"
+PRIOR_WEIGHT = 2.0
+PASS = "pass"
+
+# How far a program got; an attempt that raises the rank made progress
+KIND_RANK = {
+    "unterminated_string": 0, "missing_symbol": 0, "openmp": 0, "compile_error": 0,
+    "runtime_error": 1, "no_output": 1,
+    "output_mismatch": 2,
+    PASS: 3,
+}
+COMPILE_KINDS = ("unterminated_string", "missing_symbol", "openmp", "compile_error")
+FAILURE_KINDS = COMPILE_KINDS + ("runtime_error", "no_output")
+
+_OPENMP_RE = re.compile(r"openmp|\bomp_\w+|\$omp|#pragma omp", re.IGNORECASE)
+# "Fortran runtime error: ..." is a runtime failure, not a diagnostic
+_COMPILE_RE = re.compile(r":\d+:(?:\d+:)?\s*(?:fatal )?error\b|^Error:|(?<!runtime )\berror: ",
+                         re.IGNORECASE | re.MULTILINE)
+_MISSING_RE = re.compile(r"undefined reference to|No such file or directory|Cannot open module file|"
+                         r"fatal error: .* file not found", re.IGNORECASE)
+
+
+def diagnose(ok, stdout, stderr) -> str:
+    """Diagnosis kind of one compile+run result (output comparison is the caller's job)."""
+    stderr = stderr or ""
+    if ok:
+        return "no_output" if not (stdout or "").strip() else PASS
+    if "missing terminating" in stderr:
+        return "unterminated_string"
+    is_compile = bool(_COMPILE_RE.search(stderr)) or bool(_MISSING_RE.search(stderr))
+    if is_compile and _OPENMP_RE.search(stderr):
+        return "openmp"
+    if _MISSING_RE.search(stderr):
+        return "missing_symbol"
+    if is_compile:
+        return "compile_error"
+    return "runtime_error"
+
+
+class Strategy:
+    """One repair prompt: where it applies and how its prompt is built from the turn context."""
+
+    def __init__(self, name, phase, kinds: Iterable[str], build: Callable[[Dict], str], stage=0,
+                 requires: Iterable[str] = (), max_uses: Optional[int] = None,
+                 applies: Optional[Callable[[Dict], bool]] = None):
+        self.name = name
+        self.phase = phase
+        self.kinds = frozenset(kinds)
+        self.build = build
+        self.stage = stage
+        self.requires = tuple(requires)
+        self.max_uses = max_uses
+        self.applies = applies
+
+
+STRATEGIES: Dict[str, Strategy] = {}
+
+
+def register(strategy: Strategy) -> Strategy:
+    STRATEGIES[strategy.name] = strategy
+    return strategy
+
+
+def _fortran_result(ctx):
+    return f"Fortran Stdout: {ctx.get('fortran_stdout', '')}\nFortran Stderr: {ctx.get('fortran_stderr', '')}"
+
+
+def _cpp_result(ctx):
+    return f"C++ Stdout: {ctx.get('cpp_stdout', '')}\nC++ Stderr: {ctx.get('cpp_stderr', '')}"
+
+
+def _uses_openmp(lang):
+    return lambda ctx: mentions_openmp(ctx.get(f"{lang}_stderr"), ctx.get(f"{lang}_code"))
+
+
+def _mismatch_fields(ctx):
+    return {"fortran_code": ctx.get("fortran_code", ""), "cpp_code": ctx.get("cpp_code", "")}
+
+
+# ----- Phase A: Fortran testbench -----
+register(Strategy("missing_terminating_fortran", "A", ["unterminated_string"], lambda ctx: missing_terminating))
+register(Strategy("combine_headers_fortran", "A", ["missing_symbol"], lambda ctx: combine_header_files_fortran.format(
+    compile_result=f"Fortran Compile Stderr:\n{ctx.get('fortran_stderr', '')}")))
+register(Strategy("openmp_downgrade_fortran", "A", FAILURE_KINDS, lambda ctx: openmp_downgrade_fortran.format(
+    compile_result=f"Fortran Stderr:\n{ctx.get('fortran_stderr', '')}"), stage=3, max_uses=1, applies=_uses_openmp("fortran")))
+register(Strategy("fortran_fix", "A", FAILURE_KINDS, lambda ctx: ff_ct_further_modification.format(
+    fortran_compile_result=_fortran_result(ctx)), stage=2))
+
+# ----- Phase B: C++ translation (Fortran frozen) -----
+register(Strategy("missing_terminating_cpp", "B", ["unterminated_string"], lambda ctx: missing_terminating))
+register(Strategy("combine_headers_cpp", "B", ["missing_symbol"], lambda ctx: combine_header_files_cpp.format(
+    compile_result=f"C++ Compile Stderr:{ctx.get('cpp_stderr', '')}")))
+register(Strategy("openmp_downgrade_cpp", "B", FAILURE_KINDS, lambda ctx: openmp_downgrade_cpp.format(
+    compile_result=f"C++ Compile Stderr:{ctx.get('cpp_stderr', '')}"), stage=3, max_uses=1, applies=_uses_openmp("cpp")))
+register(Strategy("cpp_fix", "B", FAILURE_KINDS, lambda ctx: ft_cf_further_modification.format(
+    cpp_compile_result=_cpp_result(ctx)), stage=2))
+register(Strategy("check_and_align_test", "B", ["output_mismatch"], lambda ctx: check_and_align_test_cpp.format(
+    **_mismatch_fields(ctx)), stage=0, max_uses=1))
+register(Strategy("fix_implementation_only", "B", ["output_mismatch"], lambda ctx: fix_implementation_only_cpp.format(
+    **_mismatch_fields(ctx)), stage=1, requires=["check_and_align_test"]))
+register(Strategy("output_mismatch_fix", "B", ["output_mismatch"], lambda ctx: output_mismatch_fix.format(
+    fortran_output=ctx.get("fortran_stdout", ""), cpp_output=ctx.get("cpp_stdout", ""), **_mismatch_fields(ctx)),
+    stage=2))
+
+
+class RepairPolicy:
+    """Shared, thread-safe success statistics: stats[strategy][kind] = [attempts, successes]."""
+
+    def __init__(self, path=None, strategies: Optional[Dict[str, Strategy]] = None):
+        self.path = path
+        self.strategies = STRATEGIES if strategies is None else strategies
+        self.stats: Dict[str, Dict[str, List[int]]] = {}
+        self._delta: Dict[str, Dict[str, List[int]]] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.stats = json.load(f)
+
+    def score(self, name, kind) -> float:
+        """Posterior success rate; the prior 1 / (2 + stage) keeps the stage order until data says otherwise."""
+        strategy = self.strategies[name]
+        attempts, successes = self.stats.get(name, {}).get(kind, (0, 0))
+        prior = 1.0 / (2 + strategy.stage)
+        return (successes + PRIOR_WEIGHT * prior) / (attempts + PRIOR_WEIGHT)
+
+    def ranked(self, phase, kind) -> List[str]:
+        names = [n for n, s in self.strategies.items() if s.phase == phase and kind in s.kinds]
+        with self._lock:
+            return sorted(names, key=lambda n: (-self.score(n, kind), self.strategies[n].stage, n))
+
+    def record(self, name, kind, success):
+        with self._lock:
+            for table in (self.stats, self._delta):
+                entry = table.setdefault(name, {}).setdefault(kind, [0, 0])
+                entry[0] += 1
+                entry[1] += int(bool(success))
+
+    def save(self, path=None):
+        """Add unsaved outcomes to the stats file (read-modify-write under an exclusive file lock)."""
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            delta, self._delta = self._delta, {}
+        if not delta:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".lock", "w") as lock:
+            try:
+                import fcntl
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            except ImportError:
+                pass
+            on_disk = {}
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    on_disk = json.load(f)
+            for name, kinds in delta.items():
+                for kind, (attempts, successes) in kinds.items():
+                    entry = on_disk.setdefault(name, {}).setdefault(kind, [0, 0])
+                    entry[0] += attempts
+                    entry[1] += successes
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(on_disk, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self.stats = on_disk
+
+    def session(self, phase) -> "RepairSession":
+        return RepairSession(self, phase)
+
+
+class RepairSession:
+    """Per-conversation, per-phase view: strategy uses and the attempt awaiting its outcome."""
+
+    def __init__(self, policy: RepairPolicy, phase):
+        self.policy = policy
+        self.phase = phase
+        self.uses = Counter()
+        self.pending = None  # (strategy, kind)
+        self.last = None
+        self.trace: List[Dict] = []
+
+    def observe(self, kind):
+        """Outcome of the next turn after a repair prompt (PASS or a diagnosis kind)."""
+        if self.pending is None:
+            return
+        name, prev_kind = self.pending
+        success = KIND_RANK.get(kind, 0) > KIND_RANK.get(prev_kind, 0)
+        self.policy.record(name, prev_kind, success)
+        self.trace[-1]["outcome"] = kind
+        self.pending = None
+
+    def candidates(self, kind, ctx, exclude=()) -> List[str]:
+        """Applicable strategies for `kind`, best first."""
+        out = []
+        for name in self.policy.ranked(self.phase, kind):
+            strategy = self.policy.strategies[name]
+            if name in exclude:
+                continue
+            if strategy.applies is not None and not strategy.applies(ctx):
+                continue
+            if strategy.max_uses is not None and self.uses[name] >= strategy.max_uses:
+                continue
+            if any(self.uses[r] == 0 for r in strategy.requires):
+                continue
+            out.append(name)
+        return out
+
+    def choose(self, kind, ctx, exclude=()) -> Optional[str]:
+        names = self.candidates(kind, ctx, exclude)
+        return names[0] if names else None
+
+    def prompt(self, name, kind, **ctx) -> str:
+        """Build the strategy's prompt and mark it as the pending attempt for `kind`."""
+        self.uses[name] += 1
+        self.pending = (name, kind)
+        self.last = name
+        self.trace.append({"strategy": name, "kind": kind})
+        return self.policy.strategies[name].build(ctx)
+
+    def close(self):
+        """End of the phase: persist. An attempt whose result was never run (turn limit) is not counted."""
+        self.pending = None
+        self.policy.save()
+
+
+_default_policy = None
+_default_lock = threading.Lock()
+
+
+def default_repair_policy() -> RepairPolicy:
+    """Process-wide policy persisted at $F2C_REPAIR_POLICY (in-memory only when unset)."""
+    global _default_policy
+    with _default_lock:
+        if _default_policy is None:
+            _default_policy = RepairPolicy(os.getenv(POLICY_ENV))
+        return _default_policy
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Canonical repair-intent tags.
+
+Models spell the same intent many ways ("runtime error", "runtime-error", "fix-runtime-error",
+"fortran_runtime_errors"). A raw tag is resolved to a canonical tag by, in order:
+  1. normalization   lower-case, "intent:" and quotes dropped, '_' / spaces -> '-', simple plurals
+  2. alias table     exact match on the normalized key
+  3. verb stripping  leading "fix-" / "add-" / "fortran-" ... tokens, then the alias table again
+  4. fuzzy match     difflib ratio >= FUZZY_CUTOFF against the alias keys (typos)
+  5. token trie      longest multi-token alias starting at any token ("runtime-error-in-loop" ->
+                     runtime-error); one-word aliases ("single", "output") only match whole keys,
+                     so "single-precision" or "no-output" do not collapse into unrelated tags
+and anything else becomes a canonical tag of its own (its normalized key without the filler).
+
+Canonical tags are interned to small integer ids; the built-in vocabulary always gets the same ids
+(its order below), tags first seen at runtime are appended. Resolutions are cached per raw string.
+"""
+import difflib
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+FUZZY_CUTOFF = 0.88
+MIN_FUZZY_LEN = 5
+
+# canonical tag -> aliases (written in any spelling; they are normalized on load)
+CANONICAL_TAGS = {
+    "fix": ("bug", "bugfix", "bug fix", "fix bug", "repair", "error fix", "fix errors", "error", "codefix",
+            "fix program", "fix fortran code", "debug", "general", "tags", "repair intent tags"),
+    "refactor": ("improve code quality", "improve code organization", "code quality", "cleanup"),
+    "runtime-error": ("runtime", "runtime error", "fortran runtime error", "segfault", "segmentation fault",
+                      "out of bounds access", "array bounds"),
+    "compile-error": ("compile", "compilation", "compiler", "compilation error", "compile fix",
+                      "successful compilation", "compilation success", "compile successfully"),
+    "syntax-error": ("syntax", "fortran syntax error", "typo", "unterminated string"),
+    "linker-error": ("linker", "link", "linking", "undefined reference"),
+    "output-mismatch": ("output", "wrong output", "output mismatch", "identical output", "correct output",
+                        "output correction"),
+    "no-output": ("no output", "empty output", "missing output", "no output produced", "print output"),
+    "output-format": ("format", "formatting", "output formatting", "format output"),
+    "openmp": ("omp", "openmp fix", "omp fix", "openmp directives", "openmp fixes", "common openmp fixes",
+               "parallel", "parallelism", "parallelization", "parallel processing", "parallel computing",
+               "omp for", "omp parallel for", "replace nonstandard directives", "sections", "single", "master",
+               "omp single", "omp master", "omp sections", "omp critical"),
+    "serial-fallback": ("fallback", "serial fallback", "provide serial fallback"),
+    "missing-module": ("module not found", "missing module", "module definition", "module file"),
+    "missing-header": ("missing header", "header", "include"),
+    "missing-symbol": ("missing symbol", "undefined symbol"),
+    "type-mismatch": ("type mismatch", "cast to double", "type casting", "type conversion", "conversion",
+                      "integer division"),
+    "implicit-none": ("implicit none", "implicit", "implicit type", "undeclared variable"),
+    "fortran90": ("fortran 90", "f90"),
+    "fortran": (),
+    "cpp": ("c++",),
+    "module": (),
+    "interface": (),
+    "intent": (),
+    "array": ("array declaration", "array initialization", "variable length array", "array operations",
+              "array subscript"),
+    "unused-code": ("unused import", "unused variable"),
+    "rename": ("rename function", "rename module", "name conflict", "program name conflict"),
+    "logic-error": ("logic", "logical error", "logic error"),
+    "error-handling": ("error checking", "error analysis"),
+    "memory-management": ("memory", "allocation", "allocatable", "deallocate", "static allocation",
+                          "cuda memory management", "cuda memory allocation", "cuda memory access"),
+    "cuda-kernel": ("cuda", "cuda fix", "cuda kernel", "cuda kernel launch", "kernel launch",
+                    "cuda synchronization"),
+    "test-scaffold": ("modify test scaffold", "match test scaffold", "match cpp test", "identical test",
+                      "identical test scaffold", "test modification", "input modification"),
+    "computation": ("no test modification", "modify computation", "computation modification", "modify kernel computation",
+                    "kernel math"),
+    "no-change": (),
+    "dependency": ("library", "missing library", "math library"),
+    "mpi": (),
+}
+
+# Leading tokens that carry no intent of their own ("fix-runtime-error" == "runtime-error")
+FILLER_TOKENS = frozenset(("fix", "add", "intent", "fortran", "cpp", "c++", "cuda", "the"))
+_PLURALS = {"errors": "error", "modules": "module", "headers": "header", "symbols": "symbol",
+            "fixes": "fix", "warnings": "warning", "types": "type"}
+_SEPARATORS = re.compile(r"[\s_/-]+")
+
+
+def normalize_tag(raw) -> str:
+    """Spelling-insensitive key: 'Fix_Runtime Errors' -> 'fix-runtime-error'."""
+    text = str(raw).strip().strip("\"'`").lower()
+    if text.startswith("intent:"):
+        text = text[len("intent:"):]
+    tokens = [t for t in _SEPARATORS.split(text) if t]
+    return "-".join(_PLURALS.get(t, t) for t in tokens)
+
+
+class TagIndex:
+    """Alias table + token trie + fuzzy fallback, with interned integer ids."""
+
+    def __init__(self, canonical: Optional[Dict[str, Iterable[str]]] = None, fuzzy_cutoff=FUZZY_CUTOFF):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self._aliases: Dict[str, int] = {}
+        self._trie: Dict = {}
+        self._cache: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        for name, aliases in (CANONICAL_TAGS if canonical is None else canonical).items():
+            tid = self.intern(name)
+            for alias in (name, *aliases):
+                self.add_alias(alias, tid)
+        self._alias_keys = sorted(self._aliases)
+
+    def intern(self, name) -> int:
+        tid = self.ids.get(name)
+        if tid is not None:
+            return tid
+        with self._lock:
+            tid = self.ids.get(name)
+            if tid is None:
+                tid = self.ids[name] = len(self.names)
+                self.names.append(name)
+        return tid
+
+    def add_alias(self, alias, tid):
+        key = normalize_tag(alias)
+        self._aliases[key] = tid
+        node = self._trie
+        for token in key.split("-"):
+            node = node.setdefault(token, {})
+        node[None] = tid
+
+    def _prefix(self, tokens, min_tokens=1):
+        """(tag id, matched token count) of the longest alias of >= min_tokens tokens that `tokens` starts with."""
+        node, found, depth = self._trie, None, 0
+        for i, token in enumerate(tokens):
+            node = node.get(token)
+            if node is None:
+                break
+            if None in node and i + 1 >= min_tokens:
+                found, depth = node[None], i + 1
+        return found, depth
+
+    def _lookup(self, key):
+        """(tag id or None, key to intern when nothing matches)."""
+        tid = self._aliases.get(key)
+        if tid is not None:
+            return tid, key
+        tokens = key.split("-")
+        start = 0
+        while start < len(tokens) - 1 and tokens[start] in FILLER_TOKENS:
+            start += 1
+            tid = self._aliases.get("-".join(tokens[start:]))
+            if tid is not None:
+                return tid, key
+        stripped = "-".join(tokens[start:])
+        if len(stripped) >= MIN_FUZZY_LEN:
+            close = difflib.get_close_matches(stripped, self._alias_keys, n=1, cutoff=self.fuzzy_cutoff)
+            if close:
+                return self._aliases[close[0]], key
+        # Longest multi-token alias found anywhere after the filler ("atomicadd-type-mismatch" -> type-mismatch)
+        best, best_depth = None, 0
+        for offset in range(start, len(tokens)):
+            tid, depth = self._prefix(tokens[offset:], min_tokens=2)
+            if depth > best_depth:
+                best, best_depth = tid, depth
+        return best, stripped
+
+    def resolve(self, raw) -> int:
+        """Canonical tag id of a raw tag (new canonical tags are interned on first sight)."""
+        raw = str(raw)
+        tid = self._cache.get(raw)
+        if tid is None:
+            tid, key = self._lookup(normalize_tag(raw))
+            if tid is None:
+                tid = self.intern(key)
+            self._cache[raw] = tid
+        return tid
+
+    def name(self, tid) -> str:
+        return self.names[tid]
+
+    def canonical(self, raw) -> str:
+        return self.names[self.resolve(raw)]
+
+    def resolve_all(self, raw_tags) -> List[int]:
+        """Ids of `raw_tags`, de-duplicated, first occurrence order."""
+        out: List[int] = []
+        for raw in raw_tags:
+            if raw is None or not str(raw).strip():
+                continue
+            tid = self.resolve(raw)
+            if tid not in out:
+                out.append(tid)
+        return out
+
+
+TAGS = TagIndex()
+
+
+def canonical_tag(raw) -> str:
+    return TAGS.canonical(raw)
+
+
+def tag_id(raw) -> int:
+    return TAGS.resolve(raw)
+
+
+def tag_name(tid) -> str:
+    return TAGS.name(tid)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+BM25 index over the Fortran side of verified pairs, for few-shot examples in the Phase B prompt.
+
+Documents are tokenized into lower-cased identifiers and keywords (comments dropped, !$omp
+directives kept as omp:<word> tokens) plus adjacent-token bigrams, so both vocabulary
+("dgemm", "reduction") and structure ("parallel do", "allocate a") count. Scores are Okapi
+BM25 (K1, B). A pair whose Fortran source is the query itself (same normalized source) is never
+returned, and pairs longer than max_example_chars are skipped to keep the prompt small.
+
+The orchestrator prepends the top hits to the Phase B translation prompt when it has a
+RetrievalIndex ($F2C_RETRIEVAL_INDEX: a code-pair JSONL or an index saved by `build`).
+
+Example:
+  python retrieval.py build --pairs ../data/f2c_code_pair_train_dataset.jsonl --out ../data/retrieval_train.json
+  python retrieval.py query --index ../data/retrieval_train.json --fortran prog.f90 -k 2
+  export F2C_RETRIEVAL_INDEX=../data/retrieval_train.json
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from dialogue_store import iter_records
+    from prompt_registry import few_shot_example, few_shot_header
+    from text_utils import normalize_source
+except ImportError:
+    from utils.dialogue_store import iter_records
+    from utils.prompt_registry import few_shot_example, few_shot_header
+    from utils.text_utils import normalize_source
+
+RETRIEVAL_ENV = "F2C_RETRIEVAL_INDEX"
+INDEX_VERSION = 1
+K1 = 1.5
+B = 0.75
+DEFAULT_K = 2
+MAX_EXAMPLE_CHARS = 6000
+_WORD_RE = re.compile(r"[a-z_][a-z0-9_]*")
+
+
+def fortran_tokens(code) -> List[str]:
+    """Identifiers/keywords of a Fortran source (comments dropped) followed by their bigrams."""
+    words = []
+    for line in (code or "").lower().splitlines():
+        stripped = line.strip()
+        if stripped.startswith("!$omp"):
+            words.extend("omp:" + w for w in _WORD_RE.findall(stripped[5:]))
+            continue
+        words.extend(_WORD_RE.findall(line.split("!", 1)[0]))
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def source_digest(code) -> str:
+    return hashlib.sha256(normalize_source(code, "fortran").encode("utf-8", "replace")).hexdigest()
+
+
+class RetrievalIndex:
+    """Inverted index (token -> [(doc, tf)]) with BM25 scoring over verified pairs."""
+
+    def __init__(self, k1=K1, b=B):
+        self.k1 = k1
+        self.b = b
+        self.docs: List[Dict] = []
+        self.postings: Dict[str, List[List[int]]] = {}
+        self._lengths: List[int] = []
+
+    def add(self, doc_id, fortran_code, cpp_code):
+        tokens = Counter(fortran_tokens(fortran_code))
+        doc = len(self.docs)
+        self.docs.append({"id": doc_id, "fortran_code": fortran_code, "cpp_code": cpp_code,
+                          "digest": source_digest(fortran_code)})
+        self._lengths.append(sum(tokens.values()))
+        for token, tf in tokens.items():
+            self.postings.setdefault(token, []).append([doc, tf])
+
+    @classmethod
+    def from_pairs(cls, path, **kwargs) -> "RetrievalIndex":
+        """Index a code-pair JSON/JSONL (records with fortran_code and cpp_code)."""
+        index = cls(**kwargs)
+        for position, record in enumerate(iter_records(path)):
+            if record.get("fortran_code") and record.get("cpp_code"):
+                index.add(record.get("id", position), record["fortran_code"], record["cpp_code"])
+        return index
+
+    @classmethod
+    def load(cls, path) -> "RetrievalIndex":
+        """A saved index (`save`) or, for any other file, an index built from it as a code-pair file."""
+        if path.endswith(".jsonl"):
+            return cls.from_pairs(path)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return cls.from_pairs(path)
+        index = cls(data["k1"], data["b"])
+        index.docs = data["docs"]
+        index.postings = data["postings"]
+        index._lengths = data["lengths"]
+        return index
+
+    def save(self, path):
+        data = {"version": INDEX_VERSION, "k1": self.k1, "b": self.b, "docs": self.docs,
+                "lengths": self._lengths, "postings": self.postings}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def scores(self, fortran_code) -> Dict[int, float]:
+        """BM25 score of every document sharing at least one token with the query."""
+        n = len(self.docs)
+        if not n:
+            return {}
+        avg_len = sum(self._lengths) / n or 1.0
+        scores: Dict[int, float] = {}
+        for token in set(fortran_tokens(fortran_code)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1.0 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                norm = self.k1 * (1.0 - self.b + self.b * self._lengths[doc] / avg_len)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1.0) / (tf + norm)
+        return scores
+
+    def search(self, fortran_code, k=DEFAULT_K, max_example_chars=MAX_EXAMPLE_CHARS) -> List[Dict]:
+        """Top-k pairs for a Fortran program: dicts with id, score, fortran_code, cpp_code."""
+        digest = source_digest(fortran_code)
+        hits = []
+        ranked = sorted(self.scores(fortran_code).items(), key=lambda item: -item[1])
+        for doc, score in ranked:
+            pair = self.docs[doc]
+            if pair["digest"] == digest:
+                continue
+            if len(pair["fortran_code"]) + len(pair["cpp_code"]) > max_example_chars:
+                continue
+            hits.append({"id": pair["id"], "score": round(score, 4), "fortran_code": pair["fortran_code"],
+                         "cpp_code": pair["cpp_code"]})
+            if len(hits) == k:
+                break
+        return hits
+
+
+def format_examples(hits: Iterable[Dict]) -> str:
+    """Few-shot block for the Phase B prompt ('' when there are no hits)."""
+    examples = [few_shot_example.format(n=n, fortran_code=hit["fortran_code"].strip(), cpp_code=hit["cpp_code"].strip())
+                for n, hit in enumerate(hits, 1)]
+    return few_shot_header + "".join(examples) if examples else ""
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def default_retrieval_index() -> Optional[RetrievalIndex]:
+    """Index loaded from $F2C_RETRIEVAL_INDEX once per process; None when the variable is unset."""
+    global _default_index
+    path = os.getenv(RETRIEVAL_ENV)
+    if not path:
+        return None
+    with _default_lock:
+        if _default_index is None:
+            _default_index = RetrievalIndex.load(path)
+        return _default_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 index of verified Fortran/C++ pairs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="index a code-pair JSON/JSONL and save it")
+    build.add_argument("--pairs", required=True)
+    build.add_argument("--out", required=True)
+    query = sub.add_parser("query", help="nearest pairs for one Fortran file")
+    query.add_argument("--index", required=True, help="saved index or code-pair JSONL")
+    query.add_argument("--fortran", required=True)
+    query.add_argument("-k", type=int, default=DEFAULT_K)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = RetrievalIndex.from_pairs(args.pairs)
+        index.save(args.out)
+        print(f"{len(index)} pairs, {len(index.postings)} terms -> {args.out}")
+    else:
+        index = RetrievalIndex.load(args.index)
+        with open(args.fortran, "r", encoding="utf-8") as f:
+            code = f.read()
+        for hit in index.search(code, args.k):
+            print(f"{hit['score']:9.3f}  {hit['id']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Sharded batch runner for the two-phase pipeline.
+
+`run` pushes one slice of an input corpus (any JSON/JSONL with a `fortran_code` field, e.g.
+data/f2c_code_pair_*.jsonl) through AgentOrchestrator. A sample belongs to shard
+blake2b(id) % N, so every node computes its slice alone, with no coordination. Each shard
+writes to <out-dir>/shard-<i>-of-<N>/:
+  dialogues.jsonl   one line per finished sample: position, id, success, messages
+  pairs.jsonl       verified fortran/cpp pairs of the successful samples
+                    (with --perf-profile: runtime profile under metadata.perf, see perf_profile.py)
+  telemetry-<run id>.jsonl   events and summaries of one invocation (Telemetry.write_jsonl)
+  shard.json        input, shard, samples assigned / finished
+Finished samples are appended as they complete, so a restarted shard skips them.
+
+`merge` combines all shards, in input order, into the final datasets
+  f2c_dialogue_<name>.json              (same layout as data/f2c_dialogue_*.json)
+  f2c_code_pair_<name>_dataset.jsonl    (same layout as data/f2c_code_pair_*.jsonl)
+and refuses missing or unfinished shards unless --allow-partial is given.
+
+Example:
+  python runner.py run --input ../data/f2c_code_pair_test_dataset.jsonl --shard 3/8 --workers 4 --out-dir ../runs/test
+  python runner.py merge --out-dir ../runs/test --name test
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+try:
+    from agent import COMPILE_PROFILES, DEFAULT_MODEL_ID, AgentOrchestrator
+    from dialogue_store import iter_jsonl, iter_records
+    from executor import make_executor
+    from perf_profile import PerfProfiler
+    from retrieval import RetrievalIndex
+    from memo_store import MemoStore
+    from prompt_f2c_output_comparison import q_translate_to_cpp_same_test
+    from prompt_registry import PROMPTS_VERSION
+    from telemetry import Telemetry
+except ImportError:
+    from utils.agent import COMPILE_PROFILES, DEFAULT_MODEL_ID, AgentOrchestrator
+    from utils.dialogue_store import iter_jsonl, iter_records
+    from utils.executor import make_executor
+    from utils.perf_profile import PerfProfiler
+    from utils.retrieval import RetrievalIndex
+    from utils.memo_store import MemoStore
+    from utils.prompt_f2c_output_comparison import q_translate_to_cpp_same_test
+    from utils.prompt_registry import PROMPTS_VERSION
+    from utils.telemetry import Telemetry
+
+SHARD_DIR = "shard-{index:05d}-of-{count:05d}"
+DIALOGUES = "dialogues.jsonl"
+PAIRS = "pairs.jsonl"
+TELEMETRY = "telemetry-{run_id}.jsonl"
+SHARD_META = "shard.json"
+
+
+def parse_shard(spec) -> Tuple[int, int]:
+    """'3/8' -> (3, 8)."""
+    try:
+        index, count = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"--shard must look like i/N, got {spec!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"--shard {spec}: need 0 <= i < N")
+    return index, count
+
+
+def sample_key(record, position) -> str:
+    return str(record.get("id", position))
+
+
+def shard_of(key, count) -> int:
+    """Stable shard of a sample id (independent of corpus order and Python's hash seed)."""
+    digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+def iter_shard(path, index, count) -> Iterator[Tuple[int, Dict]]:
+    """(position, record) of the corpus records that belong to shard `index` of `count`."""
+    for position, record in enumerate(iter_records(path)):
+        if shard_of(sample_key(record, position), count) == index:
+            yield position, record
+
+
+def code_pair_record(position, sample_id, model, fortran_code, cpp_code, perf=None) -> Dict:
+    """A verified pair in the layout of data/f2c_code_pair_*.jsonl (plus metadata.perf when profiled)."""
+    prompt = q_translate_to_cpp_same_test.strip() + "\n\nFortran code:\n```fortran\n" + fortran_code + "\n```"
+    record = {
+        "messages": [{"role": "user", "content": prompt},
+                     {"role": "assistant", "content": "```cpp\n" + cpp_code + "\n```"}],
+        "id": f"{model}_{position}",
+        "index": position,
+        "source": {"original_id": sample_id},
+        "fortran_code": fortran_code,
+        "cpp_code": cpp_code,
+    }
+    if perf is not None:
+        record["metadata"] = {"perf": perf}
+    return record
+
+
+def _done_positions(path) -> set:
+    if not os.path.exists(path):
+        return set()
+    return {row["position"] for row in iter_jsonl(path)}
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def make_client(replay):
+    """None (the orchestrator's OpenAI client) or an offline replay stub over recorded data files."""
+    if not replay:
+        return None
+    try:
+        from stub_llm import FakeOpenAI, ReplayIndex
+    except ImportError:
+        from utils.stub_llm import FakeOpenAI, ReplayIndex
+    index = ReplayIndex.from_files(dialogues=[p for p in replay if not p.endswith(".jsonl")],
+                                   code_pairs=[p for p in replay if p.endswith(".jsonl")])
+    return FakeOpenAI(index)
+
+
+def run_shard(input_path, index, count, out_dir, workers=1, model=DEFAULT_MODEL_ID, turns_limitation=3,
+              max_completion_tokens=4096, compile_profile="default", patch_mode=False, limit=None,
+              sandbox_root=None, client=None, executor=None, perf_profiler=None, retrieval=None,
+              memo_store=None) -> Dict:
+    """Process every unfinished sample of one shard; returns the shard metadata."""
+    shard_dir = os.path.join(out_dir, SHARD_DIR.format(index=index, count=count))
+    os.makedirs(shard_dir, exist_ok=True)
+    dialogues_path = os.path.join(shard_dir, DIALOGUES)
+    pairs_path = os.path.join(shard_dir, PAIRS)
+    sandbox_root = sandbox_root or os.path.join(shard_dir, "sandbox")
+
+    assigned = list(iter_shard(input_path, index, count))
+    if limit is not None:
+        assigned = assigned[:limit]
+    done = _done_positions(dialogues_path)
+    todo = [(position, record) for position, record in assigned if position not in done]
+    logging.info("[runner] shard %d/%d: %d assigned, %d already done, %d to run",
+                 index, count, len(assigned), len(assigned) - len(todo), len(todo))
+
+    telemetry = Telemetry()
+    write_lock = threading.Lock()
+    finished = {"samples": 0, "succeeded": 0}
+
+    def one(item):
+        position, record = item
+        sample_id = sample_key(record, position)
+        orchestrator = AgentOrchestrator(
+            max_completion_tokens=max_completion_tokens,
+            gpt_model=model,
+            turns_limitation=turns_limitation,
+            idx=position,
+            telemetry=telemetry,
+            client=client.session_client(seed=position) if hasattr(client, "session_client") else client,
+            sandbox_root=sandbox_root,
+            output_dir=os.path.join(shard_dir, "code"),
+            compile_profile=compile_profile,
+            patch_mode=patch_mode,
+            executor=executor,
+            perf_profiler=perf_profiler,
+            retrieval=retrieval,
+            memo_store=memo_store,
+        )
+        try:
+            history, ok = orchestrator.run(record["fortran_code"])
+        except Exception as e:
+            # One broken sample must not take the shard down; it is retried on the next run
+            logging.error("[runner] sample %s raised %s: %s", sample_id, type(e).__name__, e)
+            return
+        row = {"position": position, "id": sample_id, "success": ok, "messages": history}
+        pair = None
+        if ok:
+            pair = code_pair_record(position, sample_id, model, orchestrator.fortran_baseline, orchestrator.cpp_final or "",
+                                    orchestrator.perf)
+        with write_lock:
+            if pair is not None:
+                with open(pairs_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(pair, ensure_ascii=False) + "\n")
+            with open(dialogues_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            finished["samples"] += 1
+            finished["succeeded"] += int(ok)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        list(pool.map(one, todo))
+
+    if todo:
+        telemetry.write_jsonl(os.path.join(shard_dir, TELEMETRY.format(run_id=telemetry.run_id)))
+    meta = {
+        "input": os.path.abspath(input_path),
+        "shard": index,
+        "num_shards": count,
+        "limit": limit,
+        "assigned": len(assigned),
+        "finished": len(_done_positions(dialogues_path)),
+        "this_run": finished,
+        "prompts_version": PROMPTS_VERSION,
+    }
+    _write_json(os.path.join(shard_dir, SHARD_META), meta)
+    return meta
+
+
+def _shard_dirs(out_dir) -> List[str]:
+    return sorted(glob.glob(os.path.join(out_dir, SHARD_DIR.replace("{index:05d}", "*").replace("{count:05d}", "*"))))
+
+
+def merge_shards(out_dir, name, dest_dir=None, allow_partial=False) -> Dict:
+    """Combine every shard under `out_dir` into the final dialogue and code-pair datasets."""
+    dest_dir = dest_dir or out_dir
+    metas = []
+    for shard_dir in _shard_dirs(out_dir):
+        meta_path = os.path.join(shard_dir, SHARD_META)
+        if not os.path.exists(meta_path):
+            raise SystemExit(f"{shard_dir}: no {SHARD_META}; the shard never completed a run")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            metas.append((shard_dir, json.load(f)))
+    if not metas:
+        raise SystemExit(f"no shards under {out_dir}")
+
+    counts = {meta["num_shards"] for _, meta in metas}
+    inputs = {meta["input"] for _, meta in metas}
+    if len(counts) != 1 or len(inputs) != 1:
+        raise SystemExit(f"shards disagree on input/num_shards: {sorted(inputs)} {sorted(counts)}")
+    count = counts.pop()
+    present = {meta["shard"] for _, meta in metas}
+    problems = [f"shard {i}/{count} missing" for i in range(count) if i not in present]
+    problems += [f"shard {meta['shard']}/{count} finished {meta['finished']}/{meta['assigned']}"
+                 for _, meta in metas if meta["finished"] < meta["assigned"]]
+    if problems and not allow_partial:
+        raise SystemExit("incomplete run (use --allow-partial to merge anyway):\n  " + "\n  ".join(problems))
+    for problem in problems:
+        logging.warning("[runner] %s", problem)
+
+    dialogues, pairs = [], []
+    for shard_dir, _ in metas:
+        dialogues_path = os.path.join(shard_dir, DIALOGUES)
+        pairs_path = os.path.join(shard_dir, PAIRS)
+        if os.path.exists(dialogues_path):
+            dialogues.extend(iter_jsonl(dialogues_path))
+        if os.path.exists(pairs_path):
+            pairs.extend(iter_jsonl(pairs_path))
+    # A sample re-run after a crash may appear twice; the last line wins
+    dialogues = sorted({row["position"]: row for row in dialogues}.values(), key=lambda row: row["position"])
+    pairs = sorted({row["index"]: row for row in pairs}.values(), key=lambda row: row["index"])
+
+    source_file = os.path.basename(inputs.pop())
+    os.makedirs(dest_dir, exist_ok=True)
+    dialogue_path = os.path.join(dest_dir, f"f2c_dialogue_{name}.json")
+    _write_json(dialogue_path, [{"id": row["position"], "messages": row["messages"], "source_file": source_file,
+                                 "original_id": row["id"]} for row in dialogues])
+    pairs_path = os.path.join(dest_dir, f"f2c_code_pair_{name}_dataset.jsonl")
+    tmp_path = f"{pairs_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for row in pairs:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, pairs_path)
+    return {"shards": len(metas), "dialogues": len(dialogues), "pairs": len(pairs),
+            "dialogue_file": dialogue_path, "pair_file": pairs_path}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the F2C pipeline over a sharded corpus and merge the results.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="process one shard of the input corpus")
+    run.add_argument("--input", required=True, help="JSON/JSONL corpus with a fortran_code field")
+    run.add_argument("--shard", type=parse_shard, default=(0, 1), help="i/N: this node's slice (default 0/1)")
+    run.add_argument("--workers", type=int, default=1, help="samples processed concurrently")
+    run.add_argument("--out-dir", required=True)
+    run.add_argument("--model", default=DEFAULT_MODEL_ID)
+    run.add_argument("--turns", type=int, default=3, help="turns_limitation per phase")
+    run.add_argument("--max-completion-tokens", type=int, default=4096)
+    run.add_argument("--compile-profile", default="default", choices=sorted(COMPILE_PROFILES))
+    run.add_argument("--patch-mode", action="store_true", help="allow diff / SEARCH-REPLACE repair replies")
+    run.add_argument("--limit", type=int, default=None, help="at most this many samples of the shard")
+    run.add_argument("--sandbox", default=None, help="compile sandbox (default: <shard dir>/sandbox)")
+    run.add_argument("--executor", default=None,
+                     help="inline | local[:N] | http://node:8600[,...] (default: $F2C_EXECUTOR or inline)")
+    run.add_argument("--perf-profile", action="store_true",
+                     help="profile each verified pair at -O2/-O3 and store metadata.perf")
+    run.add_argument("--perf-scaling", action="store_true",
+                     help="with --perf-profile: also run the OpenMP thread-scaling test")
+    run.add_argument("--max-threads", type=int, default=None, help="highest thread count of --perf-scaling")
+    run.add_argument("--retrieval", default=None,
+                     help="few-shot examples from this code-pair JSONL or saved retrieval index")
+    run.add_argument("--memo", default=None, help="SQLite memo store of verified pairs (see memo_store.py)")
+    run.add_argument("--replay", nargs="*", default=None,
+                     help="offline: answer from these dialogue (.json) / code-pair (.jsonl) files via stub_llm")
+
+    merge = sub.add_parser("merge", help="combine all shards into the final datasets")
+    merge.add_argument("--out-dir", required=True)
+    merge.add_argument("--name", required=True, help="dataset name, e.g. test -> f2c_dialogue_test.json")
+    merge.add_argument("--dest", default=None, help="where to write the datasets (default: --out-dir)")
+    merge.add_argument("--allow-partial", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "run":
+        index, count = args.shard
+        executor = make_executor(args.executor) if args.executor else None
+        try:
+            meta = run_shard(args.input, index, count, args.out_dir, workers=args.workers, model=args.model,
+                             turns_limitation=args.turns, max_completion_tokens=args.max_completion_tokens,
+                             compile_profile=args.compile_profile, patch_mode=args.patch_mode, limit=args.limit,
+                             sandbox_root=args.sandbox, client=make_client(args.replay), executor=executor,
+                             perf_profiler=PerfProfiler(scaling=args.perf_scaling, max_threads=args.max_threads)
+                             if args.perf_profile or args.perf_scaling else None,
+                             retrieval=RetrievalIndex.load(args.retrieval) if args.retrieval else None,
+                             memo_store=MemoStore(args.memo) if args.memo else None)
+        finally:
+            if executor is not None:
+                executor.close()
+        print(f"shard {index}/{count}: {meta['finished']}/{meta['assigned']} finished, "
+              f"{meta['this_run']['succeeded']}/{meta['this_run']['samples']} succeeded this run")
+    else:
+        result = merge_shards(args.out_dir, args.name, args.dest, args.allow_partial)
+        print(f"{result['dialogues']} dialogues, {result['pairs']} pairs from {result['shards']} shards -> "
+              f"{result['dialogue_file']}, {result['pair_file']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for the LLaMA-Factory configs under sft/configs.
+
+The configs are flat `key: value` YAML files; PyYAML is used when installed, otherwise a minimal
+line parser that handles exactly that shape.
+"""
+import glob
+import os
+from typing import Dict, Iterator, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_ROOT = os.path.join(REPO_ROOT, "sft", "configs")
+
+# LLaMA-Factory dataset name -> file in data/ (derived variants are produced by sft_variants.py)
+DATASET_FILES = {
+    "f2cpp_dialogue_train": os.path.join(REPO_ROOT, "data", "f2c_dialogue_train.json"),
+    "f2cpp_codepair_train": os.path.join(REPO_ROOT, "data", "f2c_code_pair_train_dataset.jsonl"),
+    "f2cpp_dialogue_train_pair": os.path.join(REPO_ROOT, "data", "variants", "f2cpp_dialogue_train_pair.jsonl"),
+    "f2cpp_feedback_train": os.path.join(REPO_ROOT, "data", "variants", "f2cpp_feedback_train.jsonl"),
+    "f2cpp_dialogue_train_full": os.path.join(REPO_ROOT, "data", "variants", "f2cpp_dialogue_train_full.jsonl"),
+    "f2cpp_dialogue_train_nosys": os.path.join(REPO_ROOT, "data", "variants", "f2cpp_dialogue_train_nosys.jsonl"),
+}
+
+
+def _parse_scalar(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+        return value[1:-1]
+    lowered = value.lower()
+    if lowered in ("null", "~", ""):
+        return None
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_sft_config(path) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        import yaml
+    except ImportError:
+        yaml = None
+    if yaml is not None:
+        return yaml.safe_load(text) or {}
+    config = {}
+    for line in text.splitlines():
+        line = line.split(" #", 1)[0].rstrip()
+        if not line or line.lstrip().startswith("#") or ":" not in line:
+            continue
+        key, value = line.split(":", 1)
+        config[key.strip()] = _parse_scalar(value)
+    return config
+
+
+def iter_sft_configs(root=CONFIG_ROOT, pattern="**/*.yaml") -> Iterator[Tuple[str, Dict]]:
+    """Yield (path relative to `root`, config dict) in sorted order."""
+    for path in sorted(glob.glob(os.path.join(root, pattern), recursive=True)):
+        yield os.path.relpath(path, root), read_sft_config(path)
+
+
+def dataset_files(config, overrides=None) -> Dict[str, str]:
+    """Map the config's comma-separated `dataset` names to data files (overrides take precedence)."""
+    files = dict(DATASET_FILES)
+    files.update(overrides or {})
+    names = [n.strip() for n in str(config.get("dataset") or "").split(",") if n.strip()]
+    return {n: files.get(n) for n in names}
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Derive the SFT dataset variants referenced by sft/configs from raw dialogue histories.
+
+Variants (output name for the train split in parentheses):
+  full      every message, unchanged                                  (f2cpp_dialogue_train_full)
+  pair      system + task prompt + FINAL fortran/cpp pair reply       (f2cpp_dialogue_train_pair)
+  feedback  one sample per repair turn: feedback + the program it
+            refers to -> the repaired reply                           (f2cpp_feedback_train)
+  nosys     the full dialogue without system messages                 (f2cpp_dialogue_train_nosys)
+
+Records are transformed in fixed-size shards on a process pool and written in input order, so the
+output is byte-identical regardless of --workers. `data/variants/manifest.json` records the content
+digest of every processed dialogue per variant; reruns only transform dialogues that are new and
+append them (use --rebuild after changing a transform).
+
+Example:
+  python sft_variants.py ../data/f2c_dialogue_train.json --workers 8
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List
+
+try:
+    from dialogue_store import iter_records, sample_digest
+    from prompt_f2c_output_comparison import end_prompt_, q_generate_fortran_bench_first, q_translate_to_cpp_same_test
+    from sft_config import REPO_ROOT
+    from text_utils import FENCE, scan_fences
+except ImportError:
+    from utils.dialogue_store import iter_records, sample_digest
+    from utils.prompt_f2c_output_comparison import end_prompt_, q_generate_fortran_bench_first, q_translate_to_cpp_same_test
+    from utils.sft_config import REPO_ROOT
+    from utils.text_utils import FENCE, scan_fences
+
+VARIANTS_VERSION = 1
+VARIANT_NAMES = {
+    "full": "f2cpp_dialogue_{split}_full",
+    "pair": "f2cpp_dialogue_{split}_pair",
+    "feedback": "f2cpp_feedback_{split}",
+    "nosys": "f2cpp_dialogue_{split}_nosys",
+}
+DEFAULT_OUT = os.path.join(REPO_ROOT, "data", "variants")
+MANIFEST = "manifest.json"
+SHARD_SIZE = 64
+
+# Orchestrator prompts that are not compiler/runtime feedback
+_FLOW_PROMPTS = tuple(p.strip()[:60] for p in (q_generate_fortran_bench_first, q_translate_to_cpp_same_test, end_prompt_))
+
+
+def is_feedback_prompt(content) -> bool:
+    return not (content or "").strip().startswith(_FLOW_PROMPTS)
+
+
+def _last_program(content):
+    """Last fenced block of an assistant reply as (lang, body), or None."""
+    blocks = list(scan_fences(content or ""))
+    return blocks[-1] if blocks else None
+
+
+def variant_full(record) -> List[Dict]:
+    return [{"messages": record["messages"]}]
+
+
+def variant_nosys(record) -> List[Dict]:
+    return [{"messages": [m for m in record["messages"] if m["role"] != "system"]}]
+
+
+def variant_pair(record) -> List[Dict]:
+    messages = record["messages"]
+    system = [m for m in messages if m["role"] == "system"][:1]
+    users = [m for m in messages if m["role"] == "user"]
+    if not users or messages[-1]["role"] != "assistant":
+        return []
+    prompt = users[0]["content"]
+    if len(users) > 1:
+        prompt = prompt.rstrip() + "\n" + users[-1]["content"]
+    return [{"messages": system + [{"role": "user", "content": prompt}, messages[-1]]}]
+
+
+def variant_feedback(record) -> List[Dict]:
+    messages = record["messages"]
+    system = [m for m in messages if m["role"] == "system"][:1]
+    samples = []
+    for i in range(1, len(messages) - 1):
+        m, reply, prev = messages[i], messages[i + 1], messages[i - 1]
+        if m["role"] != "user" or reply["role"] != "assistant" or prev["role"] != "assistant":
+            continue
+        if not is_feedback_prompt(m["content"]):
+            continue
+        program = _last_program(prev["content"])
+        if program is None:
+            continue
+        lang, body = program
+        prompt = f"{m['content'].rstrip()}\n\nCurrent program:\n{FENCE}{lang}\n{body}\n{FENCE}\n"
+        samples.append({"turn": i, "messages": system + [{"role": "user", "content": prompt}, reply]})
+    return samples
+
+
+TRANSFORMS = {"full": variant_full, "pair": variant_pair, "feedback": variant_feedback, "nosys": variant_nosys}
+
+
+def _transform_shard(args):
+    shard, variants = args
+    out = {v: [] for v in variants}
+    for digest, record in shard:
+        source_id = str(record.get("id"))
+        for v in variants:
+            for k, sample in enumerate(TRANSFORMS[v](record)):
+                suffix = f"-{sample.pop('turn')}" if "turn" in sample else (f"-{k}" if k else "")
+                out[v].append((digest, {"id": f"{source_id}{suffix}", "source_id": source_id, "variant": v, **sample}))
+    return [digest for digest, _ in shard], out
+
+
+def _shards(records, done, shard_size) -> Iterator[List]:
+    shard = []
+    for position, record in enumerate(records):
+        record.setdefault("id", position)
+        digest = sample_digest(record["messages"])
+        if digest in done:
+            continue
+        shard.append((digest, record))
+        if len(shard) >= shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def _map_shards(shards, workers):
+    """Transform shards in input order, on a process pool when workers > 1."""
+    if workers <= 1:
+        yield from map(_transform_shard, shards)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_transform_shard, shards)
+
+
+def _load_manifest(path) -> Dict:
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"version": VARIANTS_VERSION, "outputs": {}}
+
+
+def build_variants(src_path, out_dir=DEFAULT_OUT, variants=tuple(TRANSFORMS), split=None,
+                   workers=1, shard_size=SHARD_SIZE, rebuild=False) -> Dict[str, Dict]:
+    """Transform new dialogues of `src_path` into each variant; returns per-output counts."""
+    split = split or ("test" if "test" in os.path.basename(src_path) else "train")
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    manifest = _load_manifest(manifest_path)
+    if manifest.get("version") != VARIANTS_VERSION:
+        manifest, rebuild = {"version": VARIANTS_VERSION, "outputs": {}}, True
+
+    names = {v: VARIANT_NAMES[v].format(split=split) for v in variants}
+    states = {}
+    for v, name in names.items():
+        path = os.path.join(out_dir, f"{name}.jsonl")
+        state = manifest["outputs"].get(name)
+        if rebuild or state is None or not os.path.exists(path):
+            state = {"source": os.path.basename(src_path), "digests": [], "samples": 0}
+        manifest["outputs"][name] = states[v] = state
+    # Dialogues already in every requested variant are skipped before transforming
+    known_digests = {v: set(s["digests"]) for v, s in states.items()}
+    done = set.intersection(*known_digests.values()) if known_digests else set()
+
+    files = {v: open(os.path.join(out_dir, f"{names[v]}.jsonl"), "a" if states[v]["digests"] else "w",
+                      encoding="utf-8") for v in variants}
+    added = {names[v]: 0 for v in variants}
+    try:
+        shards = ((shard, tuple(variants)) for shard in _shards(iter_records(src_path), done, shard_size))
+        for digests, out in _map_shards(shards, workers):
+            for v in variants:
+                known = known_digests[v]
+                rows = [sample for digest, sample in out[v] if digest not in known]
+                for sample in rows:
+                    files[v].write(json.dumps(sample, ensure_ascii=False) + "\n")
+                fresh = [d for d in digests if d not in known]
+                known.update(fresh)
+                states[v]["digests"].extend(fresh)
+                states[v]["samples"] += len(rows)
+                added[names[v]] += len(rows)
+    finally:
+        for f in files.values():
+            f.close()
+
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+    return {names[v]: {"added": added[names[v]], "samples": states[v]["samples"],
+                       "dialogues": len(states[v]["digests"])} for v in variants}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build SFT dataset variants from raw dialogue histories.")
+    parser.add_argument("src", help="data/f2c_dialogue_*.json (or .jsonl)")
+    parser.add_argument("--variant", action="append", choices=sorted(TRANSFORMS),
+                        help="variant to build (repeatable; default: all)")
+    parser.add_argument("--split", default=None, help="split used in output names (default: from the file name)")
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--rebuild", action="store_true", help="ignore the manifest and rewrite every output")
+    args = parser.parse_args()
+
+    result = build_variants(args.src, args.out, tuple(args.variant or TRANSFORMS), args.split,
+                            args.workers, args.shard_size, args.rebuild)
+    for name, r in result.items():
+        print(f"{name}: +{r['added']} samples ({r['samples']} total from {r['dialogues']} dialogues)")
+
+
+if __name__ == "__main__":
+    main()
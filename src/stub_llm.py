@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Offline stand-in for an OpenAI-compatible chat completion endpoint.
+
+Replays recorded conversations (data/f2c_dialogue_*.json) and verified code pairs
+(data/f2c_code_pair_*.jsonl) so the full pipeline, including real gfortran/g++ compiles,
+can be benchmarked and profiled without a live API.
+
+Lookup order for a request:
+  1) exact message-prefix match against a recorded dialogue
+  2) exact match of the last user message
+  3) (in-process client only) next recorded reply of the dialogue this session matched before
+  4) a Fortran block in the request that matches a known verified pair -> reply with the pair
+  5) echo the latest code blocks found in the request (keeps the pipeline moving)
+
+Usage:
+  In-process:  client = FakeOpenAI(ReplayIndex.from_files(dialogues=[...], code_pairs=[...]), latency=0.2)
+               AgentOrchestrator(..., client=client)
+  Server:      python stub_llm.py --dialogues ../data/f2c_dialogue_train.json --port 8000
+               export OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=stub
+  Check:       python stub_llm.py --dialogues ../data/f2c_dialogue_test.json --check
+               (distinct provided sources must replay distinct programs)
+"""
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+try:
+    from telemetry import estimate_tokens
+    from text_utils import FORTRAN_LANGS, extract_codes_from_text
+except ImportError:
+    from utils.telemetry import estimate_tokens
+    from utils.text_utils import FORTRAN_LANGS, extract_codes_from_text
+
+MISS_TAGS = '["replay-miss"]'
+# Fences at the start of a line only: the Phase A prompt mentions "a ```fortran fenced block" inline,
+# and pairing that with the opening fence of the real source would key every sample on boilerplate
+_FORTRAN_BLOCK_RE = re.compile(r"^```[ \t]*(?:%s)[ \t]*\n(.*?)^[ \t]*```" % "|".join(FORTRAN_LANGS),
+                               re.MULTILINE | re.DOTALL | re.IGNORECASE)
+
+
+def _message_digest(message) -> bytes:
+    return hashlib.sha1(f"{message.get('role', '')}\x00{message.get('content') or ''}".encode("utf-8", "replace")).digest()
+
+
+def _prefix_key(messages) -> str:
+    h = hashlib.sha1()
+    for m in messages:
+        h.update(_message_digest(m))
+    return h.hexdigest()
+
+
+def _source_key(code) -> str:
+    return hashlib.sha1(" ".join((code or "").split()).encode("utf-8", "replace")).hexdigest()
+
+
+def _fortran_blocks(text):
+    return _FORTRAN_BLOCK_RE.findall(text or "")
+
+
+class ReplayIndex:
+    """
+    Lookup tables built from recorded dialogues and verified code pairs.
+    """
+
+    def __init__(self):
+        self.by_prefix: Dict[str, Tuple[int, int]] = {}
+        self.by_last_user: Dict[str, Tuple[int, int]] = {}
+        self.by_source: Dict[str, Tuple[str, str]] = {}
+        self.dialogues: List[List[Dict]] = []
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_files(cls, dialogues=(), code_pairs=()):
+        index = cls()
+        for path in dialogues:
+            with open(path, "r", encoding="utf-8") as f:
+                for d in json.load(f):
+                    index.add_dialogue(d["messages"])
+        for path in code_pairs:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        pair = json.loads(line)
+                        index.add_pair(pair["fortran_code"], pair["cpp_code"])
+                        # The pair's own prompt/answer (what evaluate.py sends) replays by prefix
+                        if pair.get("messages"):
+                            index.add_dialogue(pair["messages"])
+        logging.info("[stub] replay index: %d dialogues, %d prefixes, %d source pairs",
+                     len(index.dialogues), len(index.by_prefix), len(index.by_source))
+        return index
+
+    def add_dialogue(self, messages):
+        d = len(self.dialogues)
+        self.dialogues.append(messages)
+        h = hashlib.sha1()
+        last_user = None
+        for pos, m in enumerate(messages):
+            if m["role"] == "assistant":
+                self.by_prefix.setdefault(h.hexdigest(), (d, pos))
+                if last_user is not None:
+                    self.by_last_user.setdefault(last_user, (d, pos))
+            elif m["role"] == "user":
+                last_user = _source_key(m["content"])
+            h.update(_message_digest(m))
+
+        # Original source -> final verified pair, and final Fortran -> itself
+        final_fortran, final_cpp = extract_codes_from_text(messages[-1]["content"]) if messages else (None, None)
+        if final_fortran and final_cpp:
+            self.add_pair(final_fortran, final_cpp)
+            for m in messages:
+                if m["role"] == "user":
+                    for src in _fortran_blocks(m["content"]):
+                        self.by_source.setdefault(_source_key(src), (final_fortran, final_cpp))
+                    break
+
+    def add_pair(self, fortran_code, cpp_code):
+        self.by_source.setdefault(_source_key(fortran_code), (fortran_code, cpp_code))
+
+    def lookup(self, messages, session=None) -> str:
+        """Return the replay reply for a request; `session` is a mutable dict for in-process affinity."""
+        hit = self.by_prefix.get(_prefix_key(messages))
+        kind = "prefix"
+        if hit is None:
+            last_user = next((m for m in reversed(messages) if m["role"] == "user"), None)
+            if last_user is not None:
+                hit = self.by_last_user.get(_source_key(last_user["content"]))
+                kind = "last_user"
+        if hit is None and session and "dialogue" in session:
+            d, pos = session["dialogue"], session["pos"]
+            msgs = self.dialogues[d]
+            nxt = next((p for p in range(pos + 1, len(msgs)) if msgs[p]["role"] == "assistant"), None)
+            if nxt is not None:
+                hit, kind = (d, nxt), "session"
+        if hit is not None:
+            d, pos = hit
+            if session is not None:
+                session["dialogue"], session["pos"] = d, pos
+            self._count(kind)
+            return self.dialogues[d][pos]["content"]
+
+        for m in reversed(messages):
+            # Last block first: few-shot examples precede the program to translate
+            for src in reversed(_fortran_blocks(m.get("content"))):
+                pair = self.by_source.get(_source_key(src))
+                if pair is not None:
+                    self._count("source")
+                    return f'["replay-pair"]\n```fortran\n{pair[0]}\n```\n\n```cpp\n{pair[1]}\n```'
+
+        self._count("miss")
+        fortran_code, cpp_code = None, None
+        for m in messages:
+            f, c = extract_codes_from_text(m.get("content"))
+            fortran_code, cpp_code = f or fortran_code, c or cpp_code
+        blocks = [f"```{lang}\n{code}\n```" for lang, code in (("fortran", fortran_code), ("cpp", cpp_code)) if code]
+        return "\n\n".join([MISS_TAGS] + blocks)
+
+    def _count(self, kind):
+        with self._lock:
+            self.stats[kind] += 1
+
+    def check_sources(self) -> Tuple[int, int]:
+        """
+        (distinct provided sources, distinct programs they replay) over the recorded dialogues that
+        end in a final pair, each source looked up on its own; fewer programs than sources means
+        inputs collapse onto one replay.
+        """
+        sources, programs = set(), set()
+        for messages in self.dialogues:
+            if not all(extract_codes_from_text(messages[-1]["content"])):
+                continue  # e.g. the prompt/answer of a code-pair record
+            first_user = next((m for m in messages if m["role"] == "user"), None)
+            blocks = _fortran_blocks(first_user["content"]) if first_user else []
+            if not blocks or _source_key(blocks[-1]) not in self.by_source:
+                continue
+            sources.add(_source_key(blocks[-1]))
+            programs.add(_source_key(self.by_source[_source_key(blocks[-1])][0]))
+        return len(sources), len(programs)
+
+
+class _Completions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, model=None, messages=None, max_tokens=None, n=1, **kwargs):
+        return self._owner._complete(model, messages or [], n, self._owner._session)
+
+
+class FakeOpenAI:
+    """
+    In-process replacement for `openai.OpenAI` exposing `chat.completions.create`.
+
+    Synthetic latency per call = latency + prompt_tokens / prompt_tps + completion_tokens / completion_tps
+    (each term skipped when its rate is None), scaled by a seeded +-jitter fraction.
+    """
+
+    def __init__(self, index: ReplayIndex, latency=0.0, prompt_tps=None, completion_tps=None, jitter=0.0, seed=0):
+        self.index = index
+        self.latency = latency
+        self.prompt_tps = prompt_tps
+        self.completion_tps = completion_tps
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._session: Dict = {}
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def session_client(self, seed=None):
+        """A new client sharing the index and latency model but with its own replay session."""
+        return FakeOpenAI(self.index, self.latency, self.prompt_tps, self.completion_tps, self.jitter,
+                          self._rng.random() if seed is None else seed)
+
+    def synthetic_delay(self, prompt_tokens, completion_tokens) -> float:
+        delay = self.latency
+        if self.prompt_tps:
+            delay += prompt_tokens / self.prompt_tps
+        if self.completion_tps:
+            delay += completion_tokens / self.completion_tps
+        if self.jitter:
+            delay *= 1.0 + self._rng.uniform(-self.jitter, self.jitter)
+        return max(delay, 0.0)
+
+    def _complete(self, model, messages, n=1, session=None):
+        answers = [self.index.lookup(messages, session) for _ in range(max(n, 1))]
+        prompt_tokens = sum(estimate_tokens(m.get("content")) for m in messages)
+        completion_tokens = sum(estimate_tokens(a) for a in answers)
+        delay = self.synthetic_delay(prompt_tokens, completion_tokens)
+        if delay:
+            time.sleep(delay)
+        return completion_response(model, answers, prompt_tokens, completion_tokens)
+
+
+def completion_response(model, answers, prompt_tokens, completion_tokens):
+    """OpenAI-shaped response object (attribute access) for the in-process client."""
+    choices = [SimpleNamespace(index=i, finish_reason="stop",
+                               message=SimpleNamespace(role="assistant", content=a))
+               for i, a in enumerate(answers)]
+    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                            total_tokens=prompt_tokens + completion_tokens, prompt_tokens_details=None)
+    return SimpleNamespace(id=f"stub-{time.time_ns()}", object="chat.completion", created=int(time.time()),
+                           model=model, choices=choices, usage=usage)
+
+
+def _response_json(response) -> Dict:
+    return {
+        "id": response.id,
+        "object": response.object,
+        "created": response.created,
+        "model": response.model,
+        "choices": [{"index": c.index, "finish_reason": c.finish_reason,
+                     "message": {"role": c.message.role, "content": c.message.content}}
+                    for c in response.choices],
+        "usage": {"prompt_tokens": response.usage.prompt_tokens,
+                  "completion_tokens": response.usage.completion_tokens,
+                  "total_tokens": response.usage.total_tokens},
+    }
+
+
+def make_server(client: FakeOpenAI, host="127.0.0.1", port=8000) -> ThreadingHTTPServer:
+    """HTTP server answering POST /v1/chat/completions and GET /v1/models (stateless replay)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send(200, {"object": "list", "data": [{"id": "stub-replay", "object": "model"}]})
+            else:
+                self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            response = client._complete(request.get("model"), request.get("messages", []), request.get("n", 1))
+            self._send(200, _response_json(response))
+
+        def log_message(self, fmt, *args):
+            logging.debug("[stub] " + fmt, *args)
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay-based OpenAI-compatible stub server.")
+    parser.add_argument("--dialogues", nargs="*", default=[], help="data/f2c_dialogue_*.json files")
+    parser.add_argument("--code-pairs", nargs="*", default=[], help="data/f2c_code_pair_*.jsonl files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="fixed seconds per request")
+    parser.add_argument("--prompt-tps", type=float, default=None, help="prompt tokens/second (prefill)")
+    parser.add_argument("--completion-tps", type=float, default=None, help="completion tokens/second (decode)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+- fraction applied to the delay")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true",
+                        help="verify that distinct recorded sources replay distinct programs, then exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    index = ReplayIndex.from_files(dialogues=args.dialogues, code_pairs=args.code_pairs)
+    if args.check:
+        sources, programs = index.check_sources()
+        print(f"{sources} distinct sources -> {programs} distinct replayed programs")
+        sys.exit(0 if programs == sources else 1)
+    client = FakeOpenAI(index, args.latency, args.prompt_tps, args.completion_tps, args.jitter, args.seed)
+    server = make_server(client, args.host, args.port)
+    logging.info("[stub] serving on http://%s:%d/v1", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info("[stub] lookup stats: %s", dict(index.stats))
+
+
+if __name__ == "__main__":
+    main()
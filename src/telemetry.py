@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Per-call telemetry for the two-phase Fortran to C++ pipeline.
+
+One small event is recorded per LLM call, per compile/run step, per repair-loop detection, per
+patch-mode reply, per runtime profile of a finished pair and per memo-store hit:
+  kind, sample, phase, turn, wall_time, queue_wait, prompt/completion tokens, cache_hit
+Events never carry source code or program output, so recording is cheap enough for the hot path.
+Events aggregate into per-sample and per-run summaries and export as JSONL or Prometheus text.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+EVENT_KINDS = ("llm", "compile", "run", "cycle", "patch", "perf", "memo")
+
+
+def estimate_tokens(text) -> int:
+    """Rough token count (~4 chars/token) for servers that do not report usage."""
+    if not text:
+        return 0
+    return (len(text) + 3) // 4
+
+
+class Telemetry:
+    """
+    Thread-safe event recorder shared by one or more AgentOrchestrator instances.
+    """
+
+    def __init__(self, run_id=None, sink_path=None):
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S")
+        self.events: List[Dict] = []
+        self._lock = threading.Lock()
+        self._sink = open(sink_path, "a", encoding="utf-8") if sink_path else None
+
+    def record(self, kind, sample, phase="", turn=-1, wall_time=0.0, queue_wait=0.0,
+               prompt_tokens=0, completion_tokens=0, cache_hit=False, ok=True, **extra):
+        """Append one event; extra keyword fields are kept as-is (keep them small)."""
+        event = {
+            "run_id": self.run_id,
+            "ts": time.time(),
+            "kind": kind,
+            "sample": sample,
+            "phase": phase,
+            "turn": turn,
+            "wall_time": round(wall_time, 6),
+            "queue_wait": round(queue_wait, 6),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cache_hit": bool(cache_hit),
+            "ok": bool(ok),
+        }
+        event.update(extra)
+        with self._lock:
+            self.events.append(event)
+            if self._sink is not None:
+                self._sink.write(json.dumps(event) + "\n")
+        return event
+
+    @contextmanager
+    def timed(self, kind, sample, **fields):
+        """Context manager that records wall_time of the enclosed block; yields a dict for extra fields."""
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(kind, sample, wall_time=time.perf_counter() - start, **fields)
+
+    def close(self):
+        with self._lock:
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+
+    # ===== Aggregation =====
+    @staticmethod
+    def _summarize(events) -> Dict:
+        summary = {
+            "llm_calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cache_hits": 0,
+            "llm_time": 0.0,
+            "compile_count": 0,
+            "compile_time": 0.0,
+            "run_count": 0,
+            "run_time": 0.0,
+            "queue_wait": 0.0,
+            "cycles": 0,
+            "turns_saved": 0,
+            "compiles_saved": 0,
+            "patches_applied": 0,
+            "patches_rejected": 0,
+            "perf_time": 0.0,
+            "memo_hits": 0,
+            "turns": {},
+        }
+        for e in events:
+            kind = e["kind"]
+            if kind == "llm":
+                summary["llm_calls"] += 1
+                summary["prompt_tokens"] += e["prompt_tokens"]
+                summary["completion_tokens"] += e["completion_tokens"]
+                summary["llm_time"] += e["wall_time"]
+            elif kind in ("compile", "run"):
+                summary[f"{kind}_count"] += 1
+                summary[f"{kind}_time"] += e["wall_time"]
+            elif kind == "cycle":
+                # Repair-loop guard: reused results skip a compile, escalations/aborts skip turns
+                if e.get("action") == "reuse_result":
+                    summary["compiles_saved"] += 1
+                else:
+                    summary["cycles"] += 1
+                    summary["turns_saved"] += e.get("turns_saved", 0)
+            elif kind == "patch":
+                summary["patches_applied" if e["ok"] else "patches_rejected"] += 1
+            elif kind == "perf":
+                summary["perf_time"] += e["wall_time"]
+            elif kind == "memo":
+                summary["memo_hits"] += int(e["ok"])
+            summary["cache_hits"] += int(e["cache_hit"])
+            summary["queue_wait"] += e["queue_wait"]
+            if e["phase"] and e["turn"] >= 0:
+                summary["turns"][e["phase"]] = max(summary["turns"].get(e["phase"], 0), e["turn"] + 1)
+        for key in ("llm_time", "compile_time", "run_time", "queue_wait", "perf_time"):
+            summary[key] = round(summary[key], 6)
+        return summary
+
+    def sample_summary(self, sample) -> Dict:
+        with self._lock:
+            events = [e for e in self.events if e["sample"] == sample]
+        summary = self._summarize(events)
+        summary["sample"] = sample
+        return summary
+
+    def run_summary(self) -> Dict:
+        with self._lock:
+            events = list(self.events)
+        summary = self._summarize(events)
+        summary.pop("turns")
+        samples = sorted({e["sample"] for e in events}, key=str)
+        summary["run_id"] = self.run_id
+        summary["samples"] = len(samples)
+        summary["per_sample"] = [self.sample_summary(s) for s in samples]
+        return summary
+
+    # ===== Export =====
+    def write_jsonl(self, file_path, include_events=True):
+        """Write events (optional) followed by per-sample and per-run summary records."""
+        summary = self.run_summary()
+        with open(file_path, "w", encoding="utf-8") as f:
+            if include_events:
+                with self._lock:
+                    events = list(self.events)
+                for e in events:
+                    f.write(json.dumps({"record": "event", **e}) + "\n")
+            for s in summary["per_sample"]:
+                f.write(json.dumps({"record": "sample", "run_id": self.run_id, **s}) + "\n")
+            run_totals = {k: v for k, v in summary.items() if k != "per_sample"}
+            f.write(json.dumps({"record": "run", **run_totals}) + "\n")
+
+    def to_prometheus(self, prefix="f2c") -> str:
+        """Render counters in Prometheus text exposition format, labelled by kind and phase."""
+        with self._lock:
+            events = list(self.events)
+        totals: Dict[tuple, Dict[str, float]] = {}
+        for e in events:
+            key = (e["kind"], e["phase"] or "none")
+            t = totals.setdefault(key, {"count": 0, "seconds": 0.0, "queue_seconds": 0.0,
+                                        "prompt_tokens": 0, "completion_tokens": 0, "cache_hits": 0})
+            t["count"] += 1
+            t["seconds"] += e["wall_time"]
+            t["queue_seconds"] += e["queue_wait"]
+            t["prompt_tokens"] += e["prompt_tokens"]
+            t["completion_tokens"] += e["completion_tokens"]
+            t["cache_hits"] += int(e["cache_hit"])
+
+        lines = []
+        for metric in ("count", "seconds", "queue_seconds", "prompt_tokens", "completion_tokens", "cache_hits"):
+            name = f"{prefix}_{metric}_total"
+            lines.append(f"# TYPE {name} counter")
+            for (kind, phase), t in sorted(totals.items()):
+                lines.append(f'{name}{{run_id="{self.run_id}",kind="{kind}",phase="{phase}"}} {t[metric]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, file_path, prefix="f2c"):
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus(prefix=prefix))
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Text helpers applied to every model reply: repair-tag parsing and fenced code extraction.
+
+Repair tags are canonicalized at parse time (repair_tags.py), so "runtime error" and
+"fix-runtime-error" are the same tag everywhere downstream.
+
+The fence scanner is a single left-to-right pass over the reply using str.find; it does not
+round-trip the text through `unicode_escape` (which mangled non-ASCII and copied the reply twice).
+"""
+import json
+import re
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    from repair_tags import TAGS
+except ImportError:
+    from utils.repair_tags import TAGS
+
+FENCE = "```"
+FORTRAN_LANGS = ("fortran", "f90", "f95", "f03", "f08")
+CPP_LANGS = ("cpp", "c++", "cc", "cxx")
+_LANG_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_+#.-")
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", '"': '"', "'": "'", "\\": "\\"}
+
+
+def raw_repair_tags(reply: str) -> list:
+    """First-line JSON array of repair intent tags, exactly as the model wrote it."""
+    if not reply:
+        return []
+    end = reply.find("\n")
+    first = (reply if end < 0 else reply[:end]).strip()
+    if not first.startswith("["):
+        return []
+    try:
+        data = json.loads(first)
+        if isinstance(data, list):
+            return data
+    except Exception:
+        pass
+    return []
+
+
+def parse_repair_tag_ids(reply: str) -> List[int]:
+    """Interned canonical tag ids of the reply's repair tags (see repair_tags.TagIndex)."""
+    return TAGS.resolve_all(raw_repair_tags(reply))
+
+
+# Parse first-line JSON tags (repair intent tags), canonicalized
+def parse_repair_tags(reply: str) -> list:
+    return [TAGS.name(tid) for tid in parse_repair_tag_ids(reply)]
+
+
+def scan_fences(text: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (lang, body) for every ``` fenced block, in order.
+    `lang` is the info-string word after the opening fence (may be ''), `body` is not stripped.
+    """
+    if not text:
+        return
+    pos = 0
+    n = len(text)
+    while True:
+        start = text.find(FENCE, pos)
+        if start < 0:
+            return
+        i = start + 3
+        j = i
+        while j < n and text[j] in _LANG_CHARS:
+            j += 1
+        lang = text[i:j]
+        if j < n and not text[j].isspace():
+            # Not an info string (e.g. ```x=1```): treat the whole thing as body
+            lang, j = "", i
+        while j < n and text[j].isspace():
+            j += 1
+        end = text.find(FENCE, j)
+        if end < 0:
+            return
+        yield lang, text[j:end]
+        pos = end + 3
+
+
+def extract_codes_from_text(text: str) -> Tuple[Optional[str], Optional[str]]:
+    if not text:
+        return None, None
+    fortran_code, cpp_code = None, None
+    # Last block of each language wins
+    for lang, body in scan_fences(text):
+        lang_l = lang.lower()
+        if lang_l in FORTRAN_LANGS:
+            fortran_code = body.strip()
+        elif lang_l in CPP_LANGS:
+            cpp_code = body.strip()
+    return fortran_code, cpp_code
+
+
+def unescape_reply(text: str) -> str:
+    """
+    Undo JSON-style escaping for replies that arrive as one escaped line (literal '\\n', no real newline).
+    Any other reply is returned unchanged, without copying. In particular a '\\n' escape inside a
+    C/C++ string literal of a normal multi-line reply stays an escape (the old unicode_escape round
+    trip turned it into a raw newline, splitting the literal so the program no longer compiled).
+    """
+    if not text or "\n" in text or "\\n" not in text:
+        return text
+    out: List[str] = []
+    i, n = 0, len(text)
+    while i < n:
+        k = text.find("\\", i)
+        if k < 0 or k + 1 >= n:
+            out.append(text[i:])
+            break
+        out.append(text[i:k])
+        nxt = text[k + 1]
+        if nxt in _ESCAPES:
+            out.append(_ESCAPES[nxt])
+            i = k + 2
+        else:
+            out.append("\\")
+            i = k + 1
+    return "".join(out)
+
+
+_HEX_RE = re.compile(r"0x[0-9a-fA-F]+")
+_PATH_RE = re.compile(r"(?:[\w.~+-]*/)+([\w.+-]+)")
+_TMP_OBJ_RE = re.compile(r"\bcc[A-Za-z0-9]{6}(\.o)\b")
+
+
+def _normalize_line(line: str, lang: str, quote: Optional[str]) -> Tuple[str, Optional[str]]:
+    """One source line with comments dropped and blank runs collapsed outside string literals."""
+    out: List[str] = []
+    blank = False
+    i, n = 0, len(line)
+    while i < n:
+        c = line[i]
+        if quote:
+            # Inside a literal every character is kept as written
+            if c == "\\" and lang == "cpp" and i + 1 < n:
+                out.append(line[i:i + 2])
+                i += 2
+                continue
+            if c == quote:
+                quote = None
+            out.append(c)
+            i += 1
+            continue
+        if c.isspace():
+            blank = True
+            i += 1
+            continue
+        if lang == "fortran" and c == "!":
+            if out or line[i + 1:i + 2] != "$":
+                break
+            out.append("!$")  # !$omp / !$acc directive or conditional compilation, not a comment
+            i += 2
+            continue
+        if lang == "cpp" and c == "/" and line[i + 1:i + 2] == "/":
+            break
+        if blank and out:
+            out.append(" ")
+        blank = False
+        if c in "'\"":
+            quote = c
+        out.append(c)
+        i += 1
+    return "".join(out), quote
+
+
+def normalize_source(code: str, lang: str = "fortran") -> str:
+    """
+    Source reduced to what matters for "is this the same program" in `lang` ('fortran' or 'cpp'):
+    comments (! in Fortran, except !$ directives; // in C++), blank lines and runs of blanks
+    dropped, but only outside string literals, whose text is kept exactly. A literal still open at
+    the end of a line carries over only across a continuation (trailing & in Fortran, \\ in C++).
+    """
+    if not code:
+        return ""
+    if lang not in ("fortran", "cpp"):
+        raise ValueError(f"unknown source language {lang!r} (fortran | cpp)")
+    lines = []
+    quote = None
+    for line in code.splitlines():
+        if lang == "cpp" and 'R"' in line:
+            # Raw string literals are not scanned: keep the line as written
+            normalized, quote = line.strip(), None
+        else:
+            normalized, quote = _normalize_line(line, lang, quote)
+        if quote and not line.rstrip().endswith("&" if lang == "fortran" else "\\"):
+            quote = None
+        if normalized:
+            lines.append(normalized)
+    return "\n".join(lines)
+
+
+def normalize_diagnostics(text: str) -> str:
+    """
+    Compiler / runtime diagnostics without run-specific noise: sandbox paths reduced to the file
+    name, addresses and temporary object names masked, whitespace collapsed.
+    """
+    if not text:
+        return ""
+    text = _HEX_RE.sub("0x?", text)
+    text = _PATH_RE.sub(r"\1", text)
+    text = _TMP_OBJ_RE.sub(r"cc?\1", text)
+    return "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Token-length precomputation and cutoff-aware filtering for the SFT configs.
+
+For every model referenced by sft/configs (Qwen2.5-Coder, DeepSeek-Coder, CodeLlama, Gemma-3),
+each sample of the config's datasets is tokenized with that model's tokenizer in parallel worker
+processes. Lengths are cached by sample content hash, so reruns only tokenize new samples.
+
+Outputs (under --out):
+  truncation_report.json                     per config: samples over cutoff_len, how many are cut
+                                             inside a ``` code block, length quantiles, bucket histogram
+  <model>/cutoff<N>/<dataset>.jsonl          samples that fit the cutoff (with an `n_tokens` field)
+  <model>/cutoff<N>/buckets/<dataset>.le<B>.jsonl   the same samples split by length bucket
+
+`--approx` uses a ~4 chars/token estimate instead of HF tokenizers, for
+quick reports on machines without transformers / model downloads.
+
+Example:
+  python token_lengths.py --configs f2cpp --workers 16 --out ../data/token_lengths
+"""
+import argparse
+import json
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+try:
+    from dialogue_store import iter_records, sample_digest
+    from export_arrow import tokenizer_alias, tokenize_messages
+    from sft_config import CONFIG_ROOT, dataset_files, iter_sft_configs
+    from telemetry import estimate_tokens
+except ImportError:
+    from utils.dialogue_store import iter_records, sample_digest
+    from utils.export_arrow import tokenizer_alias, tokenize_messages
+    from utils.sft_config import CONFIG_ROOT, dataset_files, iter_sft_configs
+    from utils.telemetry import estimate_tokens
+
+APPROX_TOKENIZER = "approx"
+BUCKET_BOUNDS = (512, 1024, 2048, 4096, 8192, 16384, 32768)
+CHUNK_SIZE = 64
+DEFAULT_CACHE = "token_lengths_cache.json"
+
+_worker_tokenizer = None
+
+
+def load_tokenizer(name):
+    if name == APPROX_TOKENIZER:
+        return None
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        raise SystemExit("transformers is required for exact token lengths (or use --approx)")
+    return AutoTokenizer.from_pretrained(name, trust_remote_code=True)
+
+
+def _init_worker(name):
+    global _worker_tokenizer
+    _worker_tokenizer = load_tokenizer(name)
+
+
+def _content_tokens(tokenizer, text) -> int:
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def _char_offset(tokenizer, text, token_offset) -> int:
+    """Character offset of the `token_offset`-th content token."""
+    if tokenizer is None:
+        return min(token_offset * 4, len(text))
+    enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    offsets = enc.get("offset_mapping") or []
+    if token_offset >= len(offsets):
+        return len(text)
+    return offsets[token_offset][0]
+
+
+def cut_point(tokenizer, messages, per_message, total, cutoff) -> Optional[Dict]:
+    """Where a `cutoff`-token truncation lands: message index, role, and whether it splits a code block."""
+    if total <= cutoff:
+        return None
+    overhead = (total - sum(per_message)) / max(len(messages), 1)
+    used = 0.0
+    for i, (m, n) in enumerate(zip(messages, per_message)):
+        if used + overhead + n > cutoff:
+            within = max(int(cutoff - used - overhead), 0)
+            content = m["content"] or ""
+            char = _char_offset(tokenizer, content, within)
+            return {"message": i, "role": m["role"], "mid_code": content.count("```", 0, char) % 2 == 1}
+        used += overhead + n
+    last = messages[-1] if messages else {"role": ""}
+    return {"message": len(messages) - 1, "role": last["role"], "mid_code": False}
+
+
+def _measure_chunk(args):
+    items, cutoffs = args
+    tokenizer = _worker_tokenizer
+    results = {}
+    for digest, messages in items:
+        per_message = [_content_tokens(tokenizer, m["content"] or "") for m in messages]
+        if tokenizer is None:
+            total = sum(per_message) + 4 * len(messages)
+        else:
+            total = len(tokenize_messages(tokenizer, messages))
+        results[digest] = {
+            "total": total,
+            "per_message": per_message,
+            "cut": {str(c): cut_point(tokenizer, messages, per_message, total, c) for c in cutoffs},
+        }
+    return results
+
+
+def measure(tokenizer_name, samples, cutoffs, cache: Dict, workers=1) -> Dict:
+    """Fill `cache` (digest -> stats) for samples missing it or missing one of `cutoffs`."""
+    todo = [(d, msgs) for d, msgs in samples.items()
+            if d not in cache or any(str(c) not in cache[d]["cut"] for c in cutoffs)]
+    if not todo:
+        return cache
+    chunks = [(todo[i:i + CHUNK_SIZE], sorted(cutoffs)) for i in range(0, len(todo), CHUNK_SIZE)]
+    logging.info("[token_lengths] %s: tokenizing %d samples in %d chunks", tokenizer_name, len(todo), len(chunks))
+    if workers <= 1:
+        _init_worker(tokenizer_name)
+        for chunk in chunks:
+            cache.update(_measure_chunk(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tokenizer_name,)) as pool:
+            for result in pool.map(_measure_chunk, chunks):
+                cache.update(result)
+    return cache
+
+
+def _quantile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def bucket_of(n_tokens) -> int:
+    return next((b for b in BUCKET_BOUNDS if n_tokens <= b), BUCKET_BOUNDS[-1] * 2)
+
+
+def _write_filtered(records, stats, cutoff, out_dir, dataset) -> Dict[str, int]:
+    os.makedirs(os.path.join(out_dir, "buckets"), exist_ok=True)
+    bucket_files = {}
+    counts = defaultdict(int)
+    with open(os.path.join(out_dir, f"{dataset}.jsonl"), "w", encoding="utf-8") as kept:
+        for digest, record in records:
+            n = stats[digest]["total"]
+            if n > cutoff:
+                continue
+            line = json.dumps({**record, "n_tokens": n}, ensure_ascii=False) + "\n"
+            kept.write(line)
+            b = bucket_of(n)
+            if b not in bucket_files:
+                bucket_files[b] = open(os.path.join(out_dir, "buckets", f"{dataset}.le{b}.jsonl"), "w", encoding="utf-8")
+            bucket_files[b].write(line)
+            counts[b] += 1
+    for f in bucket_files.values():
+        f.close()
+    return {str(b): counts[b] for b in sorted(counts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token lengths, truncation report and cutoff-filtered datasets.")
+    parser.add_argument("--config-root", default=CONFIG_ROOT)
+    parser.add_argument("--configs", default="f2cpp", help="sub-directory / glob prefix under the config root")
+    parser.add_argument("--dataset-file", action="append", default=[], metavar="NAME=PATH",
+                        help="override a dataset name -> file mapping (repeatable)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--approx", action="store_true", help="use the ~4 chars/token estimate for every model")
+    parser.add_argument("--cache", default=None, help=f"length cache (default: <out>/{DEFAULT_CACHE})")
+    parser.add_argument("--out", default="token_lengths")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    overrides = dict(kv.split("=", 1) for kv in args.dataset_file)
+    configs = list(iter_sft_configs(args.config_root, f"{args.configs}/**/*.yaml"))
+    os.makedirs(args.out, exist_ok=True)
+    cache_path = args.cache or os.path.join(args.out, DEFAULT_CACHE)
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+
+    # Group work per tokenizer so every model tokenizes each dataset once
+    plan = defaultdict(lambda: {"cutoffs": set(), "datasets": {}})
+    for rel, config in configs:
+        model = APPROX_TOKENIZER if args.approx else config.get("model_name_or_path")
+        entry = plan[model]
+        entry["cutoffs"].add(int(config.get("cutoff_len") or 0))
+        entry["datasets"].update(dataset_files(config, overrides))
+
+    loaded: Dict[str, List] = {}
+    for model, entry in plan.items():
+        alias = tokenizer_alias(model)
+        samples = {}
+        for name, path in entry["datasets"].items():
+            if not path or not os.path.exists(path):
+                continue
+            if path not in loaded:
+                loaded[path] = [(sample_digest(r["messages"]), r) for r in iter_records(path)]
+            samples.update({d: r["messages"] for d, r in loaded[path]})
+        cache[alias] = measure(model, samples, entry["cutoffs"], cache.get(alias, {}), args.workers)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+
+    report = []
+    written = {}
+    for rel, config in configs:
+        model = APPROX_TOKENIZER if args.approx else config.get("model_name_or_path")
+        alias = tokenizer_alias(model)
+        cutoff = int(config.get("cutoff_len") or 0)
+        config_report = {"config": rel, "model": model, "cutoff_len": cutoff, "datasets": {}}
+        for name, path in dataset_files(config, overrides).items():
+            if not path or path not in loaded:
+                config_report["datasets"][name] = {"missing": path}
+                continue
+            stats = cache[alias]
+            lengths = sorted(stats[d]["total"] for d, _ in loaded[path])
+            cuts = [stats[d]["cut"].get(str(cutoff)) for d, _ in loaded[path]]
+            truncated = [c for c in cuts if c]
+            out_dir = os.path.join(args.out, alias, f"cutoff{cutoff}")
+            key = (out_dir, name)
+            if key not in written:
+                written[key] = _write_filtered(loaded[path], stats, cutoff, out_dir, name)
+            config_report["datasets"][name] = {
+                "samples": len(lengths),
+                "truncated": len(truncated),
+                "truncated_pct": round(100.0 * len(truncated) / max(len(lengths), 1), 2),
+                "truncated_mid_code": sum(c["mid_code"] for c in truncated),
+                "truncated_in_assistant": sum(c["role"] == "assistant" for c in truncated),
+                "tokens": {"p50": _quantile(lengths, 0.5), "p95": _quantile(lengths, 0.95),
+                           "max": lengths[-1] if lengths else 0},
+                "kept_buckets": written[key],
+                "filtered_file": os.path.join(out_dir, f"{name}.jsonl"),
+            }
+        report.append(config_report)
+        for name, r in config_report["datasets"].items():
+            if "samples" in r:
+                print(f"{rel} [{name}]: {r['truncated']}/{r['samples']} over {cutoff} tokens "
+                      f"({r['truncated_mid_code']} cut inside a code block)")
+
+    with open(os.path.join(args.out, "truncation_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+Compile-and-run helpers for the Fortran baseline and its C++ translation (gfortran / g++).
+
+Both helpers take a sandbox folder, write the sources there, compile with the flags of a
+COMPILE_PROFILES entry and run the binaries with a timeout. They are plain functions without
+pipeline state so that executor.py can run them in worker processes or on build nodes.
+
+Compiles go through a BuildCache shared by all sandboxes ($F2C_BUILD_CACHE, "off" disables):
+  binaries    keyed by (language, compiler version, flags, source). An unchanged program - above
+              all the frozen Fortran baseline that Phase B re-runs every turn - is compiled once.
+  g++ PCH     programs whose source starts with a block of #include <...> lines get a precompiled
+              header for exactly that include list and profile, built once the same list has been
+              seen PCH_MIN_USES times and then passed with -include. The header holds the program's
+              own includes in its own order, so the translation unit means the same thing.
+gfortran has no precompiled headers and its intrinsic modules (omp_lib, iso_fortran_env) ship
+precompiled, so the Fortran side gains from the binary cache only.
+
+probe_fortran re-runs the baseline under several OMP_NUM_THREADS values (a binary-cache hit, so
+runs only); output_compare.VolatileMask.detect turns those outputs into the fields to mask.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Optional, Tuple
+
+TIMEOUT_LIMIT = 60  # timeout limit in seconds
+BUILD_CACHE_ENV = "F2C_BUILD_CACHE"
+DEFAULT_BUILD_CACHE = os.path.join(tempfile.gettempdir(), "f2c_build_cache")
+PCH_MIN_USES = 2
+PCH_HEADER = "f2c_pch.h"
+COMPILERS = {"fortran": "/usr/bin/gfortran", "cpp": "g++"}
+PROBE_THREADS = (1, 2)  # OMP_NUM_THREADS of the extra baseline runs used to find volatile output
+_INCLUDE_RE = re.compile(r"^\s*#\s*include\s*<([^>]+)>\s*(?://.*)?$")
+
+# Compiler flag profiles: name -> (gfortran flags, g++ flags)
+COMPILE_PROFILES = {
+    "default": ("-fopenmp", "-fopenmp"),
+    "O2": ("-fopenmp -O2", "-fopenmp -O2"),
+    "O3": ("-fopenmp -O3", "-fopenmp -O3"),
+}
+
+def _elapsed(timings, key, start):
+    """Store seconds since `start` under `key` when the caller asked for timings."""
+    if timings is not None:
+        timings[key] = time.perf_counter() - start
+
+
+@lru_cache(maxsize=None)
+def _compiler_version(lang) -> str:
+    try:
+        return subprocess.run([COMPILERS[lang], "-dumpfullversion"], capture_output=True, text=True,
+                              timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def leading_includes(source) -> Tuple[str, ...]:
+    """System headers of the #include <...> block the program starts with (blank lines and // comments allowed)."""
+    includes = []
+    for line in (source or "").splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("//"):
+            continue
+        m = _INCLUDE_RE.match(line)
+        if m is None:
+            break
+        includes.append(m.group(1).strip())
+    return tuple(includes)
+
+
+def _replace_file(src, dst):
+    """Copy `src` to `dst` atomically (readers never see a partial file)."""
+    tmp_path = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copy2(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+class BuildCache:
+    """Content-addressed binaries and g++ precompiled headers under one directory."""
+
+    def __init__(self, root, pch_min_uses=PCH_MIN_USES):
+        self.root = root
+        self.pch_min_uses = pch_min_uses
+        self.stats = Counter()
+        self._pch_seen = Counter()
+        self._lock = threading.Lock()
+
+    def key(self, lang, flags, source) -> str:
+        h = hashlib.sha256()
+        for part in (lang, _compiler_version(lang), flags, source):
+            h.update(part.encode("utf-8", "replace") + b"\0")
+        return h.hexdigest()
+
+    def _binary_paths(self, key):
+        folder = os.path.join(self.root, "bin", key[:2])
+        return os.path.join(folder, key), os.path.join(folder, key + ".json")
+
+    def fetch(self, key, out_path) -> Optional[Tuple[str, str]]:
+        """(compile stdout, stderr) and the binary copied to `out_path` on a hit, else None."""
+        binary, meta_path = self._binary_paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            _replace_file(binary, out_path)
+        except (OSError, ValueError):
+            self.stats["binary_miss"] += 1
+            return None
+        self.stats["binary_hit"] += 1
+        return meta["stdout"], meta["stderr"]
+
+    def store(self, key, out_path, stdout, stderr):
+        binary, meta_path = self._binary_paths(key)
+        os.makedirs(os.path.dirname(binary), exist_ok=True)
+        _replace_file(out_path, binary)
+        tmp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"stdout": stdout, "stderr": stderr}, f)
+        os.replace(tmp_path, meta_path)
+
+    def pch_flags(self, flags, source) -> str:
+        """' -include <header>' when a PCH for the program's include block is (or now gets) built."""
+        includes = leading_includes(source)
+        if not includes:
+            return ""
+        key = hashlib.sha256("\0".join((_compiler_version("cpp"), flags) + includes).encode("utf-8")).hexdigest()[:32]
+        folder = os.path.join(self.root, "pch", key)
+        header = os.path.join(folder, PCH_HEADER)
+        if os.path.exists(header + ".gch"):
+            self.stats["pch_hit"] += 1
+            return f" -include {header}"
+        if os.path.exists(os.path.join(folder, "failed")):
+            return ""
+        with self._lock:
+            self._pch_seen[key] += 1
+            if self._pch_seen[key] < self.pch_min_uses:
+                return ""
+        return f" -include {header}" if self._build_pch(folder, header, flags, includes) else ""
+
+    def _build_pch(self, folder, header, flags, includes) -> bool:
+        os.makedirs(folder, exist_ok=True)
+        suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(f"{header}.{suffix}", "w", encoding="utf-8") as f:
+            f.write("".join(f"#include <{name}>\n" for name in includes))
+        os.replace(f"{header}.{suffix}", header)
+        gch_tmp = f"{header}.gch.{suffix}"
+        try:
+            process = subprocess.run(f"{COMPILERS['cpp']} {flags} -x c++-header {header} -o {gch_tmp}", shell=True,
+                                     capture_output=True, timeout=4 * TIMEOUT_LIMIT)
+        except subprocess.TimeoutExpired:
+            process = None
+        if process is None or process.returncode != 0:
+            # Never retried: programs with this include block keep compiling without a PCH
+            open(os.path.join(folder, "failed"), "w").close()
+            logging.warning("PCH build failed for %s", ", ".join(includes))
+            return False
+        os.replace(gch_tmp, header + ".gch")
+        self.stats["pch_built"] += 1
+        return True
+
+
+_build_caches = {}
+_build_caches_lock = threading.Lock()
+
+
+def default_build_cache() -> Optional[BuildCache]:
+    """Cache at $F2C_BUILD_CACHE (default: <tmp>/f2c_build_cache); None when the variable is 'off'."""
+    root = os.getenv(BUILD_CACHE_ENV) or DEFAULT_BUILD_CACHE
+    if root.lower() in ("off", "none", "0"):
+        return None
+    with _build_caches_lock:
+        cache = _build_caches.get(root)
+        if cache is None:
+            cache = _build_caches[root] = BuildCache(root)
+        return cache
+
+
+def _compile(lang, source, src_path, out_path, flags, timeout_seconds, timings, module_dir=None):
+    """
+    Compile `source` (already written to `src_path`) into `out_path`; returns (stdout, stderr, ok).
+    A build-cache hit copies the stored binary instead and records no compile time.
+    """
+    cache = default_build_cache()
+    key = cache.key(lang, flags, source) if cache is not None else None
+    if cache is not None:
+        hit = cache.fetch(key, out_path)
+        if hit is not None:
+            return hit[0], hit[1], True
+    # A PCH built on the way counts as compile time of the program that triggered it
+    start = time.perf_counter()
+    if lang == "fortran":
+        cmd = f'{COMPILERS["fortran"]} {flags} -J {module_dir} -o {out_path} {src_path}'
+    else:
+        pch = cache.pch_flags(flags, source) if cache is not None else ""
+        cmd = f'{COMPILERS["cpp"]} {flags}{pch} {src_path} -o {out_path}'
+    process = subprocess.run(cmd, shell=True, capture_output=True, timeout=timeout_seconds)
+    _elapsed(timings, f'{lang}_compile', start)
+    stdout = process.stdout.decode('utf-8', 'replace')
+    stderr = process.stderr.decode('utf-8', 'replace')
+    ok = process.returncode == 0
+    if ok and cache is not None:
+        cache.store(key, out_path, stdout, stderr)
+    return stdout, stderr, ok
+
+def build_program(lang, source, folder, profile="default", timeout_seconds=TIMEOUT_LIMIT, timings=None):
+    """
+    Compile one program ('fortran' or 'cpp') into `folder` with a COMPILE_PROFILES entry.
+    Returns (stdout, stderr, ok, binary path); used by callers that run the binary themselves.
+    """
+    os.makedirs(folder, exist_ok=True)
+    src_path = os.path.join(folder, 'test.f90' if lang == 'fortran' else 'test.cpp')
+    with open(src_path, 'w') as file:
+        file.write(source)
+    fortran_flags, cpp_flags = COMPILE_PROFILES[profile]
+    binary = os.path.join(folder, f'test_{lang}_{profile}')
+    if lang == 'fortran':
+        stdout, stderr, ok = _compile('fortran', source, src_path, binary, fortran_flags, timeout_seconds, timings,
+                                      module_dir=folder)
+        for file in glob.glob(f'{folder}/*.mod'):
+            os.remove(file)
+    else:
+        stdout, stderr, ok = _compile('cpp', source, src_path, binary, cpp_flags, timeout_seconds, timings)
+    return stdout, stderr, ok, binary
+
+
+def run_fortran_only(fortran_folder, fortran_code_exe, timeout_seconds=TIMEOUT_LIMIT, timings=None, profile="default"):
+    """
+    Minimal helper: compile & run ONLY the Fortran program used as golden baseline.
+    If `timings` is a dict, it receives 'fortran_compile' / 'fortran_run' wall times in seconds.
+    """
+    os.makedirs(fortran_folder, exist_ok=True)
+    fortran_file_path = os.path.join(fortran_folder, 'test.f90')
+    with open(fortran_file_path, 'w') as file:
+        file.write(fortran_code_exe)
+
+    fortran_flags, _ = COMPILE_PROFILES[profile]
+    fortran_stdout, fortran_stderr, compiled = _compile('fortran', fortran_code_exe, fortran_file_path,
+                                                        f'{fortran_folder}/test_fortran', fortran_flags,
+                                                        timeout_seconds, timings, module_dir=fortran_folder)
+    if not compiled:
+        return (fortran_stdout, fortran_stderr, False)
+
+    fortran_run_cmd = os.path.abspath(f'{fortran_folder}/test_fortran')
+    start = time.perf_counter()
+    try:
+        fortran_run_process = subprocess.run(fortran_run_cmd, shell=True, capture_output=True, timeout=timeout_seconds,
+                                             cwd=fortran_folder)
+        fortran_stdout = fortran_run_process.stdout.decode('utf-8', 'replace')
+        fortran_stderr = fortran_run_process.stderr.decode('utf-8', 'replace')
+        return (fortran_stdout, fortran_stderr, fortran_run_process.returncode == 0)
+    except subprocess.TimeoutExpired as e:
+        # Kill the process if it's still running
+        if hasattr(e, 'cmd') and e.cmd:
+            try:
+                import psutil
+                for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+                    try:
+                        if proc.info['cmdline'] and any('test_fortran' in str(cmd) for cmd in proc.info['cmdline']):
+                            proc.kill()
+                            logging.warning(f"Killed hanging Fortran process: {proc.info['pid']}")
+                    except (psutil.NoSuchProcess, psutil.AccessDenied):
+                        pass
+            except ImportError:
+                logging.warning("psutil not available, cannot kill hanging processes")
+        return ("", "It seems that the program hangs! Fortran execution timed out.", False)
+    finally:
+        _elapsed(timings, 'fortran_run', start)
+        # Clean up .mod files
+        mod_files = glob.glob(f'{fortran_folder}/*.mod')
+        for file in mod_files:
+            os.remove(file)
+
+
+def run_cpp_only(cpp_folder, cpp_code_exe, timeout_seconds=TIMEOUT_LIMIT, timings=None, profile="default"):
+    """
+    Compile & run ONLY a C++ program (candidates checked against an already known Fortran output).
+    If `timings` is a dict, it receives 'cpp_compile' / 'cpp_run' wall times; 'cpp_run' only when it compiled.
+    """
+    cpp_stdout, cpp_stderr, compiled, binary = build_program('cpp', cpp_code_exe, cpp_folder, profile=profile,
+                                                             timeout_seconds=timeout_seconds, timings=timings)
+    if not compiled:
+        return (cpp_stdout, cpp_stderr, False)
+    start = time.perf_counter()
+    try:
+        cpp_run_process = subprocess.run([os.path.abspath(binary)], capture_output=True, timeout=timeout_seconds,
+                                         cwd=cpp_folder)
+        return (cpp_run_process.stdout.decode('utf-8', 'replace'), cpp_run_process.stderr.decode('utf-8', 'replace'),
+                cpp_run_process.returncode == 0)
+    except subprocess.TimeoutExpired:
+        return ("", "It seems that the program hangs! C++ execution timed out.", False)
+    finally:
+        _elapsed(timings, 'cpp_run', start)
+
+
+def probe_fortran(fortran_folder, fortran_code_exe, thread_counts=PROBE_THREADS, timeout_seconds=TIMEOUT_LIMIT,
+                  timings=None, profile="default"):
+    """
+    Run the Fortran program once per OMP_NUM_THREADS value in `thread_counts`.
+    Returns the stdout of every run that exited cleanly; 'fortran_run' in `timings` is their total.
+    """
+    os.makedirs(fortran_folder, exist_ok=True)
+    fortran_file_path = os.path.join(fortran_folder, 'test.f90')
+    with open(fortran_file_path, 'w') as file:
+        file.write(fortran_code_exe)
+
+    fortran_flags, _ = COMPILE_PROFILES[profile]
+    binary = f'{fortran_folder}/test_fortran'
+    _, _, compiled = _compile('fortran', fortran_code_exe, fortran_file_path, binary, fortran_flags,
+                              timeout_seconds, timings, module_dir=fortran_folder)
+    outputs = []
+    start = time.perf_counter()
+    try:
+        if not compiled:
+            return outputs
+        for threads in thread_counts:
+            try:
+                process = subprocess.run([os.path.abspath(binary)], capture_output=True, timeout=timeout_seconds,
+                                         env=dict(os.environ, OMP_NUM_THREADS=str(threads)), cwd=fortran_folder)
+            except subprocess.TimeoutExpired:
+                continue
+            if process.returncode == 0:
+                outputs.append(process.stdout.decode('utf-8', 'replace'))
+        return outputs
+    finally:
+        if compiled:
+            _elapsed(timings, 'fortran_run', start)
+        for file in glob.glob(f'{fortran_folder}/*.mod'):
+            os.remove(file)
+
+
+def run_codes(fortran_folder, f_code_exe, cpp_folder, c_code_exe, timeout_seconds=TIMEOUT_LIMIT, timings=None, profile="default"):
+    """
+    Compiles and runs Fortran and C++ code and captures their output.
+    If `timings` is a dict, it receives '{fortran,cpp}_{compile,run}' wall times in seconds.
+    """
+    fortran_file_path = os.path.join(fortran_folder, 'test.f90')
+    with open(fortran_file_path, 'w') as file:
+        file.write(f_code_exe)
+
+    cpp_file_path = os.path.join(cpp_folder, 'test.cpp')
+    with open(cpp_file_path, 'w') as file:
+        file.write(c_code_exe)
+
+    fortran_flags, cpp_flags = COMPILE_PROFILES[profile]
+    fortran_stdout, fortran_stderr, compiled = _compile('fortran', f_code_exe, fortran_file_path, f'{fortran_folder}/test',
+                                                        fortran_flags, timeout_seconds, timings, module_dir=fortran_folder)
+    if not compiled:
+        fortran_p_f = False
+    else:
+        fortran_p_f = True  
+        fortran_run_cmd = os.path.abspath(f'{fortran_folder}/test')
+        start = time.perf_counter()
+        try:
+            fortran_run_process = subprocess.run(fortran_run_cmd, 
+                                                    shell=True, 
+                                                    capture_output=True,
+                                                    timeout=timeout_seconds,
+                                                    cwd=fortran_folder)
+            fortran_stdout = fortran_run_process.stdout.decode('utf-8', 'replace')
+            fortran_stderr = fortran_run_process.stderr.decode('utf-8', 'replace')
+        except subprocess.TimeoutExpired:
+            fortran_p_f = False
+            fortran_stdout = ''
+            fortran_stderr = 'It seems that the program hangs. Fortran execution timed out.'
+        _elapsed(timings, 'fortran_run', start)
+        # delete generated .mod files
+        mod_files = glob.glob(f'{fortran_folder}/*.mod')
+        for file in mod_files:
+            os.remove(file)
+
+    cpp_stdout, cpp_stderr, compiled = _compile('cpp', c_code_exe, cpp_file_path, f'{cpp_folder}/test', cpp_flags,
+                                                timeout_seconds, timings)
+    if not compiled:
+        cpp_p_f = False
+    else:
+        cpp_p_f = True  
+        cpp_run_cmd = os.path.abspath(f'{cpp_folder}/test')
+        start = time.perf_counter()
+        try:
+            cpp_run_process = subprocess.run(cpp_run_cmd, 
+                                                shell=True, 
+                                                capture_output=True,
+                                                timeout=timeout_seconds,
+                                                cwd=cpp_folder)
+            cpp_stdout = cpp_run_process.stdout.decode('utf-8', 'replace')
+            cpp_stderr = cpp_run_process.stderr.decode('utf-8', 'replace')
+        except subprocess.TimeoutExpired as e:
+            # Kill the process if it's still running
+            try:
+                import psutil
+                for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+                    try:
+                        if proc.info['cmdline'] and any('test' in str(cmd) and 'cpp_' in str(cmd) for cmd in proc.info['cmdline']):
+                            proc.kill()
+                            logging.warning(f"Killed hanging C++ process: {proc.info['pid']}")
+                    except (psutil.NoSuchProcess, psutil.AccessDenied):
+                        pass
+            except ImportError:
+                logging.warning("psutil not available, cannot kill hanging processes")
+            cpp_p_f = False
+            cpp_stdout = ''
+            cpp_stderr = 'It seems that the program hangs! C++ execution timed out.'
+        _elapsed(timings, 'cpp_run', start)
+    return fortran_stdout, fortran_stderr, fortran_p_f, cpp_stdout, cpp_stderr, cpp_p_f